@@ -2,28 +2,34 @@ import openai
 import json
 import logging
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-from prompts import (
-    DIALOGUE_PROMPT,
-    SUMMARY_PROMPT,
-    STRATEGY_PROMPT,
-    INITIAL_COORDINATION_PROMPT,
-    CONTINUE_COORDINATION_PROMPT,
-    NOTIFICATION_PROMPT
-)
+from prompts import get_template
 import backoff  # 添加 backoff 库用于重试
 import urllib3
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import certifi
-from models import mock_users, mock_conversations  # 从 models.py 导入
+from models import mock_users  # 从 models.py 导入
+from llm_cache import LLMCache, SQLiteCacheBackend, make_cache_key
+from time_parser import parse_time_expression, parse_duration, resolve_time_range
+from availability import build_busy_index, find_common_slots, format_slots
+from memory import ConversationMemory, estimate_tokens
+from metrics import metrics_registry
+from mock_llm import create_mock_client
+from structured_output import parse_structured, StructuredOutputError
+from llm_scheduler import RequestScheduler, SchedulerTimeout, priority_for
+from llm_router import LLMRouter, build_endpoints, tier_for
+from streaming import MarkerStreamFilter, strip_markers
+from coordination_state import CoordinationStateMachine, classify_response, CONFIRMED, CONFLICT, FINALIZED
+from slot_filling import DialogueSlots
+from speculation import extract_confirmation_slots
 
-# 设置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 获取项目根目录
@@ -43,39 +49,214 @@ class LLMService:
         load_dotenv(dotenv_path=BASE_DIR / '.env')
         
         # 根据服务类型选择配置
-        if service_type == "openai":
+        if service_type == "mock":
+            # 离线模拟后端，不访问网络，用于压测和本地开发
+            self.api_key = None
+            self.base_url = None
+            self.chat_model = os.getenv('MOCK_CHAT_MODEL', 'mock-chat')
+            self.client = create_mock_client()
+        elif service_type == "openai":
             self.api_key = os.getenv('OPENAI_API_KEY')
-            self.base_url = "https://api.openai.com/v1"
+            self.base_url = os.getenv('OPENAI_BASE_URL', "https://api.openai.com/v1")
             self.chat_model = os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo')
         else:
             self.api_key = os.getenv('DEEPSEEK_API_KEY')
-            self.base_url = "https://api.deepseek.com/v1"
+            self.base_url = os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com/v1")
             self.chat_model = os.getenv('DEEPSEEK_CHAT_MODEL', 'deepseek-chat')
         
         # 初始化客户端
-        self.client = openai.OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        if service_type != "mock":
+            self.client = openai.OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url
+            )
         self.logger.info(f"{self.service_type.upper()} API Key loaded: {'*' * 5}{self.api_key[-4:] if self.api_key else 'NOT FOUND'}")
+        
+        # 初始化响应缓存，配置 LLM_CACHE_DB 时启用 SQLite 落盘
+        cache_db = os.getenv('LLM_CACHE_DB')
+        self.cache = LLMCache(
+            max_entries=int(os.getenv('LLM_CACHE_SIZE', 1000)),
+            ttl=int(os.getenv('LLM_CACHE_TTL', 3600)),
+            backend=SQLiteCacheBackend(cache_db, int(os.getenv('LLM_CACHE_DB_SIZE', 10000))) if cache_db else None
+        )
+        
+        # 初始化多服务商路由：当前服务为首选，其他配置了 API Key 的服务商作为备用，
+        # LLM_HEDGE_AFTER 秒（0 表示不对冲）内未返回时向下一个端点再发一份
+        self.router = LLMRouter(
+            build_endpoints(self.service_type, self.client, self.chat_model),
+            hedge_after=float(os.getenv('LLM_HEDGE_AFTER', 0))
+        )
+        
+        # 初始化请求调度器：RPM/TPM 限速（0 表示不限）、并发上限、优先级排队和相同请求合并
+        self.scheduler = RequestScheduler(
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+            rpm=int(os.getenv('LLM_RPM', 0)),
+            tpm=int(os.getenv('LLM_TPM', 0)),
+            queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 60))
+        )
 
     def get_model_name(self):
         """根据服务类型和模型类型返回对应的模型名称"""
         return self.chat_model
 
-    def create_completion(self, messages, **kwargs):
-        """统一的API调用接口"""
+    def supports_json_mode(self):
+        """OpenAI 和 DeepSeek 都支持 response_format=json_object，可通过 LLM_JSON_MODE=0 关闭"""
+        return os.getenv('LLM_JSON_MODE', '1') == '1'
+
+    def create_completion(self, messages, use_cache=False, labels=None, **kwargs):
+        """
+        统一的API调用接口，use_cache=True 时相同请求直接返回缓存结果
+        labels 包含 agent、template、meeting_id，用于记录调用指标
+        """
+        labels = labels or {}
+        started = time.time()
+        tier = tier_for(labels.get('template'))
         try:
-            response = self.client.chat.completions.create(
-                model=self.get_model_name(),
-                messages=messages,
-                **kwargs
+            # 缓存键同时用于合并进行中的相同请求，按模型层级区分
+            cache_key = make_cache_key(
+                f"{self.get_model_name()}:{tier}",
+                messages,
+                kwargs.get('temperature'),
+                kwargs.get('max_tokens')
             )
-            return response.choices[0].message.content
+            if use_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self._record_metrics(labels, started, cache_hit=True)
+                    return cached
+            
+            usage = {}
+            
+            def request():
+                response, _ = self.router.complete(messages, tier=tier, **kwargs)
+                content = response.choices[0].message.content
+                response_usage = getattr(response, 'usage', None)
+                usage['prompt_tokens'] = getattr(response_usage, 'prompt_tokens', None) or self._estimate_prompt_tokens(messages)
+                usage['completion_tokens'] = getattr(response_usage, 'completion_tokens', None) or estimate_tokens(content)
+                usage['cached_prompt_tokens'] = self._cached_prompt_tokens(response_usage)
+                return content, usage['prompt_tokens'] + usage['completion_tokens']
+            
+            content, coalesced = self._schedule(request, messages, labels, kwargs, key=cache_key)
+            if coalesced:
+                # 与进行中的相同请求合并，没有产生新的调用
+                self._record_metrics(labels, started, coalesced=True)
+                return content
+            if use_cache and content:
+                self.cache.set(cache_key, content)
+            self._record_metrics(labels, started, **usage)
+            return content
         except Exception as e:
+            self._record_metrics(labels, started, error=True)
+            self._check_rate_limit(e)
             self.logger.error(f"API调用失败: {str(e)}")
             raise
 
+    def stream_completion(self, messages, labels=None, **kwargs):
+        """流式API调用接口，逐段返回增量文本"""
+        labels = labels or {}
+        started = time.time()
+        first_token_at = None
+        usage = None
+        chunks = []
+        reserved = self._reserved_tokens(messages, kwargs)
+        try:
+            # 流式请求在整个输出期间占用并发名额，不参与合并
+            self.scheduler.acquire(priority_for(labels.get('template')), reserved)
+        except Exception:
+            self._record_metrics(labels, started, error=True)
+            raise
+        try:
+            stream, _ = self.router.open_stream(
+                messages,
+                tier=tier_for(labels.get('template')),
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                    chunks.append(delta)
+                    yield delta
+            self._record_metrics(
+                labels,
+                started,
+                prompt_tokens=getattr(usage, 'prompt_tokens', None) or self._estimate_prompt_tokens(messages),
+                completion_tokens=getattr(usage, 'completion_tokens', None) or estimate_tokens(''.join(chunks)),
+                cached_prompt_tokens=self._cached_prompt_tokens(usage),
+                ttft=first_token_at - started if first_token_at else None
+            )
+        except Exception as e:
+            self._record_metrics(labels, started, error=True)
+            self._check_rate_limit(e)
+            self.logger.error(f"流式API调用失败: {str(e)}")
+            raise
+        finally:
+            self.scheduler.release(reserved, self._estimate_prompt_tokens(messages) + estimate_tokens(''.join(chunks)))
+
+    def _schedule(self, request, messages, labels, kwargs, key=None):
+        """通过调度器执行请求，返回 (结果, 是否与进行中的相同请求合并)"""
+        return self.scheduler.run(
+            request,
+            priority=priority_for(labels.get('template')),
+            tokens=self._reserved_tokens(messages, kwargs),
+            key=key
+        )
+
+    def _reserved_tokens(self, messages, kwargs):
+        """TPM 限速按输入估算加上 max_tokens 预留额度，调用结束后按实际用量退还"""
+        return self._estimate_prompt_tokens(messages) + (kwargs.get('max_tokens') or 0)
+
+    def _check_rate_limit(self, error):
+        """服务端返回 429 时按 Retry-After（默认 5 秒）暂停调度"""
+        if getattr(error, 'status_code', None) != 429:
+            return
+        retry_after = 5.0
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('retry-after', retry_after))
+        except (TypeError, ValueError):
+            pass
+        self.scheduler.pause(retry_after)
+
+    def _cached_prompt_tokens(self, usage):
+        """命中服务商提示词缓存的输入 token 数（OpenAI: prompt_tokens_details.cached_tokens，DeepSeek: prompt_cache_hit_tokens）"""
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return getattr(details, 'cached_tokens', None) or getattr(usage, 'prompt_cache_hit_tokens', None) or 0
+
+    def _estimate_prompt_tokens(self, messages):
+        return sum(estimate_tokens(msg.get('content', '')) for msg in messages)
+
+    def _record_metrics(self, labels, started, **values):
+        metrics_registry.record_call(
+            labels.get('agent', 'unknown'),
+            labels.get('template', 'OTHER'),
+            wall_time=time.time() - started,
+            meeting_id=labels.get('meeting_id'),
+            **values
+        )
+
+# 本地时间解析的最低置信度，低于该值时交给 LLM 提取
+TIME_PARSER_MIN_CONFIDENCE = float(os.getenv('TIME_PARSER_MIN_CONFIDENCE', 0.75))
+
+# 协调策略：sequential（逐个确认）或 parallel（主协调人确定时间后并发联系其他参与者）
+COORDINATION_STRATEGY = os.getenv('COORDINATION_STRATEGY', 'sequential')
+
+# 并发生成协调消息的最大并发数
+FAN_OUT_CONCURRENCY = int(os.getenv('FAN_OUT_CONCURRENCY', 4))
+
+# 对话记忆的 token 预算和保留原文的轮数
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', 2000))
+MEMORY_KEEP_TURNS = int(os.getenv('MEMORY_KEEP_TURNS', 6))
+
+# 初始对话中能由本地规则理解的回合（参与者、主题明确）不调用 LLM
+LOCAL_SLOT_FILLING = os.getenv('LOCAL_SLOT_FILLING', '1') == '1'
+
 # 创建全局 LLM 服务实例
 llm_service = LLMService(service_type=os.getenv('LLM_SERVICE', 'openai'))
 
@@ -85,15 +266,20 @@ def verify_environment():
         # 获取当前服务类型
         current_service = os.getenv('LLM_SERVICE', 'openai')
         
+        # 模拟后端不需要 API key，也不发起真实调用
+        if current_service == 'mock':
+            logger.info("MOCK LLM service enabled, skipping API key verification")
+            return True
+        
         # 根据服务类型选择模型名称
         if current_service == 'openai':
             model_name = os.getenv('OPENAI_CHAT_MODEL', 'gpt-3.5-turbo')
             api_key = os.getenv('OPENAI_API_KEY')
-            base_url = "https://api.openai.com/v1"
+            base_url = os.getenv('OPENAI_BASE_URL', "https://api.openai.com/v1")
         else:
             model_name = os.getenv('DEEPSEEK_CHAT_MODEL', 'deepseek-chat')
             api_key = os.getenv('DEEPSEEK_API_KEY')
-            base_url = "https://api.deepseek.com/v1"
+            base_url = os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com/v1")
 
         # 测试 API key 是否有效
         response = llm_service.client.chat.completions.create(
@@ -118,6 +304,8 @@ class BaseAgent:
         self.retry_delay = 1
         self.context = {}
         self.llm_service = llm_service
+        self.memory = ConversationMemory(MEMORY_TOKEN_BUDGET, MEMORY_KEEP_TURNS)
+        self.meeting_id = None  # 用于按会议统计 LLM 成本
 
     def update_context(self, key, value):
         self.context[key] = value
@@ -125,8 +313,33 @@ class BaseAgent:
     def get_context(self, key):
         return self.context.get(key)
 
-    def call_openai_api(self, messages, max_retries=3):
-        """统一的 API 调用函数"""
+    def export_state(self):
+        """导出可序列化的会话状态，用于在多个实例之间共享"""
+        return {
+            'conversation_history': list(self.conversation_history),
+            'context': dict(self.context),
+            'memory': self.memory.export_state()
+        }
+
+    def import_state(self, state):
+        """载入 export_state 导出的状态"""
+        self.conversation_history = list(state.get('conversation_history', []))
+        self.context = dict(state.get('context', {}))
+        self.memory.import_state(state.get('memory', {}))
+
+    def _metric_labels(self, template):
+        return {
+            'agent': type(self).__name__,
+            'template': template,
+            'meeting_id': self.meeting_id
+        }
+
+    def call_openai_api(self, messages, max_retries=3, use_cache=False, template='OTHER', response_format=None):
+        """
+        统一的 API 调用函数，确定性的提示词可传入 use_cache=True 复用缓存
+        template 为提示词模板名称，用于统计各阶段的成本和耗时
+        """
+        extra = {'response_format': response_format} if response_format else {}
         for attempt in range(max_retries):
             try:
                 # 确保最后一条消息是用户消息
@@ -141,19 +354,90 @@ class BaseAgent:
                             "content": "请根据以上内容进行回复"
                         })
 
-                response = self.llm_service.client.chat.completions.create(
-                    model=self.llm_service.get_model_name(),
-                    messages=messages,
+                return self.llm_service.create_completion(
+                    messages,
+                    use_cache=use_cache,
+                    labels=self._metric_labels(template),
                     temperature=0.7,
-                    max_tokens=1000
+                    max_tokens=1000,
+                    **extra
                 )
-                return response.choices[0].message.content
+            except SchedulerTimeout:
+                # 排队超时说明已经过载，重试只会加剧拥塞
+                raise
             except Exception as e:
                 if attempt == max_retries - 1:
                     self.logger.error(f"API 调用失败: {str(e)}")
                     raise
+                metrics_registry.record_retry(type(self).__name__, template)
                 self.logger.warning(f"API 调用失败，正在重试 ({attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)  # 指数退避
+                time.sleep(2 ** attempt + random.random())  # 带随机抖动的指数退避，避免重试同时到达
+
+    def call_structured(self, messages, schema, use_cache=False, template='OTHER'):
+        """
+        调用 LLM 并返回按 schema 校验过的 JSON 结果
+        支持时使用 JSON 模式；输出有误时先本地修复，仍失败才带着错误信息重新询问一次
+        """
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        response_format = {"type": "json_object"} if self.llm_service.supports_json_mode() else None
+        result = self.call_openai_api(messages, use_cache=use_cache, template=template, response_format=response_format)
+        try:
+            return parse_structured(result, schema)
+        except StructuredOutputError as e:
+            self.logger.warning(f"结构化输出校验失败，重新询问: {str(e)}")
+            metrics_registry.record_retry(type(self).__name__, template)
+            repair_messages = [
+                *messages,
+                {"role": "assistant", "content": result},
+                {"role": "user", "content": f"上面的输出有误：{str(e)}。请只返回修正后的 JSON，不要添加任何其他内容。"}
+            ]
+            result = self.call_openai_api(repair_messages, template=template, response_format=response_format)
+            return parse_structured(result, schema)
+
+    def stream_openai_api(self, messages, on_delta, max_retries=3, template='OTHER'):
+        """
+        流式 API 调用函数
+        每收到一段文本就通过 on_delta 推送（已剔除控制标记），返回包含标记的完整回复
+        """
+        for attempt in range(max_retries):
+            marker_filter = MarkerStreamFilter()
+            chunks = []
+            try:
+                if isinstance(messages, str):
+                    messages = [
+                        {"role": "user", "content": messages}
+                    ]
+                elif isinstance(messages, list):
+                    if messages[-1]["role"] != "user":
+                        messages.append({
+                            "role": "user",
+                            "content": "请根据以上内容进行回复"
+                        })
+
+                for delta in self.llm_service.stream_completion(
+                    messages,
+                    labels=self._metric_labels(template),
+                    temperature=0.7,
+                    max_tokens=1000
+                ):
+                    chunks.append(delta)
+                    visible = marker_filter.feed(delta)
+                    if visible:
+                        on_delta(visible)
+
+                remaining = marker_filter.flush()
+                if remaining:
+                    on_delta(remaining)
+                return ''.join(chunks)
+            except Exception as e:
+                # 已经向客户端推送过内容或排队超时时不再重试
+                if chunks or isinstance(e, SchedulerTimeout) or attempt == max_retries - 1:
+                    self.logger.error(f"流式 API 调用失败: {str(e)}")
+                    raise
+                metrics_registry.record_retry(type(self).__name__, template)
+                self.logger.warning(f"流式 API 调用失败，正在重试 ({attempt + 1}/{max_retries})")
+                time.sleep(2 ** attempt + random.random())  # 带随机抖动的指数退避
 
     def add_to_history(self, role, content):
         """添加消息到对话历史"""
@@ -162,61 +446,52 @@ class BaseAgent:
                 "role": role,
                 "content": content
             })
-            self.logger.info(f"添加对话历史 - {role}: {content[:100]}...")
+            self.logger.debug(f"添加对话历史 - {role}: {content[:100]}")
         except Exception as e:
             self.logger.error(f"添加对话历史失败: {str(e)}")
             raise
 
-    def summarize_with_llm(self):
-        """使用大模型总结对话内容"""
+    def compact_history(self):
+        """对话历史超出 token 预算时，把较早的轮次折叠进摘要"""
+        return self.memory.compact(self.conversation_history, self._fold_into_summary)
+
+    def _fold_into_summary(self, previous_summary, messages):
+        """把新折叠的消息合并进已有摘要，只发送新增的轮次"""
+        prompt = get_template('MEMORY_SUMMARY').render(
+            previous_summary=previous_summary or '无',
+            new_messages=self._format_transcript(messages)
+        )
+        return self.call_openai_api(prompt, template='MEMORY_SUMMARY').strip()
+
+    def _format_transcript(self, messages):
+        return "\n".join([
+            f"{'用户' if msg['role'] == 'user' else '助手'}: {msg['content']}"
+            for msg in messages
+        ])
+
+    def _summary_messages(self):
+        """对话总结的消息：静态指令在前，较早摘要和对话内容在后"""
+        return get_template('SUMMARY').render(
+            memory_summary=f"较早对话的摘要：\n{self.memory.summary}\n\n" if self.memory.summary else "",
+            conversation=self._format_transcript(self.conversation_history)
+        )
+
+    def summarize_with_llm(self, messages=None):
+        """使用大模型总结对话内容，messages 为预先取出的对话快照（推测执行时使用）"""
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的对话总结助手。请根据对话内容提取关键信息并生成结构化的总结。"
-                },
-                {
-                    "role": "user",
-                    "content": SUMMARY_PROMPT + "\n\n对话内容：\n" + "\n".join([
-                        f"{'用户' if msg['role'] == 'user' else '助手'}: {msg['content']}"
-                        for msg in self.conversation_history
-                    ])
-                }
-            ]
-            
-            # 调用 API 获取总结
-            response = self.call_openai_api(messages)
-            
-            # 清理可能的 markdown 标记
-            response = response.strip()
-            if response.startswith('```'):
-                response = response.split('\n', 1)[1]
-            if response.endswith('```'):
-                response = response.rsplit('\n', 1)[0]
-            
-            try:
-                # 解析 JSON 响应
-                summary = json.loads(response)
-                self.logger.info(f"对话总结完成: {json.dumps(summary, ensure_ascii=False)}")
-                return summary
-                
-            except json.JSONDecodeError as e:
-                self.logger.error(f"解析总结结果失败: {str(e)}")
-                self.logger.error(f"原始响应: {response}")
-                raise
+            # 调用 API 获取总结（按 schema 校验）
+            summary = self.call_structured(messages or self._summary_messages(), 'summary', template='SUMMARY')
+            self.logger.info(f"对话总结完成: {json.dumps(summary, ensure_ascii=False)}")
+            return summary
                 
         except Exception as e:
             self.logger.error(f"生成对话总结失败: {str(e)}")
             raise
 
     def _get_user_id(self, name):
-        """根据用户名获取用户ID"""
+        """根据用户名获取用户ID，支持"张总"等称呼和错别字"""
         try:
-            # 在 mock_users 中查找匹配的用户
-            for user_id, user_info in mock_users.items():
-                if user_info['name'] == name:
-                    return user_id
-            return None
+            return mock_users.resolve(name)
         except Exception as e:
             self.logger.error(f"获取用户ID失败: {str(e)}")
             return None
@@ -226,12 +501,25 @@ class DialogueAgent(BaseAgent):
     def __init__(self, name):
         super().__init__(name)
         self.conversation_history = []
+        self.slots = DialogueSlots()
+
+    def export_state(self):
+        return {
+            **super().export_state(),
+            'slots': self.slots.export_state()
+        }
+
+    def import_state(self, state):
+        super().import_state(state)
+        self.slots.import_state(state.get('slots', {}))
 
     def start_dialogue(self, message):
         """开始新的对话"""
         try:
             # 清空历史记录
             self.conversation_history = []
+            self.slots = DialogueSlots()
+            self.memory.reset()
             return self.handle_user_request(message)
         except Exception as e:
             self.logger.error(f"开始对话失败: {str(e)}")
@@ -245,8 +533,8 @@ class DialogueAgent(BaseAgent):
             self.logger.error(f"继续对话失败: {str(e)}")
             return "抱歉，处理您的回复时出现错误。"
 
-    def handle_user_request(self, user_input):
-        """处理用户请求"""
+    def handle_user_request(self, user_input, on_delta=None):
+        """处理用户请求，传入 on_delta 时以流式方式推送回复"""
         try:
             # 记录用户输入
             self.conversation_history.append({
@@ -254,21 +542,28 @@ class DialogueAgent(BaseAgent):
                 "content": user_input
             })
             
-            # 构建消息列表
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的会议助手。请使用友好、专业的语气与用户沟通，帮助用户安排会议。"
-                },
-                {
-                    "role": "user",
-                    "content": DIALOGUE_PROMPT
-                },
-                *self.conversation_history
-            ]
-            
-            # 调用 API 获取回复
-            assistant_response = self.call_openai_api(messages)
+            if LOCAL_SLOT_FILLING and self.slots.fill(user_input, mock_users):
+                # 本地规则已理解这一轮，按收集顺序直接回复
+                assistant_response = self.slots.reply()
+                self.logger.info(f"本地槽位填充完成本轮对话: {json.dumps(self.slots.export_state(), ensure_ascii=False)}")
+                if on_delta:
+                    on_delta(strip_markers(assistant_response))
+            else:
+                # 超出预算时折叠较早的轮次，保证每轮的输入长度有上限
+                self.compact_history()
+                
+                # 构建消息列表
+                messages = get_template('DIALOGUE').render([
+                    *self.memory.context_messages(),
+                    *self.conversation_history
+                ])
+                
+                # 调用 API 获取回复
+                if on_delta:
+                    assistant_response = self.stream_openai_api(messages, on_delta, template='DIALOGUE')
+                else:
+                    assistant_response = self.call_openai_api(messages, template='DIALOGUE')
+                self.slots.sync_from_confirmation(extract_confirmation_slots(assistant_response), mock_users)
             
             # 记录助手回复
             self.conversation_history.append({
@@ -279,11 +574,13 @@ class DialogueAgent(BaseAgent):
             if "[DIALOGUE_COMPLETE]" in assistant_response:
                 return {
                     "response": "好的，我来帮您安排会议，稍后会通知相关参会人员。",
+                    "assistant_response": assistant_response,
                     "is_complete": True
                 }
             else:
                 return {
                     "response": assistant_response,
+                    "assistant_response": assistant_response,
                     "is_complete": False
                 }
                 
@@ -291,16 +588,24 @@ class DialogueAgent(BaseAgent):
             self.logger.error(f"处理用户请求失败: {str(e)}")
             raise
 
+    def local_summary(self):
+        """所有回合都由本地规则完成且信息已收集完整时，直接由槽位生成对话总结，否则返回 None"""
+        if self.slots.local_only and self.slots.is_complete():
+            return self.slots.to_summary()
+        return None
+
+    def summarize_with_llm(self, messages=None):
+        """对话总结，可以由槽位生成时不调用 LLM"""
+        summary = self.local_summary() if messages is None else None
+        if summary:
+            self.logger.info(f"使用本地槽位生成对话总结: {json.dumps(summary, ensure_ascii=False)}")
+            return summary
+        return super().summarize_with_llm(messages)
+
     def get_dialogue_summary(self):
         """生成对话总结"""
         try:
-            messages = [
-                {"role": "system", "content": SUMMARY_PROMPT},
-                *self.conversation_history
-            ]
-            
-            summary_response = self.call_openai_api(messages)
-            return json.loads(summary_response)
+            return self.call_structured(self._summary_messages(), 'summary', template='SUMMARY')
             
         except Exception as e:
             self.logger.error(f"生成对话总结失败: {str(e)}")
@@ -312,13 +617,47 @@ class CoordinationAgent(BaseAgent):
         self.coordination_contexts = {}
         self.coordination_tasks = {}
         self.strategy_agent = None  # 将在初始化后设置
+        self._busy_indexes = {}  # user_id -> (日程条数, 忙碌区间索引)
+
+    def export_state(self):
+        return {
+            **super().export_state(),
+            'coordination_contexts': dict(self.coordination_contexts)
+        }
+
+    def import_state(self, state):
+        super().import_state(state)
+        contexts = state.get('coordination_contexts', {})
+        if hasattr(self.coordination_contexts, 'replace_local'):
+            self.coordination_contexts.replace_local(contexts)
+        else:
+            self.coordination_contexts = dict(contexts)
         
-    def start_coordination(self, coordination_task):
-        """开始协调流程"""
+    def start_coordination(self, coordination_task, draft=None):
+        """
+        开始协调流程，draft 为推测执行时预先生成的首条协调消息；
+        参与者日程在生成草稿之后有变化时重新生成
+        """
+        try:
+            if draft is None or draft['schedule_versions'] != self._schedule_versions(draft['participant_ids']):
+                draft = self.prepare_coordination(coordination_task)
+            if not draft:
+                return False
+            return self.commit_coordination(coordination_task, draft)
+            
+        except Exception as e:
+            self.logger.error(f"开始协调失败: {str(e)}")
+            return False
+
+    def _schedule_versions(self, user_ids):
+        """参与者日程的条数，与忙碌索引缓存使用相同的失效判断"""
+        return {user_id: len(mock_users.get(user_id, {}).get('schedule', [])) for user_id in user_ids}
+
+    def prepare_coordination(self, coordination_task):
+        """生成发给主协调人的首条协调消息，不修改协调上下文，返回草稿；找不到主协调人时返回 None"""
         try:
             participants = coordination_task['target_participants']
             params = coordination_task['coordination_params']
-            initial_messages = []  # 存储需要发送的初始消息
             
             # 获取主协调人
             main_coordinator = coordination_task.get('coordination_priority', {}).get('main_coordinator')
@@ -328,7 +667,9 @@ class CoordinationAgent(BaseAgent):
             # 只为主协调人创建初始协调任务
             user_id = self._get_user_id(main_coordinator)
             if not user_id:
-                return False
+                return None
+            participant_ids = [pid for pid in map(self._get_user_id, participants) if pid]
+            schedule_versions = self._schedule_versions(participant_ids)
             
             # 从 JSON 字符串解析参数
             known_info = params['known_info']
@@ -347,6 +688,11 @@ class CoordinationAgent(BaseAgent):
                     'participants': participants_str
                 },
                 'user_schedule': self._get_user_schedule(user_id),
+                'candidate_slots': format_slots(self.propose_slots(
+                    participant_ids,
+                    requirements,
+                    constraints
+                )),
                 'requirements': {
                     'duration': requirements['duration'],
                     'time_range': requirements['time_range'],
@@ -358,71 +704,69 @@ class CoordinationAgent(BaseAgent):
             }
             
             # 使用初始协调提示词
-            coordination_prompt = INITIAL_COORDINATION_PROMPT.format(**prompt_params)
+            coordination_prompt = get_template('INITIAL_COORDINATION').render(**prompt_params)
             
             # 生成初始消息
-            initial_response = self.call_openai_api(coordination_prompt)
+            initial_response = self.call_openai_api(coordination_prompt, template='INITIAL_COORDINATION')
+            return {
+                'main_coordinator': main_coordinator,
+                'prompt': coordination_prompt,
+                'message': initial_response,
+                'participant_ids': participant_ids,
+                'schedule_versions': schedule_versions
+            }
             
-            # 保存所有参与者的协调上下文（但只发消息给主协调人）
-            for participant in participants:
-                participant_id = self._get_user_id(participant)
-                if not participant_id:
-                    continue
-                
-                self.coordination_contexts[participant_id] = {
-                    'prompt': coordination_prompt,
-                    'history': [],
-                    'status': 'pending',
-                    'params': params
-                }
-                
-                # 只给主协调人添加初始消息
-                if participant == main_coordinator:
-                    self.coordination_contexts[participant_id]['history'].append(
-                        {"role": "assistant", "content": initial_response}
-                    )
-                    initial_messages.append({
-                        'user_id': participant_id,
-                        'message': initial_response
-                    })
+        except Exception as e:
+            self.logger.error(f"生成首条协调消息失败: {str(e)}")
+            return None
+
+    def commit_coordination(self, coordination_task, draft):
+        """按草稿保存所有参与者的协调上下文，返回需要发送的初始消息"""
+        params = coordination_task['coordination_params']
+        main_coordinator = draft['main_coordinator']
+        coordination_prompt = draft['prompt']
+        initial_response = draft['message']
+        initial_messages = []  # 存储需要发送的初始消息
+        
+        # 保存所有参与者的协调上下文（但只发消息给主协调人）
+        for participant in coordination_task['target_participants']:
+            participant_id = self._get_user_id(participant)
+            if not participant_id:
+                continue
             
-            return initial_messages  # 返回需要发送的消息列表
+            # 只给主协调人添加初始消息；上下文构建完整后一次赋值，存储层只在赋值时写入
+            history = []
+            if participant == main_coordinator:
+                history.append({"role": "assistant", "content": initial_response})
+            self.coordination_contexts[participant_id] = {
+                'prompt': coordination_prompt,
+                'history': history,
+                'status': 'pending',
+                'params': params
+            }
             
-        except Exception as e:
-            self.logger.error(f"开始协调失败: {str(e)}")
-            return False
+            if participant == main_coordinator:
+                initial_messages.append({
+                    'user_id': participant_id,
+                    'message': initial_response
+                })
+        
+        return initial_messages  # 返回需要发送的消息列表
 
     def _extract_time_preference(self, response):
-        """从回复中提取时间偏好"""
+        """从回复中提取时间偏好，常见表达由本地规则解析，置信度不足时才调用 LLM"""
         try:
-            # 构建提取时间的提示词
-            prompt = f"""
-            请从以下用户回复中提取具体的时间偏好信息，返回结构化的 JSON 格式。
-            如果无法提取到完整信息，请尽可能提取部分信息。
-            
-            用户回复：{response}
-            
-            请返回以下格式的 JSON（注意处理不同的时间表达方式）：
-            {{
-                "time": "本周五下午",  // 大致时间范围
-                "flexibility": "flexible",  // strict（固定时间）或 flexible（灵活时间）
-                "duration": "3小时"  // 预计时长
-            }}
-            
-            即使信息不完整也要返回合理的默认值，确保返回的是有效的 JSON 格式。
-            """
+            # 快速路径：本地规则解析
+            local_result = parse_time_expression(response)
+            if local_result and local_result.pop('confidence') >= TIME_PARSER_MIN_CONFIDENCE:
+                self.logger.info(f"本地解析时间偏好: {json.dumps(local_result, ensure_ascii=False)}")
+                return local_result
             
-            # 调用 API 提取时间信息
-            result = self.call_openai_api(prompt)
-            
-            # 清理结果中可能的 markdown 标记
-            result = result.strip()
-            if result.startswith('```'):
-                result = result.split('\n', 1)[1]
-            if result.endswith('```'):
-                result = result.rsplit('\n', 1)[0]
+            # 构建提取时间的提示词
+            prompt = get_template('TIME_PREFERENCE').render(response=response)
             
-            return json.loads(result)
+            # 调用 API 提取时间信息，相同表述直接复用缓存
+            return self.call_structured(prompt, 'time_preference', use_cache=True, template='TIME_PREFERENCE')
             
         except Exception as e:
             self.logger.error(f"提取时间偏好失败: {str(e)}")
@@ -434,8 +778,8 @@ class CoordinationAgent(BaseAgent):
                 "duration": "1小时"
             }
 
-    def continue_coordination(self, message, user_id):
-        """继续协调流程"""
+    def continue_coordination(self, message, user_id, on_delta=None):
+        """继续协调流程，传入 on_delta 时以流式方式推送 LLM 生成的回复"""
         try:
             if user_id not in self.coordination_contexts:
                 return False
@@ -443,18 +787,14 @@ class CoordinationAgent(BaseAgent):
             context = self.coordination_contexts[user_id]
             
             # 获取用户名和主协调人名字
-            user_name = None
             main_coordinator_name = self.strategy_agent.coordination_priority['main_coordinator']
-            for user_id_key, user_info in mock_users.items():
-                if user_id_key == user_id:
-                    user_name = user_info.get('name')
-                    break
+            user_name = mock_users.get(user_id, {}).get('name')
             
             # 提取时间偏好
             time_preference = self._extract_time_preference(message)
             
             # 构建提示词
-            prompt = CONTINUE_COORDINATION_PROMPT.format(
+            prompt = get_template('CONTINUE_COORDINATION').render(
                 target_name=user_name or 'user',
                 context=json.dumps(context['params'], ensure_ascii=False),
                 history=json.dumps(context['history'], ensure_ascii=False),
@@ -463,7 +803,15 @@ class CoordinationAgent(BaseAgent):
             )
             
             # 获取回复
-            if time_preference and time_preference.get('time') != '未指定':
+            conflict_slots = self._check_schedule_conflict(user_id, time_preference, context['params'])
+            if conflict_slots is not None:
+                # 本地日程索引直接判定冲突，并给出所有人都有空的时间
+                visible_response = (
+                    f"抱歉，{time_preference['time']} {time_preference.get('specific_time', '')}"
+                    f"和您已有的日程冲突了。以下时间大家都有空：{format_slots(conflict_slots)}，您看哪个合适？"
+                )
+                internal_response = visible_response + "[COORDINATION_PROGRESS: CONFLICT]"
+            elif time_preference and time_preference.get('time') != '未指定':
                 # 生成两个版本的回复：一个用于显示，一个用于内部状态
                 visible_response = f"好的，我已记录您选择的时间：{time_preference['time']}"
                 if time_preference.get('specific_time'):
@@ -476,15 +824,19 @@ class CoordinationAgent(BaseAgent):
                     internal_response += "[COORDINATION_PROGRESS: CONFIRMED]"
                 else:
                     internal_response += "[COORDINATION_PROGRESS: CONFIRMED]"
+            elif on_delta:
+                internal_response = self.stream_openai_api(prompt, on_delta, template='CONTINUE_COORDINATION')
+                visible_response = strip_markers(internal_response).strip()
             else:
-                visible_response = self.call_openai_api(prompt)
+                visible_response = self.call_openai_api(prompt, template='CONTINUE_COORDINATION')
                 internal_response = visible_response
             
-            # 更新协调上下文
+            # 更新协调上下文（重新赋值以持久化到存储层）
             context['history'].extend([
                 {"role": "user", "content": message},
                 {"role": "assistant", "content": internal_response}
             ])
+            self.coordination_contexts[user_id] = context
             
             # 更新协调状态
             coordination_result = {
@@ -500,7 +852,17 @@ class CoordinationAgent(BaseAgent):
             
             # 如果策略代理返回了行动建议
             if update_result:
-                if update_result.get('action') == 'continue_coordination':
+                if update_result.get('action') == 'fan_out':
+                    # 并行策略：同时联系多位参与者
+                    coordination_result['next_coordinations'] = [
+                        {
+                            'user_id': self._get_user_id(item['next_user']),
+                            'message': item['next_message']
+                        }
+                        for item in update_result['next_coordinations']
+                        if self._get_user_id(item['next_user'])
+                    ]
+                elif update_result.get('action') == 'continue_coordination':
                     # 继续协调下一个人
                     next_user = update_result.get('next_user')
                     if next_user:
@@ -523,6 +885,46 @@ class CoordinationAgent(BaseAgent):
             self.logger.error(f"继续协调失败: {str(e)}")
             raise
 
+    def propose_slots(self, participant_ids, requirements, constraints=None, k=3):
+        """根据参与者日程计算共同空闲的前 k 个候选时段"""
+        try:
+            range_start, range_end = resolve_time_range(requirements.get('time_range'))
+            duration = timedelta(minutes=parse_duration(requirements.get('duration')))
+            return find_common_slots(
+                [self._get_busy_index(user_id) for user_id in participant_ids],
+                duration,
+                range_start,
+                range_end,
+                k=k,
+                workday_only=(constraints or {}).get('workday_only', True)
+            )
+        except Exception as e:
+            self.logger.error(f"计算候选时段失败: {str(e)}")
+            return []
+
+    def _check_schedule_conflict(self, user_id, time_preference, params):
+        """
+        检查用户给出的具体时间是否与其日程冲突
+        冲突时返回所有参与者的候选时段列表，无冲突或无法判断时返回 None
+        """
+        if not time_preference or not time_preference.get('start_time') or not time_preference.get('end_time'):
+            return None
+        try:
+            if not self._get_busy_index(user_id).overlaps(time_preference['start_time'], time_preference['end_time']):
+                return None
+        except ValueError:
+            return None
+        return self.propose_slots(list(self.coordination_contexts), params['requirements'], params.get('constraints'))
+
+    def _get_busy_index(self, user_id):
+        """获取用户的忙碌区间索引，日程变化时重建"""
+        schedule = self._get_user_schedule(user_id)
+        cached = self._busy_indexes.get(user_id)
+        if cached is None or cached[0] != len(schedule):
+            cached = (len(schedule), build_busy_index(schedule))
+            self._busy_indexes[user_id] = cached
+        return cached[1]
+
     def get_meeting_info(self):
         """获取当前会议信息"""
         for task in self.coordination_tasks.values():
@@ -547,81 +949,111 @@ class StrategyAgent(BaseAgent):
         self.coordination_status = {}
         self.coordination_sequence = []  # 存储协调顺序
         self.coordination_priority = None  # 存储协调优先级信息
+        self.state_machine = CoordinationStateMachine()  # 事件驱动的协调状态机
+        self.current_meeting_info = {}  # 当前会话的会议信息
+        self.coordination_strategy = COORDINATION_STRATEGY
+        self.notification_agent = None  # 将在初始化后设置
+
+    def export_state(self):
+        return {
+            **super().export_state(),
+            'coordination_status': dict(self.coordination_status),
+            'coordination_sequence': list(self.coordination_sequence),
+            'coordination_priority': self.coordination_priority,
+            'current_meeting_info': dict(self.current_meeting_info),
+            'coordination_strategy': self.coordination_strategy,
+            'state_machine': self.state_machine.export_state()
+        }
+
+    def import_state(self, state):
+        super().import_state(state)
+        status = state.get('coordination_status', {})
+        if hasattr(self.coordination_status, 'replace_local'):
+            self.coordination_status.replace_local(status)
+        else:
+            self.coordination_status = dict(status)
+        self.coordination_sequence = list(state.get('coordination_sequence', []))
+        self.coordination_priority = state.get('coordination_priority')
+        self.current_meeting_info = dict(state.get('current_meeting_info', {}))
+        self.coordination_strategy = state.get('coordination_strategy', COORDINATION_STRATEGY)
+        # 状态机最后载入，唤醒等待中的协调流程时其他状态已经就绪
+        self.state_machine.import_state(state.get('state_machine', {}))
         
     def process_dialogue_summary(self, dialogue_summary):
         """处理对话总结，决定是否开始协调"""
         try:
-            # 记录输入数据
-            self.logger.info(f"收到对话总结数据: {json.dumps(dialogue_summary, ensure_ascii=False)}")
-            
-            # 构建分析提示词
-            analysis_prompt = "\n\n对话总结：" + json.dumps(dialogue_summary, ensure_ascii=False) + STRATEGY_PROMPT
-            self.logger.debug(f"构建的分析提示词: {analysis_prompt}")
-            
-            # 调用 API 获取分析结果
-            self.logger.info("开始调用 LLM API 进行分析...")
-            analysis_result = self.call_openai_api(analysis_prompt)
-            
-            # 清理和解析结果
-            strategy_decision = self._clean_and_parse_result(analysis_result)
-            
+            strategy_decision = self.analyze_dialogue_summary(dialogue_summary)
+        except Exception as e:
+            self.logger.error(f"处理对话总结失败: {str(e)}")
+            self.logger.error("错误详情: ", exc_info=True)
+            return {"action": "error", "reason": str(e)}
+        return self.apply_strategy_decision(strategy_decision)
+
+    def analyze_dialogue_summary(self, dialogue_summary):
+        """调用 LLM 分析对话总结，只返回策略决策，不修改协调状态（推测执行时使用）"""
+        # 记录输入数据
+        self.logger.info(f"收到对话总结数据: {json.dumps(dialogue_summary, ensure_ascii=False)}")
+        
+        # 构建分析提示词
+        analysis_prompt = get_template('STRATEGY').render(
+            dialogue_summary=json.dumps(dialogue_summary, ensure_ascii=False)
+        )
+        self.logger.debug(f"构建的分析提示词: {analysis_prompt}")
+        
+        # 调用 API 获取分析结果（按 schema 校验）
+        self.logger.info("开始调用 LLM API 进行分析...")
+        return self.call_structured(analysis_prompt, 'strategy_decision', template='STRATEGY')
+
+    def apply_strategy_decision(self, strategy_decision):
+        """按策略决策设置协调顺序和优先级，并重置协调状态机"""
+        try:
             # 确定协调顺序
             if strategy_decision.get('action') == 'start_coordination':
                 # 使用优先级信息设置协调顺序
                 self.coordination_sequence = strategy_decision['target_participants']
                 self.coordination_priority = strategy_decision.get('coordination_priority')
+                self.current_meeting_info = strategy_decision.get('coordination_params', {}).get('known_info', {})
+                self.coordination_strategy = strategy_decision.get('coordination_strategy', COORDINATION_STRATEGY)
                 self.logger.info(f"设置协调顺序: {json.dumps(self.coordination_sequence, ensure_ascii=False)}")
                 self.logger.info(f"协调优先级信息: {json.dumps(self.coordination_priority, ensure_ascii=False)}")
+                
+                # 重置状态机，所有参与者进入 pending
+                self.coordination_status.clear()
+                main_coordinator = (self.coordination_priority or {}).get('main_coordinator')
+                self.state_machine.reset(
+                    [user_id for user_id in map(self._get_user_id, self.coordination_sequence) if user_id],
+                    self._get_user_id(main_coordinator) if main_coordinator else None
+                )
             
             return strategy_decision
             
         except Exception as e:
-            self.logger.error(f"处理对话总结失败: {str(e)}")
+            self.logger.error(f"应用策略决策失败: {str(e)}")
             self.logger.error("错误详情: ", exc_info=True)
             return {"action": "error", "reason": str(e)}
 
     def analyze_coordination_status(self):
-        """分析整体协调状态"""
+        """根据协调状态机确定下一步行动，不再调用 LLM"""
         try:
-            # 构建状态分析提示词
-            status_data = {
-                "type": "coordination_status",
-                "status": "in_progress",
-                "summary": {
-                    "coordination_status": self.coordination_status,
-                    "coordination_sequence": self.coordination_sequence,
-                    "coordination_priority": self.coordination_priority
-                }
-            }
-            
-            analysis_prompt = "\n\n协调状态：" + json.dumps(status_data, ensure_ascii=False) + STRATEGY_PROMPT
-            self.logger.info("开始分析协调状态...")
-            
-            # 获取 LLM 分析结果
-            analysis_result = self.call_openai_api(analysis_prompt)
-            strategy_decision = self._clean_and_parse_result(analysis_result)
+            meeting_state = self.state_machine.meeting_state
             
-            # 检查当前状态
-            current_user = self._get_current_coordination_user()
-            if current_user:
-                # 修改返回的 action
-                strategy_decision['action'] = 'continue_coordination'
-                strategy_decision['current_user'] = current_user
-                
-                # 如果主协调人已确认时间，准备协调下一个人
-                main_coordinator = self.coordination_priority['main_coordinator']
-                main_coordinator_id = self._get_user_id(main_coordinator)
+            if meeting_state in (CONFIRMED, FINALIZED):
+                strategy_decision = {
+                    'action': 'finalize_meeting',
+                    'final_time': self.state_machine.final_time
+                }
+            else:
+                strategy_decision = {'action': 'continue_coordination'}
+                current_user = self._get_current_coordination_user()
+                if current_user:
+                    strategy_decision['current_user'] = current_user
                 
-                if (main_coordinator_id in self.coordination_status and 
-                    self.coordination_status[main_coordinator_id].get('time_preference')):
-                    # 获取下一个用户
-                    next_user = self._get_next_user(main_coordinator_id)
-                    if next_user:
-                        strategy_decision['next_user'] = next_user
-                        strategy_decision['main_coordinator_time'] = (
-                            self.coordination_status[main_coordinator_id]['time_preference']
-                        )
+                # 如果主协调人已给出时间，附带给后续参与者参考
+                main_time = self.state_machine.final_time
+                if main_time:
+                    strategy_decision['main_coordinator_time'] = main_time
             
+            strategy_decision['meeting_state'] = meeting_state
             self.logger.info(f"协调状态分析结果: {json.dumps(strategy_decision, ensure_ascii=False)}")
             return strategy_decision
             
@@ -631,69 +1063,78 @@ class StrategyAgent(BaseAgent):
 
     def _get_current_coordination_user(self):
         """获取当前应该协调的用户"""
+        current_user_id = self.state_machine.current_user()
+        if not current_user_id:
+            return None
         for user in self.coordination_sequence:
-            if user not in self.coordination_status:
-                return user
-            if not self.coordination_status[user].get('time_preference'):
+            if self._get_user_id(user) == current_user_id:
                 return user
         return None
 
-    def _clean_and_parse_result(self, result):
-        """清理和解析 LLM 返回的结果"""
-        result = result.strip()
-        if result.startswith('```'):
-            result = result.split('\n', 1)[1]
-        if result.endswith('```'):
-            result = result.rsplit('\n', 1)[0]
-            
-        strategy_decision = json.loads(result)
-        if 'decision' in strategy_decision:
-            return strategy_decision['decision']
-        return strategy_decision
-
     def update_coordination_status(self, user_id, response, time_preference=None):
-        """更新特定用户的协调状态"""
+        """更新特定用户的协调状态，只有真实的状态迁移才会触发后续 LLM 调用"""
         self.coordination_status[user_id] = {
             'response': response,
             'time_preference': time_preference,
             'updated_at': datetime.now().isoformat()
         }
         
+        # 驱动状态机，重复事件不会产生迁移
+        changed = self.state_machine.transition(
+            user_id,
+            classify_response(response, time_preference),
+            time_preference
+        )
+        if not changed:
+            return None
+        
         # 获取主协调人ID
         main_coordinator = self.coordination_priority['main_coordinator']
         main_coordinator_id = self._get_user_id(main_coordinator)
         
-        # 如果是主协调人确认了时间，继续协调其他人
-        if user_id == main_coordinator_id and time_preference:
-            self.logger.info("主协调人已确认时间，准备协调其他参与者")
+        main_time = self.state_machine.final_time
+        user_state = self.state_machine.states.get(user_id)
+        
+        if (user_id == main_coordinator_id and time_preference and user_state != CONFLICT and
+                self.coordination_strategy == 'parallel'):
+            # 并行策略：主协调人确定时间后同时联系其余所有参与者
+            self.logger.info("主协调人已确认时间，并发联系其他参与者")
+            pending_users = [
+                user for user in self.coordination_sequence
+                if user != main_coordinator and
+                self.state_machine.states.get(self._get_user_id(user)) != CONFIRMED
+            ]
+            if pending_users:
+                return {
+                    'action': 'fan_out',
+                    'next_coordinations': [
+                        {'next_user': user, 'next_message': message}
+                        for user, message in zip(
+                            pending_users,
+                            self._generate_coordination_messages(pending_users, main_coordinator, time_preference)
+                        )
+                    ]
+                }
+        
+        elif main_time and user_state == CONFIRMED and self.coordination_strategy != 'parallel':
+            # 顺序策略：当前用户确认后继续协调下一个人
             next_user = self._get_next_user(user_id)
             if next_user:
+                self.logger.info(f"{user_id} 已确认时间，准备协调下一位参与者 {next_user}")
                 return {
                     'action': 'continue_coordination',
                     'next_user': next_user,
                     'next_message': self._generate_coordination_message(
                         next_user,
                         main_coordinator,
-                        time_preference
+                        main_time
                     )
                 }
         
         # 检查是否所有人都已确认
-        all_confirmed = True
-        final_time = None
-        
-        for user in self.coordination_sequence:
-            user_id = self._get_user_id(user)
-            if user_id not in self.coordination_status:
-                all_confirmed = False
-                break
-            if not self.coordination_status[user_id].get('time_preference'):
-                all_confirmed = False
-                break
-            if user == main_coordinator:
-                final_time = self.coordination_status[user_id]['time_preference']
+        final_time = self.state_machine.final_time
         
-        if all_confirmed and final_time:
+        if self.state_machine.meeting_state == CONFIRMED and final_time:
             # 所有人都确认了，可以确定最终时间
             return {
                 'action': 'finalize_meeting',
@@ -708,7 +1149,7 @@ class StrategyAgent(BaseAgent):
         """生成最终的会议确认通知"""
         try:
             # 使用 NotificationAgent 生成通知
-            notification = notification_agent.notify_participants(
+            notification = self.notification_agent.notify_participants(
                 {
                     'title': self.current_meeting_info['title'],
                     'participants': self.coordination_sequence,
@@ -725,26 +1166,15 @@ class StrategyAgent(BaseAgent):
         """生成协调消息"""
         try:
             # 构建消息生成提示词
-            prompt = f"""
-            请生成一条邀请确认时间的消息。
-
-            已知信息：
-            - 目标用户：{target_user}
-            - 主协调人：{main_coordinator}
-            - 会议信息：{json.dumps(self.current_meeting_info, ensure_ascii=False)}
-            - 建议时间：{json.dumps(time_preference, ensure_ascii=False)}
-
-            要求：
-            1. 包含会议主题和参与者信息
-            2. 说明这是主协调人建议的时间
-            3. 语气友好专业
-            4. 请求确认时间是否方便
-
-            请直接返回消息内容，不要添加任何其他格式。
-            """
+            prompt = get_template('COORDINATION_MESSAGE').render(
+                target_user=target_user,
+                main_coordinator=main_coordinator,
+                meeting_info=json.dumps(self.current_meeting_info, ensure_ascii=False),
+                time_preference=json.dumps(time_preference, ensure_ascii=False)
+            )
 
             # 调用 API 生成消息
-            message = self.call_openai_api(prompt)
+            message = self.call_openai_api(prompt, template='COORDINATION_MESSAGE')
             return message.strip()
 
         except Exception as e:
@@ -757,6 +1187,14 @@ class StrategyAgent(BaseAgent):
                 f"请问您方便参加吗？"
             )
 
+    def _generate_coordination_messages(self, target_users, main_coordinator, time_preference):
+        """在有界线程池中并发生成多位参与者的协调消息，返回顺序与 target_users 一致"""
+        with ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_CONCURRENCY, len(target_users)))) as executor:
+            return list(executor.map(
+                lambda user: self._generate_coordination_message(user, main_coordinator, time_preference),
+                target_users
+            ))
+
     def _get_next_user(self, current_user_id):
         """获取下一个需要协调的用户"""
         current_index = -1
@@ -774,34 +1212,34 @@ class NotificationAgent(BaseAgent):
         """生成会议通知"""
         try:
             # 构建通知生成提示词
-            prompt = f"""
-            请生成一条会议确认通知。
-
-            会议信息：
-            - 主题：{meeting_info['title']}
-            - 参与者：{', '.join(meeting_info['participants'])}
-            - 时间：{json.dumps(meeting_info['time'], ensure_ascii=False)}
-            - 描述：{meeting_info['description']}
-
-            要求：
-            1. 通知需要包含：
-               - 会议主题
-               - 确定的时间
-               - 参与人员
-               - 会议说明
-            2. 语气要正式专业
-            3. 感谢大家的配合
-            4. 如果时间是灵活的，要说明这一点
-
-            请直接返回通知内容，不要添加任何格式标记。
-            """
-
-            # 调用 API 生成通知
-            notification = self.call_openai_api(prompt)
+            prompt = get_template('NOTIFICATION').render(
+                title=meeting_info['title'],
+                participants=', '.join(meeting_info['participants']),
+                time=json.dumps(meeting_info['time'], ensure_ascii=False),
+                description=meeting_info['description']
+            )
+
+            # 调用 API 生成通知，相同会议信息直接复用缓存
+            notification = self.call_openai_api(prompt, use_cache=True, template='NOTIFICATION')
             return notification.strip()
             
         except Exception as e:
             self.logger.error(f"生成会议通知失败: {str(e)}")
             return "抱歉，生成会议通知时出现错误。"
 
+    def notify_batch(self, meetings):
+        """
+        一次调用为多个会议生成通知，meetings 为含 id/title/participants/time/description 的列表
+        返回 {会议ID: 通知内容}，LLM 未覆盖的会议不在结果中
+        """
+        try:
+            prompt = get_template('BATCH_NOTIFICATION').render(
+                meetings=json.dumps(meetings, ensure_ascii=False)
+            )
+            result = self.call_structured(prompt, 'batch_notification', template='BATCH_NOTIFICATION')
+            return {item['id']: item['message'].strip() for item in result['notifications']}
+        except Exception as e:
+            self.logger.error(f"批量生成会议通知失败: {str(e)}")
+            return {}
+
 # 仅用于测试，不建议在生产环境中这样做 
\ No newline at end of file
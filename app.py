@@ -1,32 +1,42 @@
-from flask import Flask, request, jsonify, render_template
-from flask_socketio import SocketIO, emit
+import os
+
+# Socket.IO 运行在 gevent 上，必须在导入其他模块之前给标准库打补丁：
+# LLM 请求的 socket、重试退避的 sleep、协调任务和调度线程都变成协程，
+# 一个会话等待 LLM 时不会阻塞其他连接；GEVENT_MONKEY_PATCH=0 时关闭（仅用于排查问题）
+if os.getenv('GEVENT_MONKEY_PATCH', '1') == '1':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, request, jsonify, render_template, Response, has_request_context
+from flask_socketio import SocketIO, emit, leave_room
 from flask_cors import CORS
-from agents import DialogueAgent, CoordinationAgent, StrategyAgent, NotificationAgent, verify_environment
-from models import mock_users, mock_conversations  # 从 models.py 导入
+from agents import verify_environment, llm_service
+from batch_scheduler import batch_scheduler
+from coordination_jobs import coordination_pool, CoordinationQueueFull
+from logging_config import setup_logging, logging_stats
+from metrics import metrics_registry
+from prompts import prompt_cache_report
+from message_queue import create_client_manager
+from presence import presence, user_room, meeting_room
+from sessions import session_registry
+from speculation import speculation_manager
+from storage import meeting_store, StateConflict
+from models import mock_users, conversation_history  # 从 models.py 导入
 import logging
-import os
 import sys
 from datetime import datetime
 import json
+from functools import partial
 import openai
 import urllib3
 import requests
 from requests.exceptions import RequestException
 from engineio.async_drivers import gevent
-from threading import Thread
 import time
+import uuid
 
-# 配置日志
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
-)
+# 配置日志：异步写入 logs/app.log（JSON Lines，自动轮转）
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -46,8 +56,9 @@ CORS(app, resources={
 socketio = SocketIO(
     app,
     async_mode='gevent',
-    logger=True,
-    engineio_logger=True,
+    # 逐包日志开销很大，只在排查连接问题时通过 SOCKETIO_LOGGER=1 打开
+    logger=os.getenv('SOCKETIO_LOGGER', '0') == '1',
+    engineio_logger=os.getenv('SOCKETIO_LOGGER', '0') == '1',
     cors_allowed_origins="*",
     ping_timeout=60000,
     ping_interval=25000,
@@ -55,47 +66,24 @@ socketio = SocketIO(
     transports=['polling', 'websocket'],
     upgrade_timeout=60000,
     max_http_buffer_size=1e8,
-    allow_upgrades=True
+    allow_upgrades=True,
+    # 多实例部署时 emit 经过消息队列转发给持有目标连接的实例
+    client_manager=create_client_manager()
 )
 
-# 创建 agents
-dialogue_agent = DialogueAgent("对话助手")
-strategy_agent = StrategyAgent("策略分析助手")
-coordination_agent = CoordinationAgent("时间协调助手")
-notification_agent = NotificationAgent("通知助手")
-
-# 设置代理之间的引用关系
-coordination_agent.strategy_agent = strategy_agent
-
-# 修改模拟用户数据结构
-mock_users = {
-    "user1": {
-        "id": "user1",
-        "name": "张三",
-        "role": "员工",
-        "schedule": []
-    },
-    "user2": {
-        "id": "user2",
-        "name": "李四",
-        "role": "经理",
-        "schedule": []
-    },
-    "user3": {
-        "id": "user3",
-        "name": "王五",
-        "role": "部门主管",
-        "schedule": []
-    }
-}
+# 共享会话状态时，协调流程按此间隔（秒）检查其他实例写入的状态
+SHARED_STATE_POLL_INTERVAL = float(os.getenv('SHARED_STATE_POLL_INTERVAL', 1.0))
 
 @app.route('/')
 def home():
     return render_template('chat.html')
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     logger.info('Client connected')
+    # 客户端在连接参数中声明代表的用户（auth 或查询参数 user_ids=user1,user2）
+    user_ids = (auth or {}).get('user_ids') or request.args.get('user_ids', '').split(',')
+    join_users(request.sid, user_ids)
     emit('message', {
         'message': '您好！我是您的会议助手。请告诉我您的会议需求，我会帮您安排合适的时间。',
         'type': 'system',
@@ -104,7 +92,70 @@ def handle_connect():
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    logger.info('Client disconnected')
+    offline = presence.disconnect(request.sid)
+    logger.info(f"Client disconnected, offline users: {offline}")
+
+@socketio.on('join_users')
+def handle_join_users(data):
+    """连接建立后追加代表的用户，返回实际加入的用户ID"""
+    return join_users(request.sid, (data or {}).get('user_ids', []))
+
+@socketio.on('leave_users')
+def handle_leave_users(data):
+    """连接不再接收这些用户的协调消息"""
+    for user_id in (data or {}).get('user_ids', []):
+        leave_room(user_room(user_id))
+        presence.leave(request.sid, user_id)
+
+def join_users(sid, user_ids):
+    """
+    把连接加入用户房间并登记在线状态；
+    用户有进行中的协调时同时加入对应的会议房间
+    """
+    joined = []
+    for user_id in user_ids:
+        if user_id not in mock_users:
+            continue
+        enter_room(sid, user_room(user_id))
+        presence.join(sid, user_id)
+        joined.append(user_id)
+        session = session_registry.find_by_participant(user_id)
+        if session is not None and session.meeting_id is not None:
+            enter_room(sid, meeting_room(session.meeting_id))
+    return joined
+
+def enter_room(sid, room):
+    """
+    把连接加入房间，可以在没有请求上下文的后台任务中调用；
+    连接已断开或不在本实例上时跳过
+    """
+    try:
+        socketio.server.enter_room(sid, room, namespace='/')
+        return True
+    except (KeyError, ValueError):
+        logger.debug(f"连接 {sid} 不在本实例上，跳过加入房间 {room}")
+        return False
+
+def enter_meeting_room(session):
+    """发起人和在线参与者的连接加入会议房间"""
+    room = meeting_room(session.meeting_id)
+    enter_room(session.session_id, room)
+    for user_id in session.participant_ids():
+        for sid in presence.sids_for(user_id):
+            enter_room(sid, room)
+
+def emit_to_user(user_id, event, payload):
+    """只推送给该用户的房间（用户的所有连接），不广播给其他客户端"""
+    socketio.emit(event, payload, to=user_room(user_id))
+
+def emit_meeting_status(session, status):
+    """会议状态变化推送给会议房间"""
+    if session.meeting_id is not None:
+        socketio.emit('meeting_status', {
+            'meeting_id': session.meeting_id,
+            'status': status,
+            'timestamp': datetime.now().isoformat()
+        }, to=meeting_room(session.meeting_id))
 
 @socketio.on('chat_message')
 def handle_message(data):
@@ -119,8 +170,8 @@ def handle_message(data):
         logger.info(f"收到消息 - user_id: {user_id}, message: {message}")
         
         if user_id == 'main_user':
-            # 1. 处理主用户的初始会议请求
-            handle_initial_request(message)
+            # 1. 处理主用户的初始会议请求（每个连接一个独立会话）
+            handle_initial_request(session_registry.get(request.sid), message)
         else:
             # 2. 处理协调过程中的回复
             handle_coordination_reply(user_id, message)
@@ -128,58 +179,103 @@ def handle_message(data):
     except Exception as e:
         handle_error("处理消息失败", e)
 
-def handle_initial_request(message):
+def make_delta_emitter(send, stream_id, target_user_id=None):
+    """构造回调，把 LLM 的增量 token 推送为 message_delta 事件"""
+    def on_delta(delta):
+        payload = {
+            'stream_id': stream_id,
+            'delta': delta,
+            'type': 'assistant'
+        }
+        if target_user_id:
+            payload['target_user_id'] = target_user_id
+        send('message_delta', payload)
+    return on_delta
+
+def handle_initial_request(session, message):
     """处理初始会议请求"""
     try:
-        # 1. 对话助手处理请求
-        dialogue_result = dialogue_agent.handle_user_request(message)
+        session_registry.refresh(session)
+        # 组织者回复确认内容时，非肯定的答复会取消按旧信息进行的推测执行
+        speculation_manager.on_user_message(session, message)
+        
+        # 1. 对话助手处理请求，回复以 message_delta 事件流式推送；
+        #    回复中的确认内容一输出完整，就在后台推测执行总结、策略分析和首条协调消息
+        stream_id = uuid.uuid4().hex
+        dialogue_result = session.dialogue_agent.handle_user_request(
+            message,
+            on_delta=speculation_manager.stream_observer(session, make_delta_emitter(emit, stream_id))
+        )
+        speculation_manager.on_assistant_reply(session, dialogue_result.get('assistant_response'))
         
-        # 2. 发送响应
+        # 2. 发送完整响应，客户端用它替换流式输出的内容
         emit('message', {
             'message': dialogue_result['response'],
             'type': 'assistant',
+            'stream_id': stream_id,
             'timestamp': datetime.now().isoformat()
         })
+        # 先写回共享状态，再交给协调任务继续修改
+        session_registry.save(session)
         
         # 3. 如果对话完成，启动协调流程
         if dialogue_result.get('is_complete'):
-            Thread(target=start_coordination_process).start()
+            try:
+                coordination_pool.submit(session.session_id, start_coordination_process, session)
+            except CoordinationQueueFull as e:
+                logger.warning(f"协调任务被拒绝: {str(e)}")
+                speculation_manager.cancel(session.session_id, '协调任务被拒绝')
+                emit_error_message("当前协调任务较多，请稍后再试")
             
+    except StateConflict as e:
+        handle_state_conflict(e)
     except Exception as e:
         handle_error("处理初始请求失败", e)
 
 def handle_coordination_reply(user_id, message):
     """处理协调过程中的回复"""
     try:
-        # 1. 继续协调对话
-        coordination_result = coordination_agent.continue_coordination(message, user_id)
-        
-        # 2. 更新策略状态
-        strategy_agent.update_coordination_status(
-            user_id,
-            coordination_result['response'],
-            coordination_result.get('time_preference')
-        )
+        session = session_registry.find_by_participant(user_id)
+        if session is None:
+            raise ValueError(f"用户 {user_id} 没有进行中的协调")
         
-        # 3. 发送回复
-        emit('coordination_message', {
-            'target_user_id': user_id,
-            'message': coordination_result['response'],
-            'type': 'received'
-        })
+        # 继续协调对话（continue_coordination 内部已按带标记的回复更新策略状态）
+        stream_id = uuid.uuid4().hex
+        with session_registry.checkout(session):
+            coordination_result = session.coordination_agent.continue_coordination(
+                message,
+                user_id,
+                on_delta=make_delta_emitter(partial(emit_to_user, user_id), stream_id, user_id)
+            )
+        if coordination_result:
+            deliver_coordination_result(session, coordination_result, stream_id)
         
+    except StateConflict as e:
+        handle_state_conflict(e)
     except Exception as e:
         handle_error("处理协调回复失败", e)
 
-def start_coordination_process():
-    """协调流程的主循环"""
+def start_coordination_process(session, job):
+    """
+    协调流程的第一步：总结、策略分析并发出首条协调消息，
+    job 为协调任务池中的任务，之后的推进由 advance_coordination 在状态变化时完成
+    """
+    strategy_agent = session.strategy_agent
+    organizer = session.session_id  # 发起人的连接 sid，系统消息只发给发起人
     try:
-        # 1. 生成对话总结
-        dialogue_summary = dialogue_agent.summarize_with_llm()
+        # 组织者确认时推测执行已经完成（或正在进行）的，直接使用其结果
+        speculative = speculation_manager.claim(session, timeout=job.deadline - time.time())
+        if speculative:
+            dialogue_summary = speculative['summary']
+            strategy_decision = strategy_agent.apply_strategy_decision(speculative['decision'])
+            draft = speculative['draft']
+        else:
+            # 1. 生成对话总结
+            dialogue_summary = session.dialogue_agent.summarize_with_llm()
+            # 2. 策略分析
+            strategy_decision = strategy_agent.process_dialogue_summary(dialogue_summary)
+            draft = None
         logger.info(f"对话总结: {json.dumps(dialogue_summary, ensure_ascii=False)}")
-        
-        # 2. 策略分析
-        strategy_decision = strategy_agent.process_dialogue_summary(dialogue_summary)
         logger.info(f"策略分析结果: {json.dumps(strategy_decision, ensure_ascii=False)}")
         
         # 记录协调优先级信息
@@ -189,154 +285,296 @@ def start_coordination_process():
         # 3. 如果需要开始协调
         if strategy_decision['action'] == 'start_coordination':
             # 4. 启动初始协调
-            initial_messages = coordination_agent.start_coordination(strategy_decision)
+            initial_messages = session.coordination_agent.start_coordination(strategy_decision, draft=draft)
             if initial_messages:
-                emit_system_message("好的，我开始和相关人员协调时间...")
+                # 登记参与者，参与者的回复将路由到本会话
+                session_registry.bind_participants(session.session_id, session.participant_ids())
+                
+                # 在存储层创建会议记录
+                meeting_info = strategy_agent.current_meeting_info
+                session.set_meeting_id(meeting_store.create_meeting(
+                    session.session_id,
+                    title=meeting_info.get('title', ''),
+                    description=meeting_info.get('description', ''),
+                    participants=session.participant_ids(),
+                    status='coordinating',
+                    data={'strategy_decision': strategy_decision}
+                )['id'])
+                metrics_registry.merge_meeting(session.session_id, session.meeting_id)
+                session_registry.save(session)
+                enter_meeting_room(session)
+                emit_meeting_status(session, 'coordinating')
+                emit_system_message("好的，我开始和相关人员协调时间...", to=organizer)
                 
                 # 发送初始消息给每个参与者
                 for msg in initial_messages:
-                    socketio.emit('coordination_message', {
+                    emit_to_user(msg['user_id'], 'coordination_message', {
                         'target_user_id': msg['user_id'],
                         'message': msg['message'],
                         'type': 'assistant',
                         'timestamp': datetime.now().isoformat()
                     })
                 
-                # 5. 协调状态循环
-                max_attempts = 60
-                attempt = 0
-                
-                while attempt < max_attempts:
-                    status = strategy_agent.analyze_coordination_status()
-                    logger.info(f"当前协调状态: {json.dumps(status, ensure_ascii=False)}")
-                    
-                    # 根据当前协调用户发送提醒
-                    current_user = status.get('current_user')
-                    if current_user:
-                        priority_info = strategy_decision.get('coordination_priority', {})
-                        if current_user == priority_info.get('main_coordinator'):
-                            logger.info(f"等待主协调人 {current_user} 的响应")
-                        else:
-                            logger.info(f"等待参与者 {current_user} 的响应")
+                # 5. 释放工作线程，之后由状态机事件（参与者回复）唤醒任务继续推进
+                strategy_agent.state_machine.add_listener(job.wake)
+                advance_coordination(session, strategy_decision, job)
                     
-                    if status['action'] == 'finalize_meeting':
-                        # 所有人都确认了，发送最终通知
-                        send_final_notification(strategy_decision['target_participants'])
-                        break
-                        
-                    elif status['action'] == 'continue_coordination':
-                        # 继续等待当前用户的响应
-                        time.sleep(5)
-                        attempt += 1
-                        continue
-                        
-                    elif status['action'] == 'error':
-                        emit_error_message(f"协调过程出现错误: {status.get('reason', '未知错误')}")
-                        break
-                        
-                    else:
-                        # 未知状态，退出循环
-                        emit_error_message("协调过程出现未知状态")
-                        break
+            else:
+                emit_error_message("抱歉，开始协调时出现问题", to=organizer)
                 
-                # 检查是否达到最大尝试次数
-                if attempt >= max_attempts:
-                    emit_error_message("协调超时，请稍后重试")
-                    
+    except Exception as e:
+        handle_error("协调流程失败", e, to=organizer)
+
+def advance_coordination(session, strategy_decision, job):
+    """
+    按当前协调状态推进一步：结束（完成、取消、超时或出错）时通知发起人，
+    仍需等待参与者回复时挂起任务，不占用工作线程
+    """
+    strategy_agent = session.strategy_agent
+    organizer = session.session_id
+    try:
+        done = True
+        if job.cancelled:
+            emit_meeting_status(session, 'cancelled')
+            emit_error_message("协调已取消", to=organizer)
+            return
+        
+        # 参与者的回复可能由其他实例处理，先载入共享状态
+        session_registry.refresh(session)
+        status = strategy_agent.analyze_coordination_status()
+        logger.debug(f"当前协调状态: {json.dumps(status, ensure_ascii=False)}")
+        
+        # 根据当前协调用户记录等待对象
+        current_user = status.get('current_user')
+        if current_user:
+            priority_info = strategy_decision.get('coordination_priority', {})
+            if current_user == priority_info.get('main_coordinator'):
+                logger.info(f"等待主协调人 {current_user} 的响应")
             else:
-                emit_error_message("抱歉，开始协调时出现问题")
+                logger.info(f"等待参与者 {current_user} 的响应")
+        
+        if status['action'] == 'finalize_meeting':
+            # 所有人都确认了，只有首个完成 finalize 的一方发送最终通知
+            if claim_finalization(session):
+                send_final_notification(session, strategy_decision['target_participants'])
+                
+        elif status['action'] == 'continue_coordination':
+            if job.expired():
+                emit_meeting_status(session, 'timeout')
+                emit_error_message("协调超时，请稍后重试", to=organizer)
+            else:
+                # 等待下一次状态迁移；其他实例的状态变化不会唤醒本地状态机，共享状态时定期载入
+                done = False
+                job.suspend(
+                    partial(advance_coordination, session, strategy_decision),
+                    poll_interval=SHARED_STATE_POLL_INTERVAL if session_registry.shared else None
+                )
                 
+        elif status['action'] == 'error':
+            emit_error_message(f"协调过程出现错误: {status.get('reason', '未知错误')}", to=organizer)
+            
+        else:
+            # 未知状态，结束协调
+            emit_error_message("协调过程出现未知状态", to=organizer)
+    except Exception as e:
+        handle_error("协调流程失败", e, to=organizer)
+    finally:
+        if done:
+            strategy_agent.state_machine.remove_listener(job.wake)
+
+def build_notification(session, participants, final_time):
+    """使用会话的通知助手生成最终通知"""
+    meeting_info = session.strategy_agent.current_meeting_info
+    return session.notification_agent.notify_participants({
+        'title': meeting_info.get('title', ''),
+        'participants': participants,
+        'time': final_time,
+        'description': meeting_info.get('description', '')
+    })
+
+def record_final_meeting(session, final_time):
+    """把最终确认的时间写入会议记录"""
+    if session.meeting_id is None or not final_time:
+        return
+    try:
+        meeting = meeting_store.get_meeting(session.meeting_id) or {'data': {}}
+        meeting_store.update_meeting(
+            session.meeting_id,
+            status='confirmed',
+            start_time=final_time.get('start_time'),
+            end_time=final_time.get('end_time'),
+            data={**meeting['data'], 'final_time': final_time}
+        )
     except Exception as e:
-        handle_error("协调流程失败", e)
+        logger.error(f"更新会议记录失败: {str(e)}")
 
-def send_final_notification(participants):
+def claim_finalization(session):
+    """
+    状态机进入 finalized 并写入共享状态，只有首个成功写入的一方发送最终通知
+    写入冲突时会载入最新状态，其他实例已经 finalize 时放弃，否则重试
+    """
+    state_machine = session.strategy_agent.state_machine
+    for _ in range(3):
+        if not state_machine.finalize():
+            return False
+        try:
+            session_registry.save(session)
+            return True
+        except StateConflict:
+            continue
+    return False
+
+def send_final_notification(session, participants):
     """发送最终会议通知"""
-    notification = notification_agent.notify_participants(
-        strategy_agent.coordination_status,
-        coordination_agent.get_meeting_info()
-    )
+    strategy_agent = session.strategy_agent
+    record_final_meeting(session, strategy_agent.state_machine.final_time)
+    notification = build_notification(session, participants, strategy_agent.state_machine.final_time)
     
     for participant in participants:
         user_id = strategy_agent._get_user_id(participant)
         if user_id:
-            socketio.emit('coordination_message', {
+            emit_to_user(user_id, 'coordination_message', {
                 'target_user_id': user_id,
                 'message': notification,
                 'type': 'system'
             })
+    emit_meeting_status(session, 'confirmed')
+
+def deliver_coordination_result(session, coordination_result, stream_id):
+    """发送协调回复，联系下一位参与者，所有人确认后发送最终通知"""
+    # 发送回复给当前用户
+    emit_to_user(coordination_result['user_id'], 'coordination_message', {
+        'target_user_id': coordination_result['user_id'],
+        'message': coordination_result['response'],
+        'type': 'received',
+        'stream_id': stream_id
+    })
+    
+    # 如果需要协调下一个用户（并行策略下可能同时联系多位）
+    next_coordinations = coordination_result.get('next_coordinations', [])
+    if 'next_coordination' in coordination_result:
+        next_coordinations = [coordination_result['next_coordination']]
+    for next_coord in next_coordinations:
+        emit_to_user(next_coord['user_id'], 'coordination_message', {
+            'target_user_id': next_coord['user_id'],
+            'message': next_coord['message'],
+            'type': 'assistant'
+        })
+    
+    # 如果所有人都确认了，发送最终通知（状态机保证只通知一次）
+    if 'finalize_meeting' in coordination_result and claim_finalization(session):
+        final_info = coordination_result['finalize_meeting']
+        record_final_meeting(session, final_info['final_time'])
+        # 使用会话的 notification_agent 生成通知
+        notification = build_notification(session, final_info['participants'], final_info['final_time'])
+        
+        # 发送通知给所有参与者
+        for participant in final_info['participants']:
+            user_id = session.strategy_agent._get_user_id(participant)
+            if user_id:
+                emit_to_user(user_id, 'coordination_message', {
+                    'target_user_id': user_id,
+                    'message': notification,
+                    'type': 'system'
+                })
+        emit_meeting_status(session, 'confirmed')
 
 @socketio.on('mock_user_message')
-def handle_coordination_reply(data):
+def handle_mock_user_message(data):
     """处理用户对协调消息的回复"""
     try:
         user_id = data.get('user_id')
         message = data.get('message')
         
-        coordination_result = coordination_agent.continue_coordination(message, user_id)
+        session = session_registry.find_by_participant(user_id)
+        if session is None:
+            emit_error_message("当前没有需要您回复的协调。")
+            return
+        
+        stream_id = uuid.uuid4().hex
+        with session_registry.checkout(session):
+            coordination_result = session.coordination_agent.continue_coordination(
+                message,
+                user_id,
+                on_delta=make_delta_emitter(partial(emit_to_user, user_id), stream_id, user_id)
+            )
         if coordination_result:
-            # 发送回复给当前用户
-            socketio.emit('coordination_message', {
-                'target_user_id': coordination_result['user_id'],
-                'message': coordination_result['response'],
-                'type': 'received'
-            })
-            
-            # 如果需要协调下一个用户
-            if 'next_coordination' in coordination_result:
-                next_coord = coordination_result['next_coordination']
-                socketio.emit('coordination_message', {
-                    'target_user_id': next_coord['user_id'],
-                    'message': next_coord['message'],
-                    'type': 'assistant'
-                })
-            
-            # 如果所有人都确认了，发送最终通知
-            if 'finalize_meeting' in coordination_result:
-                final_info = coordination_result['finalize_meeting']
-                # 使用 notification_agent 生成通知
-                notification = notification_agent.notify_participants({
-                    'title': strategy_agent.current_meeting_info['title'],
-                    'participants': final_info['participants'],
-                    'time': final_info['final_time'],
-                    'description': strategy_agent.current_meeting_info['description']
-                })
-                
-                # 发送通知给所有参与者
-                for participant in final_info['participants']:
-                    user_id = strategy_agent._get_user_id(participant)
-                    if user_id:
-                        socketio.emit('coordination_message', {
-                            'target_user_id': user_id,
-                            'message': notification,
-                            'type': 'system'
-                        })
+            deliver_coordination_result(session, coordination_result, stream_id)
             
+    except StateConflict as e:
+        handle_state_conflict(e)
     except Exception as e:
         logger.error(f"处理协调回复失败: {str(e)}")
         logger.error("错误详情: ", exc_info=True)
         emit_error_message("抱歉，处理您的请求时出现错误。")
 
-def emit_system_message(message):
+def run_batch_schedule(data):
+    """解析批量排会请求参数并求解"""
+    meetings = data.get('meetings')
+    if not isinstance(meetings, list) or not meetings:
+        raise ValueError("meetings 必须是非空列表")
+    options = data.get('options', {})
+    return batch_scheduler.schedule(
+        meetings,
+        commit=options.get('commit', True),
+        notify=options.get('notify', True),
+        buffer_minutes=int(options.get('buffer_minutes', 0)),
+        work_hours=tuple(options.get('work_hours', (9, 18)))
+    )
+
+@socketio.on('batch_schedule')
+def handle_batch_schedule(data):
+    """批量排会：返回结果给请求方，并把通知推送给各参与者"""
+    try:
+        result = run_batch_schedule(data or {})
+        emit('batch_schedule_result', result)
+        for meeting in result['meetings']:
+            if meeting.get('notification'):
+                for user_id in meeting['participants']:
+                    emit_to_user(user_id, 'coordination_message', {
+                        'target_user_id': user_id,
+                        'message': meeting['notification'],
+                        'type': 'system'
+                    })
+    except ValueError as e:
+        emit_error_message(f"批量排会请求无效: {str(e)}")
+    except Exception as e:
+        handle_error("批量排会失败", e)
+
+def reply_target(to=None):
+    """消息的接收房间：未指定时为当前事件的发送方连接"""
+    if to is None and has_request_context():
+        to = request.sid
+    if to is None:
+        raise ValueError("后台任务发送消息必须指定接收方")
+    return to
+
+def emit_system_message(message, to=None):
     """发送系统消息"""
     socketio.emit('message', {
         'message': message,
         'type': 'system',
         'timestamp': datetime.now().isoformat()
-    })
+    }, to=reply_target(to))
 
-def emit_error_message(message):
+def emit_error_message(message, to=None):
     """发送错误消息"""
     socketio.emit('message', {
         'message': message,
         'type': 'error',
         'timestamp': datetime.now().isoformat()
-    })
+    }, to=reply_target(to))
 
-def handle_error(error_msg, exception):
+def handle_error(error_msg, exception, to=None):
     """统一的错误处理"""
     logger.error(f"{error_msg}: {str(exception)}")
     logger.error("错误详情: ", exc_info=True)
-    emit_error_message("抱歉，处理您的请求时出现错误。")
+    emit_error_message("抱歉，处理您的请求时出现错误。", to=to)
+
+def handle_state_conflict(exception):
+    """会话状态在处理期间被其他实例更新，本次修改已丢弃"""
+    logger.warning(f"共享会话状态冲突: {str(exception)}")
+    emit_error_message("会话状态已被其他请求更新，请重新发送消息。")
 
 @app.route('/end_dialogue', methods=['POST'])
 def end_dialogue():
@@ -345,10 +583,17 @@ def end_dialogue():
         data = request.json
         chat_type = data.get('type', 'user_initiated')
         
+        session = session_registry.get(data.get('session_id'), create=False)
+        if session is None:
+            return jsonify({
+                'response': '会话不存在或已过期。',
+                'status': 'error'
+            }), 404
+        
         if chat_type == 'user_initiated':
-            summary = dialogue_agent.summarize_with_llm()
+            summary = session.dialogue_agent.summarize_with_llm()
         else:
-            summary = coordination_agent.summarize_coordination()
+            summary = session.coordination_agent.summarize_coordination()
             
         return jsonify({
             'summary': summary,
@@ -362,40 +607,123 @@ def end_dialogue():
             'status': 'error'
         }), 500
 
+@app.route('/api/schedule/batch', methods=['POST'])
+def batch_schedule():
+    """批量排会：一次安排多个会议，同一批次内不会重复占用参与者的时间"""
+    try:
+        return jsonify(run_batch_schedule(request.json or {}))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"批量排会失败: {str(e)}")
+        return jsonify({'error': '批量排会失败'}), 500
+
+def request_user_id():
+    """调用方的用户ID：请求头 X-User-Id，或查询参数 user_id"""
+    return request.headers.get('X-User-Id') or request.args.get('user_id')
+
+def load_meeting_for(meeting_id, user_id, organizer_only=False):
+    """
+    读取会议并检查访问权限：发起人可以读写，参与者只能读取
+    返回 (会议, None)，或 (None, 错误响应)
+    """
+    if not user_id:
+        return None, (jsonify({'error': '缺少用户ID（X-User-Id）'}), 401)
+    meeting = meeting_store.get_meeting(meeting_id)
+    if not meeting:
+        return None, (jsonify({'error': '会议不存在'}), 404)
+    if user_id != meeting['organizer_id'] and (organizer_only or user_id not in meeting['participants']):
+        return None, (jsonify({'error': '没有权限访问该会议'}), 403)
+    return meeting, None
+
+@app.route('/api/meetings', methods=['GET'])
+def list_meetings():
+    """列出调用方组织或参与的会议"""
+    user_id = request_user_id()
+    if not user_id:
+        return jsonify({'error': '缺少用户ID（X-User-Id）'}), 401
+    return jsonify(meeting_store.list_meetings(user_id))
+
+@app.route('/api/meetings', methods=['POST'])
+def create_meeting():
+    """创建会议，调用方为发起人"""
+    user_id = request_user_id()
+    if not user_id:
+        return jsonify({'error': '缺少用户ID（X-User-Id）'}), 401
+    data = request.json or {}
+    if not data.get('title'):
+        return jsonify({'error': '会议主题不能为空'}), 400
+    try:
+        meeting = meeting_store.create_meeting(
+            user_id,
+            title=data['title'],
+            description=data.get('description', ''),
+            participants=data.get('participants', []),
+            status=data.get('status', 'pending'),
+            start_time=data.get('start_time'),
+            end_time=data.get('end_time'),
+            data=data.get('data')
+        )
+        return jsonify(meeting), 201
+    except Exception as e:
+        logger.error(f"创建会议失败: {str(e)}")
+        return jsonify({'error': '创建会议失败'}), 500
+
+@app.route('/api/meetings/<int:meeting_id>', methods=['GET'])
+def get_meeting(meeting_id):
+    """会议详情，发起人和参与者可以读取"""
+    meeting, error = load_meeting_for(meeting_id, request_user_id())
+    return error or jsonify(meeting)
+
+@app.route('/api/meetings/<int:meeting_id>', methods=['PUT'])
+def update_meeting(meeting_id):
+    """修改会议安排，只有发起人可以修改"""
+    _, error = load_meeting_for(meeting_id, request_user_id(), organizer_only=True)
+    if error:
+        return error
+    try:
+        return jsonify(meeting_store.update_meeting(meeting_id, **(request.json or {})))
+    except Exception as e:
+        logger.error(f"修改会议失败: {str(e)}")
+        return jsonify({'error': '修改会议失败'}), 500
+
+@app.route('/api/meetings/<int:meeting_id>', methods=['DELETE'])
+def delete_meeting(meeting_id):
+    """删除会议，只有发起人可以删除"""
+    _, error = load_meeting_for(meeting_id, request_user_id(), organizer_only=True)
+    if error:
+        return error
+    meeting_store.delete_meeting(meeting_id)
+    return jsonify({'success': True})
+
 @app.route('/api/mock/users', methods=['GET'])
 def get_mock_users():
     return jsonify(list(mock_users.values()))
 
 @app.route('/api/mock/conversation/<user_id>', methods=['GET', 'POST'])
 def handle_mock_conversation(user_id):
-    """处理模拟用户的对话"""
+    """
+    处理模拟用户的对话
+    GET ?after=<序号>&limit=N 返回序号大于 after 的消息，不带 after 时返回最近的 limit 条；
+    轮询时把上次返回的 next_cursor 作为 after，只取新消息
+    """
     try:
-        global mock_conversations
-        
         if request.method == 'GET':
-            # 确保用户的对话历史存在
-            if user_id not in mock_conversations:
-                mock_conversations[user_id] = []
-            
-            # 记录当前对话历史
-            logger.info(f"\n{'='*50}\n获取用户 {user_id} 的对话历史:\n{json.dumps(mock_conversations[user_id], ensure_ascii=False, indent=2)}\n{'='*50}")
-            
-            return jsonify(mock_conversations.get(user_id, []))
+            limit = request.args.get('limit', 50, type=int)
+            after = request.args.get('after', type=int)
+            if after is None:
+                page = conversation_history.latest(user_id, limit)
+            else:
+                page = conversation_history.page(user_id, after, limit)
+            logger.debug(f"获取用户 {user_id} 的对话历史，返回 {len(page['messages'])} 条")
+            return jsonify(page)
             
         elif request.method == 'POST':
-            data = request.json
-            if user_id not in mock_conversations:
-                mock_conversations[user_id] = []
-            
-            # 添加时间戳
-            message_data = {
-                **data,
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id
-            }
-            
-            mock_conversations[user_id].append(message_data)
-            logger.info(f"\n{'='*50}\n添加消息到用户 {user_id} 的对话:\n消息内容: {json.dumps(message_data, ensure_ascii=False, indent=2)}\n当前对话历史: {json.dumps(mock_conversations[user_id], ensure_ascii=False, indent=2)}\n{'='*50}")
+            message_data = conversation_history.append(user_id, request.json or {})
+            logger.info(
+                f"添加消息到用户 {user_id} 的对话，序号 {message_data['seq']}",
+                extra={'category': 'mock_conversation', 'user_id': user_id}
+            )
             
             return jsonify({"status": "success", "message": message_data})
             
@@ -403,6 +731,14 @@ def handle_mock_conversation(user_id):
         logger.error(f"处理模拟对话失败: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/mock/users/resolve', methods=['GET'])
+def resolve_mock_user():
+    """按姓名或称呼查找用户（如 ?name=张总）"""
+    user = mock_users.find_user(request.args.get('name', ''))
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(user)
+
 @app.route('/api/mock/users/<user_id>/schedule', methods=['GET'])
 def get_user_schedule(user_id):
     user = mock_users.get(user_id)
@@ -412,6 +748,10 @@ def get_user_schedule(user_id):
 
 def check_environment():
     """检查环境配置"""
+    # 模拟 LLM 后端不需要 API key
+    if os.getenv('LLM_SERVICE') == 'mock':
+        return
+    
     # 检查必需的环境变量
     required_vars = ['DEEPSEEK_API_KEY']
     for var in required_vars:
@@ -422,16 +762,95 @@ def check_environment():
     if not verify_environment():
         raise EnvironmentError("Failed to verify DeepSeek API key")
 
+@app.route('/api/llm/cache', methods=['GET'])
+def get_llm_cache_stats():
+    """LLM 响应缓存的命中统计"""
+    return jsonify(llm_service.cache.stats())
+
+@app.route('/api/llm/scheduler', methods=['GET'])
+def get_llm_scheduler_stats():
+    """LLM 请求调度器的排队、限速和合并统计"""
+    return jsonify(llm_service.scheduler.stats())
+
+@app.route('/api/llm/prompts', methods=['GET'])
+def get_prompt_templates():
+    """各提示词模板可被服务商缓存的静态前缀长度"""
+    return jsonify(prompt_cache_report())
+
+@app.route('/api/llm/router', methods=['GET'])
+def get_llm_router_stats():
+    """各 LLM 端点的延迟、错误率和健康状况"""
+    return jsonify(llm_service.router.stats())
+
+@app.route('/api/mock/conversations/stats', methods=['GET'])
+def get_conversation_history_stats():
+    """对话历史的缓存命中、归档和序号冲突统计"""
+    return jsonify(conversation_history.cache_stats())
+
+@app.route('/api/speculation', methods=['GET'])
+def get_speculation_stats():
+    """推测执行的启动、提交和取消次数"""
+    return jsonify(speculation_manager.speculation_stats())
+
+@app.route('/api/presence', methods=['GET'])
+def get_presence():
+    """本实例上在线的用户，?user_id= 时只返回该用户是否在线"""
+    user_id = request.args.get('user_id')
+    if user_id:
+        return jsonify({'user_id': user_id, 'online': presence.is_online(user_id)})
+    return jsonify({**presence.stats(), 'users': presence.online_users()})
+
+@app.route('/api/coordinations', methods=['GET'])
+def list_coordinations():
+    """排队中和运行中的协调任务，history=1 时包含最近结束的任务"""
+    include_finished = request.args.get('history') == '1'
+    return jsonify({
+        'stats': coordination_pool.stats(),
+        'jobs': coordination_pool.list_jobs(include_finished=include_finished)
+    })
+
+@app.route('/api/coordinations/<job_id>', methods=['GET'])
+def get_coordination(job_id):
+    """单个协调任务的状态"""
+    job = coordination_pool.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/coordinations/<job_id>/cancel', methods=['POST'])
+def cancel_coordination(job_id):
+    """取消排队中或运行中的协调任务"""
+    if not coordination_pool.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify(coordination_pool.get(job_id).to_dict())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 格式的 LLM 调用指标"""
+    return Response(metrics_registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/meetings/<meeting_id>', methods=['GET'])
+def get_meeting_metrics(meeting_id):
+    """
+    单个会议按 agent 和提示词模板划分的 token 与耗时明细
+    meeting_id 为 /api/meetings 中的会议ID；尚未开始协调的会话按会话ID（发起人 sid）查询
+    """
+    breakdown = metrics_registry.meeting_breakdown(meeting_id)
+    if breakdown is None:
+        return jsonify({'error': 'Meeting not found'}), 404
+    return jsonify(breakdown)
+
+@app.route('/api/logging', methods=['GET'])
+def get_logging_stats():
+    """异步日志队列的积压、丢弃和采样统计"""
+    return jsonify(logging_stats())
+
 @app.route('/health')
 def health_check():
     return jsonify({"status": "ok", "port": 5002})
 
 if __name__ == '__main__':
     try:
-        # 确保日志目录存在
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-            
         # 检查环境配置
         check_environment()
         logger.info("Environment check passed, starting server...")
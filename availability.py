@@ -0,0 +1,247 @@
+"""
+空闲时间计算模块
+每个用户的日程用有序区间数组索引，N 个用户的空闲时间求交得到共同可用时段；
+大规模参与者时使用按 15 分钟分桶的位图（有 NumPy 时向量化计算）
+"""
+import bisect
+import logging
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，缺失时位图模式退化为纯 Python 实现
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 默认分桶粒度
+BUCKET_MINUTES = 15
+
+# 参与者数量达到该值时 auto 模式改用位图求解
+BITMAP_THRESHOLD = 20
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class IntervalIndex:
+    """有序、互不重叠的时间区间数组，插入时自动合并，查询为 O(log n)"""
+    def __init__(self, intervals=None):
+        self._starts = []
+        self._ends = []
+        for start, end in intervals or []:
+            self.add(start, end)
+
+    def add(self, start, end):
+        """插入区间 [start, end)，与已有区间重叠或相邻时合并"""
+        start, end = _to_datetime(start), _to_datetime(end)
+        if end <= start:
+            return
+        # 找到所有与新区间重叠或相邻的区间
+        left = bisect.bisect_left(self._ends, start)
+        right = bisect.bisect_right(self._starts, end)
+        if left < right:
+            start = min(start, self._starts[left])
+            end = max(end, self._ends[right - 1])
+        self._starts[left:right] = [start]
+        self._ends[left:right] = [end]
+
+    def overlaps(self, start, end):
+        """判断 [start, end) 是否与任一区间重叠"""
+        start, end = _to_datetime(start), _to_datetime(end)
+        position = bisect.bisect_right(self._ends, start)
+        return position < len(self._starts) and self._starts[position] < end
+
+    def between(self, range_start, range_end):
+        """返回与 [range_start, range_end) 相交的区间（已裁剪到范围内）"""
+        left = bisect.bisect_right(self._ends, range_start)
+        right = bisect.bisect_left(self._starts, range_end)
+        return [
+            (max(self._starts[i], range_start), min(self._ends[i], range_end))
+            for i in range(left, right)
+        ]
+
+    def complement(self, range_start, range_end):
+        """返回 [range_start, range_end) 内不被任何区间覆盖的部分"""
+        free = []
+        cursor = range_start
+        for start, end in self.between(range_start, range_end):
+            if start > cursor:
+                free.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < range_end:
+            free.append((cursor, range_end))
+        return free
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self):
+        return len(self._starts)
+
+
+def build_busy_index(schedule):
+    """根据 mock_users 的 schedule 列表（含 start/end）构建忙碌区间索引"""
+    index = IntervalIndex()
+    for item in schedule or []:
+        try:
+            index.add(item['start'], item['end'])
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"忽略无法解析的日程: {item}")
+    return index
+
+
+def intersect_intervals(first, second):
+    """两个有序区间列表求交"""
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def working_windows(range_start, range_end, work_hours=(9, 18), workday_only=True):
+    """范围内每天的工作时间窗口"""
+    windows = []
+    day = range_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < range_end:
+        if not workday_only or day.weekday() < 5:
+            start = max(day.replace(hour=work_hours[0]), range_start)
+            end = min(day.replace(hour=work_hours[1]), range_end)
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+
+def _align(moment, step):
+    """向上对齐到 step 的整数倍"""
+    base = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = (moment - base) % step
+    return moment if not offset else moment + (step - offset)
+
+
+def _slots_from_free(free, duration, step, k):
+    """从共同空闲区间中按时间顺序取出前 k 个互不重叠的对齐时段"""
+    slots = []
+    for start, end in free:
+        slot_start = _align(start, step)
+        while slot_start + duration <= end:
+            slots.append((slot_start, slot_start + duration))
+            if len(slots) >= k:
+                return slots
+            slot_start += duration
+    return slots
+
+
+def find_common_slots_sorted(busy_indexes, duration, range_start, range_end, k=3,
+                             step=timedelta(minutes=BUCKET_MINUTES), work_hours=(9, 18),
+                             workday_only=True, available_indexes=None):
+    """有序区间求交：逐个参与者把空闲时间与当前结果求交"""
+    free = working_windows(range_start, range_end, work_hours, workday_only)
+    for position, busy in enumerate(busy_indexes):
+        user_free = busy.complement(range_start, range_end)
+        if available_indexes and available_indexes[position] is not None:
+            user_free = intersect_intervals(user_free, available_indexes[position].between(range_start, range_end))
+        free = intersect_intervals(free, user_free)
+        if not free:
+            break
+    return _slots_from_free(free, duration, step, k)
+
+
+class BitmapAvailability:
+    """按固定粒度分桶的空闲位图，True 表示空闲"""
+    def __init__(self, range_start, range_end, bucket_minutes=BUCKET_MINUTES):
+        self.range_start = range_start
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.size = max(int((range_end - range_start) / self.bucket), 0)
+
+    def _bucket_range(self, start, end):
+        first = max(int((start - self.range_start) / self.bucket), 0)
+        last = min(-(-int((end - self.range_start).total_seconds()) // int(self.bucket.total_seconds())), self.size)
+        return first, last
+
+    def empty(self):
+        return np.zeros(self.size, dtype=bool) if np is not None else [False] * self.size
+
+    def full(self):
+        return np.ones(self.size, dtype=bool) if np is not None else [True] * self.size
+
+    def from_intervals(self, intervals, value):
+        """把区间列表写入位图：value=True 标记空闲，False 标记忙碌"""
+        bitmap = self.empty() if value else self.full()
+        for start, end in intervals:
+            first, last = self._bucket_range(start, end)
+            if first < last:
+                bitmap[first:last] = [value] * (last - first) if np is None else value
+        return bitmap
+
+    def intersect(self, bitmaps):
+        """多个位图按位与"""
+        if np is not None:
+            return np.logical_and.reduce(bitmaps) if bitmaps else self.full()
+        result = self.full()
+        for bitmap in bitmaps:
+            result = [a and b for a, b in zip(result, bitmap)]
+        return result
+
+    def runs(self, bitmap):
+        """返回连续空闲的区间"""
+        if np is not None:
+            padded = np.concatenate(([False], bitmap, [False]))
+            edges = np.flatnonzero(padded[1:] != padded[:-1])
+            pairs = zip(edges[0::2], edges[1::2])
+        else:
+            pairs, start = [], None
+            for position, free in enumerate(list(bitmap) + [False]):
+                if free and start is None:
+                    start = position
+                elif not free and start is not None:
+                    pairs.append((start, position))
+                    start = None
+        return [
+            (self.range_start + int(first) * self.bucket, self.range_start + int(last) * self.bucket)
+            for first, last in pairs
+        ]
+
+
+def find_common_slots_bitmap(busy_indexes, duration, range_start, range_end, k=3,
+                             step=timedelta(minutes=BUCKET_MINUTES), work_hours=(9, 18),
+                             workday_only=True, available_indexes=None):
+    """位图求交：适合参与者很多的场景"""
+    bitmap = BitmapAvailability(range_start, range_end, int(step.total_seconds() // 60))
+    layers = [bitmap.from_intervals(working_windows(range_start, range_end, work_hours, workday_only), True)]
+    for position, busy in enumerate(busy_indexes):
+        layers.append(bitmap.from_intervals(busy.between(range_start, range_end), False))
+        if available_indexes and available_indexes[position] is not None:
+            layers.append(bitmap.from_intervals(available_indexes[position].between(range_start, range_end), True))
+    return _slots_from_free(bitmap.runs(bitmap.intersect(layers)), duration, step, k)
+
+
+def find_common_slots(busy_indexes, duration, range_start, range_end, k=3, mode='auto', **kwargs):
+    """
+    计算所有参与者共同空闲的前 k 个时段
+    mode: sorted（有序区间求交）、bitmap（位图）或 auto（按参与者数量自动选择）
+    """
+    if mode == 'auto':
+        mode = 'bitmap' if len(busy_indexes) >= BITMAP_THRESHOLD else 'sorted'
+    if mode == 'bitmap':
+        return find_common_slots_bitmap(busy_indexes, duration, range_start, range_end, k, **kwargs)
+    return find_common_slots_sorted(busy_indexes, duration, range_start, range_end, k, **kwargs)
+
+
+def format_slots(slots):
+    """把候选时段格式化为提示词和回复中使用的文本"""
+    return '；'.join(
+        f"{start.strftime('%m月%d日 %H:%M')}-{end.strftime('%H:%M')}" for start, end in slots
+    ) or '暂无共同空闲时间'
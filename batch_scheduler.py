@@ -0,0 +1,259 @@
+"""
+批量排会模块
+一次请求安排多个会议：按优先级和约束程度排序后贪心放置，每放下一个会议就把时段记入
+参与者本批次的忙碌索引，保证同一批次内不会重复占用同一个人的时间；
+不需要逐个对话协调，LLM 只用于分批生成通知文案
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from agents import NotificationAgent
+from availability import build_busy_index, find_common_slots, BUCKET_MINUTES
+from models import mock_users
+from storage import meeting_store
+from time_parser import parse_duration, resolve_time_range, format_duration
+
+logger = logging.getLogger(__name__)
+
+# 职位优先级（与 STRATEGY_PROMPT 的规则一致）：客户/外部专家 > 总经理/CEO > 部门经理 > 普通员工
+ROLE_RANKS = (
+    ('客户', 4), ('外部专家', 4),
+    ('CEO', 3), ('总经理', 3), ('总裁', 3),
+    ('总监', 2), ('部门经理', 2), ('部门主管', 2), ('经理', 2), ('主管', 2)
+)
+
+# 会议类型对应的主协调人角色：面试以面试官为主，培训以讲师为主，项目会议以项目负责人为主
+MEETING_TYPE_ROLES = {
+    '面试': '面试官',
+    '培训': '讲师',
+    '项目会议': '项目负责人'
+}
+
+# 每次 LLM 调用生成通知的会议数
+NOTIFICATION_BATCH_SIZE = int(os.getenv('BATCH_NOTIFICATION_SIZE', 10))
+
+
+def role_rank(user_id):
+    role = mock_users.get(user_id, {}).get('role', '')
+    for keyword, rank in ROLE_RANKS:
+        if keyword in role:
+            return rank
+    return 1
+
+
+def choose_main_coordinator(meeting_type, participant_ids, explicit=None, organizer=None):
+    """
+    按 STRATEGY_PROMPT 的协调优先级规则确定主协调人：
+    明确指定 > 会议类型对应的角色 > 其他会议以发起人为主 > 职位最高者（同级按列表顺序）
+    """
+    if explicit in participant_ids:
+        return explicit
+    role_keyword = MEETING_TYPE_ROLES.get(meeting_type)
+    if role_keyword:
+        for user_id in participant_ids:
+            if role_keyword in mock_users.get(user_id, {}).get('role', ''):
+                return user_id
+    if meeting_type in (None, '', '其他') and organizer in participant_ids:
+        return organizer
+    return max(participant_ids, key=lambda user_id: (role_rank(user_id), -participant_ids.index(user_id)))
+
+
+def _parse_window(value, now):
+    """时间范围可以是"下周"之类的文本，也可以是 {"start": ..., "end": ...}"""
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['start']), datetime.fromisoformat(value['end'])
+    return resolve_time_range(value, now)
+
+
+class MeetingRequest:
+    """批量请求中的单个会议"""
+    def __init__(self, data, position, now):
+        self.id = str(data.get('id') or f"m{position + 1}")
+        self.title = data.get('title', '')
+        self.description = data.get('description', '')
+        self.meeting_type = data.get('meeting_type')
+        self.priority = int(data.get('priority', 0))
+        self.position = position
+        self.names = list(data.get('participants', []))
+        self.participant_ids = []
+        self.unknown = []
+        for name in self.names:
+            user_id = mock_users.resolve(name)
+            if user_id is None:
+                self.unknown.append(name)
+            elif user_id not in self.participant_ids:
+                self.participant_ids.append(user_id)
+        duration = data.get('duration', 60)
+        self.duration = timedelta(minutes=duration if isinstance(duration, (int, float)) else parse_duration(duration))
+        self.range_start, self.range_end = _parse_window(data.get('time_range'), now)
+        self.workday_only = data.get('workday_only', True)
+        self.main_coordinator = None
+        if self.participant_ids:
+            self.main_coordinator = choose_main_coordinator(
+                self.meeting_type,
+                self.participant_ids,
+                explicit=mock_users.resolve(data['main_coordinator']) if data.get('main_coordinator') else None,
+                organizer=mock_users.resolve(data['organizer']) if data.get('organizer') else None
+            )
+
+    def sort_key(self):
+        """
+        优先级高的先放；同优先级时约束最多的先放（人多、时长长、窗口窄），
+        主协调人职位高的先放，最后按提交顺序
+        """
+        window_hours = (self.range_end - self.range_start).total_seconds() / 3600
+        return (
+            -self.priority,
+            -len(self.participant_ids),
+            -self.duration.total_seconds(),
+            window_hours,
+            -role_rank(self.main_coordinator) if self.main_coordinator else 0,
+            self.position
+        )
+
+
+class BatchScheduler:
+    """联合求解一批会议并生成通知"""
+    def __init__(self, notification_agent=None, max_notification_workers=4):
+        self.notification_agent = notification_agent or NotificationAgent("批量通知助手")
+        self.max_notification_workers = max_notification_workers
+        # 同一时间只允许一个批次写入日程，避免两个批次互相重复占用
+        self._lock = threading.Lock()
+
+    def schedule(self, meetings, commit=True, notify=True, buffer_minutes=0, work_hours=(9, 18), now=None):
+        """
+        安排一批会议，返回每个会议的结果（按提交顺序）
+        commit=True 时把结果写入参与者日程和会议记录，notify=True 时生成通知
+        """
+        now = now or datetime.now()
+        batch_id = uuid.uuid4().hex
+        requests = [MeetingRequest(data, position, now) for position, data in enumerate(meetings)]
+        if len({request.id for request in requests}) != len(requests):
+            raise ValueError("会议ID重复")
+        step = timedelta(minutes=BUCKET_MINUTES)
+        buffer = timedelta(minutes=buffer_minutes)
+
+        with self._lock:
+            busy = {}  # 本批次内的忙碌索引，放置会议后立即更新
+            results = {}
+            for request in sorted(requests, key=MeetingRequest.sort_key):
+                results[request.id] = self._place(request, busy, step, buffer, work_hours)
+            if commit:
+                self._commit(batch_id, requests, results)
+
+        ordered = [results[request.id] for request in requests]
+        if notify:
+            self._attach_notifications(requests, ordered)
+        scheduled = sum(1 for result in ordered if result['status'] == 'scheduled')
+        logger.info(f"批量排会 {batch_id}: {scheduled}/{len(ordered)} 个会议已安排")
+        return {
+            'batch_id': batch_id,
+            'scheduled': scheduled,
+            'unscheduled': len(ordered) - scheduled,
+            'meetings': ordered
+        }
+
+    def _place(self, request, busy, step, buffer, work_hours):
+        result = {
+            'id': request.id,
+            'title': request.title,
+            'participants': request.participant_ids,
+            'main_coordinator': request.main_coordinator,
+            'duration': format_duration(int(request.duration.total_seconds() // 60)),
+            'status': 'unscheduled'
+        }
+        if request.unknown:
+            result['reason'] = f"找不到参与者: {'、'.join(request.unknown)}"
+            return result
+        if not request.participant_ids:
+            result['reason'] = '没有参与者'
+            return result
+
+        for user_id in request.participant_ids:
+            if user_id not in busy:
+                busy[user_id] = build_busy_index(mock_users.get(user_id, {}).get('schedule', []))
+        slots = find_common_slots(
+            [busy[user_id] for user_id in request.participant_ids],
+            request.duration,
+            request.range_start,
+            request.range_end,
+            k=1,
+            step=step,
+            work_hours=work_hours,
+            workday_only=request.workday_only
+        )
+        if not slots:
+            result['reason'] = '时间范围内没有所有人共同空闲的时段'
+            return result
+
+        start, end = slots[0]
+        for user_id in request.participant_ids:
+            busy[user_id].add(start, end + buffer)
+        result.update({'status': 'scheduled', 'start_time': start.isoformat(), 'end_time': end.isoformat()})
+        return result
+
+    def _commit(self, batch_id, requests, results):
+        """写入参与者日程和会议记录"""
+        for request in requests:
+            result = results[request.id]
+            if result['status'] != 'scheduled':
+                continue
+            booking = {'start': result['start_time'], 'end': result['end_time'], 'title': request.title}
+            for user_id in request.participant_ids:
+                user = mock_users[user_id]
+                # 重新赋值日程列表，日程长度变化会让各 agent 的忙碌索引缓存失效
+                user['schedule'] = list(user.get('schedule', [])) + [booking]
+            try:
+                result['meeting_id'] = meeting_store.create_meeting(
+                    request.main_coordinator,
+                    title=request.title,
+                    description=request.description,
+                    participants=request.participant_ids,
+                    status='confirmed',
+                    start_time=result['start_time'],
+                    end_time=result['end_time'],
+                    data={'batch_id': batch_id, 'meeting_type': request.meeting_type}
+                )['id']
+            except Exception as e:
+                logger.error(f"写入会议记录失败: {str(e)}")
+
+    def _attach_notifications(self, requests, results):
+        """按批次调用 LLM 生成通知，失败或缺失的会议使用固定格式的通知"""
+        by_id = {request.id: request for request in requests}
+        results_by_id = {result['id']: result for result in results}
+        scheduled = [
+            {
+                'id': result['id'],
+                'title': result['title'],
+                'participants': [mock_users.get(user_id, {}).get('name', user_id) for user_id in result['participants']],
+                'main_coordinator': mock_users.get(result['main_coordinator'], {}).get('name', result['main_coordinator']),
+                'time': {'start_time': result['start_time'], 'end_time': result['end_time']},
+                'description': by_id[result['id']].description
+            }
+            for result in results if result['status'] == 'scheduled'
+        ]
+        chunks = [scheduled[i:i + NOTIFICATION_BATCH_SIZE] for i in range(0, len(scheduled), NOTIFICATION_BATCH_SIZE)]
+        messages = {}
+        if chunks:
+            with ThreadPoolExecutor(max_workers=min(self.max_notification_workers, len(chunks))) as executor:
+                for chunk_messages in executor.map(self.notification_agent.notify_batch, chunks):
+                    messages.update(chunk_messages)
+
+        for meeting in scheduled:
+            results_by_id[meeting['id']]['notification'] = messages.get(meeting['id']) or self._fallback_notification(meeting)
+
+    def _fallback_notification(self, meeting):
+        start = datetime.fromisoformat(meeting['time']['start_time'])
+        end = datetime.fromisoformat(meeting['time']['end_time'])
+        return (
+            f"会议通知：「{meeting['title']}」定于{start.strftime('%m月%d日 %H:%M')}-{end.strftime('%H:%M')}，"
+            f"参与人：{'、'.join(meeting['participants'])}。{meeting['description']}感谢各位的配合。"
+        )
+
+
+# 创建全局批量排会实例
+batch_scheduler = BatchScheduler()
@@ -0,0 +1,359 @@
+"""
+端到端压测脚本
+使用模拟 LLM 后端（LLM_SERVICE=mock），通过 Socket.IO 测试客户端驱动 chat_message / mock_user_message 处理函数，
+并发模拟 N 个会议发起人及其参与者完成整个协调流程，
+输出每秒完成的会议数、各阶段 p50/p95/p99 延迟和每个会议的 LLM 调用次数
+
+用法：
+    python benchmark.py --meetings 50 --concurrency 10 --participants 3 --latency lognormal:0.3:0.5
+
+--io-check N 检查 gevent 下 LLM 调用是否为协作式 I/O：启动一个本地的 OpenAI 兼容服务（每次请求固定延迟），
+通过真实的 openai 客户端同时发起 N 个调用，总耗时应接近单次调用的延迟而不是 N 倍：
+    python benchmark.py --io-check 20 --io-latency 1.0
+"""
+import os
+
+# 与 app.py 相同，在导入其他模块之前打补丁，压测线程和 LLM 请求都运行在协程上
+if os.getenv('GEVENT_MONKEY_PATCH', '1') == '1':
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import json
+import logging
+import math
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Timely.AI 端到端压测')
+    parser.add_argument('--meetings', type=int, default=20, help='模拟的会议总数')
+    parser.add_argument('--concurrency', type=int, default=5, help='同时进行的会议数')
+    parser.add_argument('--participants', type=int, default=3, help='每个会议的参与者数')
+    parser.add_argument('--latency', default='lognormal:0.2:0.5', help='模拟 LLM 的延迟分布，见 mock_llm.LatencyModel')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='流式输出分片之间的间隔（秒）')
+    parser.add_argument('--responses', help='录制回复的 JSON 文件，见 mock_llm.ScriptedResponder')
+    parser.add_argument('--strategy', choices=('sequential', 'parallel'), default='sequential', help='协调策略')
+    parser.add_argument('--timeout', type=float, default=60, help='单个会议的超时时间（秒）')
+    parser.add_argument('--output', help='把结果以 JSON 写入该文件')
+    parser.add_argument('--log-level', default='WARNING', help='压测期间的日志级别')
+    parser.add_argument('--io-check', type=int, metavar='N', help='只检查 N 个并发 LLM 调用是否互不阻塞')
+    parser.add_argument('--io-latency', type=float, default=1.0, help='--io-check 时本地服务每次请求的延迟（秒）')
+    parser.add_argument('--io-tolerance', type=float, default=2.0, help='--io-check 允许的总耗时（单次延迟的倍数）')
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """导入应用之前设置环境变量，使全局 llm_service 和存储层使用压测配置"""
+    os.environ['LLM_SERVICE'] = 'mock'
+    os.environ['MOCK_LLM_LATENCY'] = args.latency
+    os.environ['MOCK_LLM_CHUNK_DELAY'] = str(args.chunk_delay)
+    os.environ['COORDINATION_STRATEGY'] = args.strategy
+    os.environ['COORDINATION_TIMEOUT'] = str(int(args.timeout))
+    # 协调任务池的工作线程数不少于并发会议数，避免压测结果受排队影响
+    os.environ.setdefault('COORDINATION_WORKERS', str(max(args.concurrency, 8)))
+    os.environ.setdefault('COORDINATION_QUEUE_SIZE', str(max(args.meetings, 100)))
+    if args.responses:
+        os.environ['MOCK_LLM_RESPONSES'] = args.responses
+    # 默认使用临时数据库，避免压测数据写入 data/timely.db
+    os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(prefix='timely-bench-'), 'bench.db'))
+
+
+def percentile(values, pct):
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class MeetingSimulation:
+    """一个会议的完整模拟：发起人提出需求，参与者依次回复，直到收到最终通知"""
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, app_module, index, participant_count, timeout):
+        self.app = app_module
+        self.index = index
+        self.timeout = timeout
+        self.participants = {
+            f"bench{index}_{position}": f"成员{index}-{position}号"
+            for position in range(participant_count)
+        }
+        self.timings = {}
+        self.client = None
+
+    def register_users(self):
+        """注册本会议专属的模拟用户，避免不同会议的参与者互相串线"""
+        from models import mock_users
+        for user_id, name in self.participants.items():
+            mock_users[user_id] = {'id': user_id, 'name': name, 'role': '员工', 'schedule': []}
+
+    def unregister_users(self):
+        from models import mock_users
+        for user_id in self.participants:
+            mock_users.pop(user_id, None)
+
+    def _poll(self, predicate, deadline):
+        """收取事件直到 predicate 返回真值"""
+        while time.time() < deadline:
+            result = predicate(self.client.get_received())
+            if result:
+                return result
+            time.sleep(self.POLL_INTERVAL)
+        raise TimeoutError(f"会议 {self.index} 超时")
+
+    def _coordination_events(self, events):
+        for event in events:
+            if event['name'] != 'coordination_message' or not event['args']:
+                continue
+            payload = event['args'][0]
+            if payload.get('target_user_id') in self.participants:
+                yield payload
+
+    def run(self):
+        self.register_users()
+        # 连接时加入本会议参与者的用户房间，只接收发给这些参与者的协调消息
+        self.client = self.app.socketio.test_client(self.app.app, auth={'user_ids': list(self.participants)})
+        try:
+            started = time.time()
+            deadline = started + self.timeout
+            self.client.get_received()
+
+            # 1. 发起人提出会议需求
+            names = '、'.join(self.participants.values())
+            self.client.emit('chat_message', {'message': f"帮我约一下{names}开个项目会", 'user_id': 'main_user'})
+            dialogue_done = time.time()
+            self.timings['dialogue'] = dialogue_done - started
+
+            # 2. 等待发给主协调人的初始协调消息
+            pending = []
+            finalized = False
+
+            def collect(events):
+                nonlocal finalized
+                for payload in self._coordination_events(events):
+                    if payload.get('type') == 'assistant':
+                        pending.append(payload['target_user_id'])
+                    elif payload.get('type') == 'system':
+                        finalized = True
+                return pending or finalized
+
+            self._poll(collect, deadline)
+            self.timings['coordination_start'] = time.time() - dialogue_done
+
+            # 3. 参与者依次回复，直到收到最终通知
+            main_user_id = pending[0] if pending else None
+            session = self.app.session_registry.find_by_participant(main_user_id) if main_user_id else None
+            replied = set()
+            reply_times = []
+            last_reply_done = time.time()
+            while not finalized:
+                while pending:
+                    user_id = pending.pop(0)
+                    if user_id in replied:
+                        continue
+                    replied.add(user_id)
+                    reply_started = time.time()
+                    self.client.emit('mock_user_message', {'user_id': user_id, 'message': '下周二下午3点可以'})
+                    last_reply_done = time.time()
+                    stage = 'main_coordinator_reply' if user_id == main_user_id else 'participant_reply'
+                    reply_times.append((stage, last_reply_done - reply_started))
+                if not finalized:
+                    self._poll(collect, deadline)
+
+            self.timings['finalize'] = time.time() - last_reply_done
+            self.timings['meeting_total'] = time.time() - started
+
+            breakdown = self.app.metrics_registry.meeting_breakdown(session.meeting_id or session.session_id) if session else None
+            return {
+                'timings': self.timings,
+                'replies': reply_times,
+                'llm_calls': breakdown['total']['calls'] if breakdown else 0,
+                'prompt_tokens': breakdown['total']['prompt_tokens'] if breakdown else 0,
+                'completion_tokens': breakdown['total']['completion_tokens'] if breakdown else 0
+            }
+        finally:
+            self.client.disconnect()
+            self.unregister_users()
+
+
+def summarize(results, failures, wall_time):
+    """汇总吞吐量、各阶段分位延迟和 LLM 调用次数"""
+    stages = defaultdict(list)
+    for result in results:
+        for stage, value in result['timings'].items():
+            stages[stage].append(value)
+        for stage, value in result['replies']:
+            stages[stage].append(value)
+
+    def per_meeting(field):
+        return round(sum(result[field] for result in results) / len(results), 2) if results else 0
+
+    return {
+        'meetings_completed': len(results),
+        'meetings_failed': len(failures),
+        'wall_time': round(wall_time, 3),
+        'meetings_per_second': round(len(results) / wall_time, 3) if wall_time else 0,
+        'llm_calls_per_meeting': per_meeting('llm_calls'),
+        'prompt_tokens_per_meeting': per_meeting('prompt_tokens'),
+        'completion_tokens_per_meeting': per_meeting('completion_tokens'),
+        'stages': {
+            stage: {
+                'count': len(values),
+                'p50': round(percentile(values, 50), 4),
+                'p95': round(percentile(values, 95), 4),
+                'p99': round(percentile(values, 99), 4)
+            }
+            for stage, values in stages.items()
+        },
+        'errors': failures[:10]
+    }
+
+
+def print_report(report):
+    print(f"完成会议: {report['meetings_completed']}  失败: {report['meetings_failed']}  耗时: {report['wall_time']}s")
+    print(f"吞吐量: {report['meetings_per_second']} 会议/秒")
+    print(f"每个会议 LLM 调用: {report['llm_calls_per_meeting']} 次，"
+          f"输入 {report['prompt_tokens_per_meeting']} / 输出 {report['completion_tokens_per_meeting']} tokens")
+    print(f"{'阶段':<24}{'次数':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, values in report['stages'].items():
+        print(f"{stage:<24}{values['count']:>8}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}")
+    for error in report['errors']:
+        print(f"错误: {error}")
+
+
+def fake_openai_app(latency):
+    """OpenAI 兼容的 chat completions 接口，每个请求等待 latency 秒后返回固定回复"""
+    def application(environ, start_response):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        request = json.loads(environ['wsgi.input'].read(length) or b'{}')
+        time.sleep(latency)
+        body = json.dumps({
+            'id': 'chatcmpl-io-check',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'io-check'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'OK'}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+        }).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+    return application
+
+
+def measure_io_concurrency(calls, latency):
+    """
+    N 个并发 LLM 调用经过 LLMService（调度器、路由、重试）和真实的 HTTP 传输，
+    同时用一个心跳协程测量事件循环的最长停顿；
+    返回 {'elapsed': 总耗时, 'max_stall': 最长停顿, 'failed': 失败调用数}，标准库未打补丁时返回 None
+    """
+    from gevent import monkey, spawn, sleep as gevent_sleep
+    from gevent.pywsgi import WSGIServer
+
+    if not monkey.is_module_patched('socket'):
+        return None
+
+    server = WSGIServer(('127.0.0.1', 0), fake_openai_app(latency), log=None)
+    server.start()
+    os.environ['LLM_SERVICE'] = 'openai'
+    os.environ['OPENAI_API_KEY'] = 'io-check'
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ['LLM_FAILOVER'] = '0'
+    # 并发上限不少于调用数，检查的是传输层而不是调度器的限流
+    os.environ['LLM_MAX_CONCURRENCY'] = str(calls)
+    os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(prefix='timely-bench-'), 'bench.db'))
+
+    from agents import llm_service
+
+    stalls = []
+    running = True
+
+    def heartbeat():
+        # 每 50ms 醒来一次，实际间隔远大于 50ms 说明有调用阻塞了事件循环
+        last = time.time()
+        while running:
+            gevent_sleep(0.05)
+            now = time.time()
+            stalls.append(now - last - 0.05)
+            last = now
+
+    def call(index):
+        return llm_service.create_completion(
+            [{'role': 'user', 'content': f"io-check {index}"}],
+            labels={'agent': 'io_check', 'template': 'IO_CHECK'}
+        )
+
+    ticker = spawn(heartbeat)
+    started = time.time()
+    replies = []
+    try:
+        with ThreadPoolExecutor(max_workers=calls) as executor:
+            replies = list(executor.map(call, range(calls)))
+    finally:
+        elapsed = time.time() - started
+        running = False
+        ticker.join()
+        server.stop()
+
+    return {
+        'elapsed': elapsed,
+        'max_stall': max(stalls) if stalls else 0.0,
+        'failed': calls - sum(1 for reply in replies if reply)
+    }
+
+
+def run_io_check(args):
+    """总耗时和事件循环停顿都不超标才算通过"""
+    logging.getLogger().setLevel(args.log_level)
+    result = measure_io_concurrency(args.io_check, args.io_latency)
+    if result is None:
+        print("标准库未打 gevent 补丁（GEVENT_MONKEY_PATCH=0），LLM 调用会阻塞事件循环")
+        return 1
+
+    limit = args.io_latency * args.io_tolerance
+    passed = not result['failed'] and result['elapsed'] <= limit and result['max_stall'] <= args.io_latency / 2
+    print(f"并发调用: {args.io_check}，单次延迟: {args.io_latency:.2f}s，总耗时: {result['elapsed']:.2f}s（上限 {limit:.2f}s）")
+    print(f"事件循环最长停顿: {result['max_stall'] * 1000:.0f}ms，失败调用: {result['failed']}")
+    print("通过" if passed else "未通过：LLM 调用没有并发执行")
+    return 0 if passed else 1
+
+
+def main():
+    args = parse_args()
+    if args.io_check:
+        return run_io_check(args)
+    configure_environment(args)
+
+    import app as app_module
+    logging.getLogger().setLevel(args.log_level)
+    for name in ('socketio', 'engineio'):
+        logging.getLogger(name).setLevel(args.log_level)
+
+    results, failures = [], []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(MeetingSimulation(app_module, index, args.participants, args.timeout).run)
+            for index in range(args.meetings)
+        ]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures.append(str(e))
+    report = summarize(results, failures, time.time() - started)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if not failures else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
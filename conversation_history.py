@@ -0,0 +1,158 @@
+"""
+对话历史模块
+每个用户的消息带单调递增的序号，按 ?after=<序号>&limit=N 游标分页读取，轮询只需取新消息；
+最近的消息保存在每个用户的环形缓冲区中，未归档的消息超过上限时最早的一段压缩归档到存储层
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 单页最多返回的消息数
+MAX_PAGE_SIZE = 200
+
+
+class _UserHistory:
+    """单个用户的最新序号、未归档消息数和最近消息的环形缓冲区"""
+    def __init__(self, last_seq, live_count, recent, ring_size):
+        self.last_seq = last_seq
+        self.live_count = live_count
+        self.ring = deque(recent, maxlen=ring_size)
+        self.lock = threading.Lock()
+
+
+class ConversationHistory:
+    """
+    按用户保存对话消息
+    ring_size 为每个用户缓存在内存中的最近消息数，live_limit 为未归档消息数上限，
+    超过上限 segment_size 条时把最早的 segment_size 条压缩为一个归档段，max_segments 限制每个用户保留的归档段数（0 为不限）；
+    shared=True（多实例共享存储）时其他实例也会写入，读取不使用本地缓存
+    """
+    def __init__(self, store, ring_size=200, live_limit=1000, segment_size=500, max_segments=0,
+                 max_cached_users=1000, shared=False):
+        self.store = store
+        self.ring_size = ring_size
+        self.live_limit = max(live_limit, ring_size)
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.max_cached_users = max_cached_users
+        self.shared = shared
+        self._users = OrderedDict()  # 用户ID -> _UserHistory，按最近访问排序
+        self._lock = threading.Lock()
+        self.stats = {'appended': 0, 'cache_reads': 0, 'store_reads': 0, 'archived': 0, 'seq_conflicts': 0}
+
+    def _user(self, user_id):
+        """取用户的缓存状态，不在缓存中时从存储层载入"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                self._users.move_to_end(user_id)
+                return user
+        last_seq, live_count, _ = self.store.message_stats(user_id)
+        user = _UserHistory(last_seq, live_count, self.store.recent_messages(user_id, self.ring_size), self.ring_size)
+        with self._lock:
+            # 并发载入时保留先放入缓存的一份
+            user = self._users.setdefault(user_id, user)
+            while len(self._users) > self.max_cached_users:
+                self._users.popitem(last=False)
+        return user
+
+    def append(self, user_id, message, timestamp=None):
+        """追加一条消息，返回带序号和时间戳的消息"""
+        user = self._user(user_id)
+        with user.lock:
+            record = {**message, 'user_id': user_id, 'timestamp': timestamp or datetime.now().isoformat()}
+            while True:
+                record['seq'] = user.last_seq + 1
+                if self.store.append_message(user_id, record['seq'], {k: v for k, v in record.items() if k != 'seq'}):
+                    break
+                # 序号已被其他实例占用，重新读取最新序号
+                self.stats['seq_conflicts'] += 1
+                user.last_seq, user.live_count, _ = self.store.message_stats(user_id)
+            user.last_seq = record['seq']
+            user.live_count += 1
+            user.ring.append(record)
+            self.stats['appended'] += 1
+
+            if user.live_count >= self.live_limit + self.segment_size:
+                archived = self.store.archive_messages(user_id, self.segment_size, self.max_segments)
+                user.live_count -= archived
+                self.stats['archived'] += archived
+                if archived:
+                    logger.info(f"用户 {user_id} 的 {archived} 条对话已归档")
+        return record
+
+    def page(self, user_id, after=0, limit=50):
+        """
+        序号大于 after 的最多 limit 条消息；
+        返回的 next_cursor 作为下一次请求的 after，has_more 表示还有未取的消息
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        after = max(0, int(after))
+        user = self._user(user_id)
+        with user.lock:
+            ring = list(user.ring)
+            last_seq = user.last_seq
+        if not self.shared and (not ring or after >= ring[0]['seq'] - 1):
+            # 所需的消息都在环形缓冲区中，不访问存储层
+            self.stats['cache_reads'] += 1
+            messages = [message for message in ring if message['seq'] > after][:limit + 1]
+        else:
+            self.stats['store_reads'] += 1
+            messages = self.store.list_messages(user_id, after, limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        return {
+            'messages': messages,
+            'next_cursor': messages[-1]['seq'] if messages else after,
+            'has_more': has_more,
+            'last_seq': max(last_seq, messages[-1]['seq'] if messages else 0)
+        }
+
+    def latest(self, user_id, limit=50):
+        """最近的 limit 条消息，用于首次加载"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        user = self._user(user_id)
+        with user.lock:
+            last_seq = user.last_seq
+        return self.page(user_id, after=max(0, last_seq - limit), limit=limit)
+
+    def import_legacy(self, conversations):
+        """导入旧版按用户保存的完整消息列表，返回导入的条数"""
+        imported = 0
+        for user_id, messages in conversations.items():
+            for message in messages or []:
+                self.append(
+                    user_id,
+                    {k: v for k, v in message.items() if k not in ('user_id', 'seq', 'timestamp')},
+                    timestamp=message.get('timestamp')
+                )
+                imported += 1
+        return imported
+
+    def cache_stats(self):
+        with self._lock:
+            cached_users = len(self._users)
+        return {**self.stats, 'cached_users': cached_users}
+
+
+def create_history(store):
+    """根据环境变量创建对话历史，首次启动时迁移旧版 mock_conversations 中的数据"""
+    history = ConversationHistory(
+        store,
+        ring_size=int(os.getenv('HISTORY_RING_SIZE', 200)),
+        live_limit=int(os.getenv('HISTORY_LIVE_LIMIT', 1000)),
+        segment_size=int(os.getenv('HISTORY_SEGMENT_SIZE', 500)),
+        max_segments=int(os.getenv('HISTORY_MAX_SEGMENTS', 0)),
+        max_cached_users=int(os.getenv('HISTORY_CACHED_USERS', 1000)),
+        shared=os.getenv('SHARED_SESSION_STATE', '0') == '1'
+    )
+    legacy = store.load_namespace('mock_conversations')
+    if legacy:
+        imported = history.import_legacy(legacy)
+        store.delete_namespace('mock_conversations')
+        logger.info(f"已迁移 {imported} 条旧版对话历史")
+    return history
@@ -0,0 +1,288 @@
+"""
+协调任务调度模块
+对话完成后的协调流程作为任务提交到有界队列，由固定数量的工作线程执行
+（gevent monkey patch 后即为协程），队列满时拒绝新任务；
+发出首条协调消息后任务挂起并释放工作线程，等待参与者回复期间不占用工作线程，
+状态变化（wake）、取消、超时或定期轮询时重新排入队列继续推进；
+每个任务支持取消和超时，并可查询运行中、排队中和等待中的任务
+"""
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+WAITING = 'waiting'  # 挂起等待事件，不占用工作线程
+
+ACTIVE_STATES = (QUEUED, RUNNING, WAITING)
+
+
+class CoordinationQueueFull(Exception):
+    """协调任务队列已满"""
+
+
+class CoordinationJob:
+    """一次协调流程"""
+    def __init__(self, session_id, target, args, timeout):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.target = target
+        self.args = args
+        self.timeout = timeout
+        self.status = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.resume = None  # 挂起时登记的恢复函数
+        self.poll_interval = None
+        self.next_poll = None
+        self._pool = None
+        self._cancel_event = threading.Event()
+        self._cancel_callbacks = []
+
+    @property
+    def deadline(self):
+        return (self.started_at or time.time()) + self.timeout
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def expired(self):
+        return time.time() >= self.deadline
+
+    def should_stop(self):
+        """协作式检查：任务被取消或超时后，协调流程应尽快退出"""
+        return self.cancelled or self.expired()
+
+    def suspend(self, resume, poll_interval=None):
+        """
+        当前这一步结束后挂起任务并释放工作线程；
+        wake()、取消、超时或每隔 poll_interval 秒时在工作线程中调用 resume(job)，
+        resume 需要继续等待时再次调用 suspend，否则任务结束
+        """
+        self.resume = resume
+        self.poll_interval = poll_interval
+
+    def wake(self):
+        """通知挂起中的任务有新事件（如参与者状态变化），可以在任意线程中调用"""
+        if self._pool is not None:
+            self._pool.wake(self)
+
+    def on_cancel(self, callback):
+        """注册取消时的回调，用于唤醒阻塞中的等待"""
+        self._cancel_callbacks.append(callback)
+
+    def cancel(self):
+        self._cancel_event.set()
+        self.wake()
+        for callback in list(self._cancel_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行取消回调失败: {str(e)}")
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'session_id': self.session_id,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timeout': self.timeout
+        }
+
+
+class CoordinationJobPool:
+    """
+    有界的协调任务池：固定数量的工作线程 + 有界队列
+    max_queue 只限制新提交的排队任务，挂起后恢复的任务不受限制
+    """
+    def __init__(self, workers=8, max_queue=100, job_timeout=300, history_size=200):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.history_size = history_size
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # job_id -> CoordinationJob，包含最近结束的任务
+        self._waiting = {}  # job_id -> 挂起中的 CoordinationJob
+        self._woken = set()  # 收到 wake 的任务ID（可能在挂起之前）
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._counter = itertools.count(1)
+
+    def _ensure_workers(self):
+        """首次提交任务时启动工作线程"""
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"coordination-worker-{next(self._counter)}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            watcher = threading.Thread(target=self._watch, name='coordination-watcher', daemon=True)
+            watcher.start()
+            self._threads.append(watcher)
+
+    def submit(self, session_id, target, *args, timeout=None):
+        """
+        提交协调任务，target 以 target(*args, job=job) 的形式调用
+        队列已满时抛出 CoordinationQueueFull
+        """
+        self._ensure_workers()
+        job = CoordinationJob(session_id, target, args, timeout or self.job_timeout)
+        job._pool = self
+        with self._lock:
+            queued = sum(1 for item in self._jobs.values() if item.status == QUEUED)
+            if queued >= self.max_queue:
+                raise CoordinationQueueFull(f"协调任务队列已满（{self.max_queue}）")
+            self._jobs[job.job_id] = job
+            self._queue.put_nowait(job)
+        logger.info(f"提交协调任务 {job.job_id}，会话: {session_id}，排队: {self._queue.qsize()}")
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        """执行任务的一步：首次运行 target，挂起后恢复时运行登记的 resume"""
+        resume, job.resume = job.resume, None
+        if resume is None:
+            if job.cancelled:
+                self._finish(job, CANCELLED)
+                return
+            job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            if resume is None:
+                job.target(*job.args, job=job)
+            else:
+                resume(job)
+        except Exception as e:
+            logger.error(f"协调任务 {job.job_id} 失败: {str(e)}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+        if job.resume is not None:
+            self._park(job)
+        elif job.cancelled:
+            self._finish(job, CANCELLED)
+        elif job.expired():
+            self._finish(job, TIMEOUT)
+        else:
+            self._finish(job, COMPLETED)
+
+    def _park(self, job):
+        """挂起任务，由监视线程在收到事件后重新排入队列"""
+        with self._lock:
+            job.status = WAITING
+            job.next_poll = time.time() + job.poll_interval if job.poll_interval else None
+            self._waiting[job.job_id] = job
+        self._wakeup.set()
+
+    def wake(self, job):
+        with self._lock:
+            if job.status in ACTIVE_STATES:
+                self._woken.add(job.job_id)
+        self._wakeup.set()
+
+    def _watch(self):
+        """监视挂起中的任务：收到事件、被取消、到达超时或轮询时间时重新排入队列"""
+        while True:
+            self._wakeup.clear()
+            due = []
+            next_at = None
+            with self._lock:
+                now = time.time()
+                for job_id, job in list(self._waiting.items()):
+                    at = min(job.deadline, job.next_poll or job.deadline)
+                    if job_id in self._woken or job.cancelled or now >= at:
+                        del self._waiting[job_id]
+                        self._woken.discard(job_id)
+                        due.append(job)
+                    else:
+                        next_at = at if next_at is None else min(next_at, at)
+            for job in due:
+                self._queue.put(job)
+            self._wakeup.wait(None if next_at is None else max(next_at - time.time(), 0))
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        logger.info(f"协调任务 {job.job_id} 结束: {status}")
+        with self._lock:
+            self._woken.discard(job.job_id)
+            # 只保留最近结束的若干任务
+            finished = [job_id for job_id, item in self._jobs.items() if item.status not in ACTIVE_STATES]
+            for job_id in finished[:max(len(finished) - self.history_size, 0)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """取消排队中或运行中的任务，返回是否找到了可取消的任务"""
+        job = self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job.cancel()
+        return True
+
+    def cancel_session(self, session_id):
+        """取消某个会话的全部进行中任务"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id and job.status in ACTIVE_STATES]
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def list_jobs(self, include_finished=False):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs if include_finished or job.status in ACTIVE_STATES]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'queued': statuses.count(QUEUED),
+            'running': statuses.count(RUNNING),
+            'waiting': statuses.count(WAITING),
+            'recent_finished': len([status for status in statuses if status not in ACTIVE_STATES])
+        }
+
+
+# 创建全局协调任务池
+coordination_pool = CoordinationJobPool(
+    workers=int(os.getenv('COORDINATION_WORKERS', 8)),
+    max_queue=int(os.getenv('COORDINATION_QUEUE_SIZE', 100)),
+    job_timeout=int(os.getenv('COORDINATION_TIMEOUT', 300))
+)
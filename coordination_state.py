@@ -0,0 +1,198 @@
+"""
+协调状态机模块
+由 update_coordination_status 事件驱动，替代轮询 LLM 的协调主循环
+状态流转：pending → proposed → confirmed/conflict → finalized
+"""
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 协调状态
+PENDING = 'pending'
+PROPOSED = 'proposed'
+CONFIRMED = 'confirmed'
+CONFLICT = 'conflict'
+FINALIZED = 'finalized'
+
+# 单个参与者允许的状态迁移
+# 已确认的参与者只有带 CONFLICT 标记的回复才能改变状态，没有标记的事件（PROPOSED）不会撤销确认
+ALLOWED_TRANSITIONS = {
+    PENDING: {PROPOSED, CONFIRMED, CONFLICT},
+    PROPOSED: {PROPOSED, CONFIRMED, CONFLICT},
+    CONFLICT: {PROPOSED, CONFIRMED, CONFLICT},
+    CONFIRMED: {CONFIRMED, CONFLICT},
+    FINALIZED: set()
+}
+
+
+def classify_response(response, time_preference=None):
+    """根据协调回复中的标记判断参与者的新状态"""
+    if '[COORDINATION_PROGRESS: CONFIRMED]' in response:
+        return CONFIRMED
+    if '[COORDINATION_PROGRESS: CONFLICT]' in response:
+        return CONFLICT
+    if time_preference and time_preference.get('time') not in (None, '未指定'):
+        return PROPOSED
+    return None
+
+
+class CoordinationStateMachine:
+    """单次会议的协调状态机，状态变化时唤醒等待中的协调流程"""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.version = 0
+        self.participants = []  # 按协调顺序排列的用户ID
+        self.main_coordinator_id = None
+        self.states = {}
+        self.time_preferences = {}
+        self.finalized = False
+        self.transitions = []  # 状态迁移记录
+        self._listeners = []  # 状态变化时调用的回调，如唤醒挂起中的协调任务
+
+    def add_listener(self, callback):
+        with self._condition:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._condition:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def reset(self, participant_ids, main_coordinator_id=None):
+        """开始新的协调，所有参与者回到 pending"""
+        with self._condition:
+            self.participants = list(participant_ids)
+            self.main_coordinator_id = main_coordinator_id or (self.participants[0] if self.participants else None)
+            self.states = {user_id: PENDING for user_id in self.participants}
+            self.time_preferences = {}
+            self.finalized = False
+            self.transitions = []
+            self._bump()
+
+    def transition(self, user_id, new_state, time_preference=None):
+        """
+        处理一次状态事件
+        返回 True 表示发生了真实的状态迁移（状态或时间偏好变化），重复事件返回 False
+        """
+        with self._condition:
+            if self.finalized or new_state is None or user_id not in self.states:
+                return False
+
+            old_state = self.states[user_id]
+            if new_state not in ALLOWED_TRANSITIONS[old_state]:
+                logger.warning(f"忽略非法状态迁移: {user_id} {old_state} -> {new_state}")
+                return False
+
+            old_preference = self.time_preferences.get(user_id)
+            if old_state == new_state and (time_preference is None or time_preference == old_preference):
+                return False
+
+            self.states[user_id] = new_state
+            if time_preference is not None:
+                self.time_preferences[user_id] = time_preference
+            self.transitions.append({
+                'user_id': user_id,
+                'from': old_state,
+                'to': new_state,
+                'at': datetime.now().isoformat()
+            })
+            logger.info(f"协调状态迁移: {user_id} {old_state} -> {new_state}")
+            self._bump()
+            return True
+
+    def finalize(self):
+        """所有人确认后进入 finalized，只有第一次调用返回 True"""
+        with self._condition:
+            if self.finalized or self.meeting_state != CONFIRMED:
+                return False
+            self.finalized = True
+            self._bump()
+            return True
+
+    @property
+    def meeting_state(self):
+        """会议整体状态"""
+        if self.finalized:
+            return FINALIZED
+        states = [self.states[user_id] for user_id in self.participants]
+        if not states:
+            return PENDING
+        if any(state == CONFLICT for state in states):
+            return CONFLICT
+        if all(state == CONFIRMED for state in states):
+            return CONFIRMED
+        if any(state in (PROPOSED, CONFIRMED) for state in states):
+            return PROPOSED
+        return PENDING
+
+    @property
+    def final_time(self):
+        """以主协调人确认的时间作为最终时间"""
+        return self.time_preferences.get(self.main_coordinator_id)
+
+    def current_user(self):
+        """按协调顺序返回第一个尚未确认的用户ID"""
+        for user_id in self.participants:
+            if self.states.get(user_id) != CONFIRMED:
+                return user_id
+        return None
+
+    def wait_for_transition(self, since_version, timeout=None, stop=None):
+        """阻塞直到状态版本超过 since_version、stop() 为真或超时，返回当前版本号"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.version > since_version or (stop is not None and stop()),
+                timeout=timeout
+            )
+            return self.version
+
+    def wake(self):
+        """唤醒等待中的线程重新检查条件（例如协调任务被取消）"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """返回可序列化的状态快照"""
+        with self._condition:
+            return {
+                'version': self.version,
+                'meeting_state': self.meeting_state,
+                'participants': list(self.participants),
+                'main_coordinator_id': self.main_coordinator_id,
+                'states': dict(self.states),
+                'time_preferences': dict(self.time_preferences)
+            }
+
+    def export_state(self):
+        """导出完整状态，用于在多个实例之间共享"""
+        with self._condition:
+            return {
+                'participants': list(self.participants),
+                'main_coordinator_id': self.main_coordinator_id,
+                'states': dict(self.states),
+                'time_preferences': dict(self.time_preferences),
+                'finalized': self.finalized,
+                'transitions': list(self.transitions)
+            }
+
+    def import_state(self, state):
+        """载入其他实例写入的状态，并唤醒等待中的协调流程"""
+        with self._condition:
+            self.participants = list(state.get('participants', []))
+            self.main_coordinator_id = state.get('main_coordinator_id')
+            self.states = dict(state.get('states', {}))
+            self.time_preferences = dict(state.get('time_preferences', {}))
+            self.finalized = state.get('finalized', False)
+            self.transitions = list(state.get('transitions', []))
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self._condition.notify_all()
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行状态变化回调失败: {str(e)}")
@@ -1,13 +1,29 @@
-import mysql.connector
+import os
+from availability import IntervalIndex
+
+try:
+    import mysql.connector
+    from mysql.connector import pooling
+except ImportError:  # 默认使用 SQLite 存储时不需要 MySQL 驱动
+    mysql = None
+
+_connection_pool = None
 
 def get_db_connection():
-    connection = mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='password',
-        database='my_database'
-    )
-    return connection 
+    """从连接池获取 MySQL 连接，连接 close() 后自动归还"""
+    global _connection_pool
+    if mysql is None:
+        raise RuntimeError("未安装 mysql-connector-python，无法使用 MySQL 存储")
+    if _connection_pool is None:
+        _connection_pool = pooling.MySQLConnectionPool(
+            pool_name='timely',
+            pool_size=int(os.getenv('MYSQL_POOL_SIZE', 5)),
+            host=os.getenv('MYSQL_HOST', 'localhost'),
+            user=os.getenv('MYSQL_USER', 'root'),
+            password=os.getenv('MYSQL_PASSWORD', 'password'),
+            database=os.getenv('MYSQL_DATABASE', 'my_database')
+        )
+    return _connection_pool.get_connection()
 
 class MockUser:
     def __init__(self, user_id, name, role):
@@ -15,10 +31,12 @@ class MockUser:
         self.name = name
         self.role = role
         self.availability = []  # 用户可用时间段
+        self.availability_index = IntervalIndex()  # 可用时间段的有序区间索引
         self.conversations = [] # 用户对话历史
 
     def add_availability(self, start_time, end_time):
         self.availability.append({
             "start": start_time,
             "end": end_time
-        }) 
\ No newline at end of file
+        })
+        self.availability_index.add(start_time, end_time) 
\ No newline at end of file
@@ -164,10 +164,12 @@ export const getUserSchedule = async (userId: string) => {
   }
 }
 
-// 获取对话历史
-export const getConversationHistory = async (userId: string) => {
+// 获取对话历史：不传 after 时返回最近的 limit 条，轮询时传入上次返回的 next_cursor 只取新消息
+export const getConversationHistory = async (userId: string, after?: number, limit = 50) => {
   try {
-    const response = await api.get(`/api/mock/conversation/${userId}`)
+    const response = await api.get(`/api/mock/conversation/${userId}`, {
+      params: after === undefined ? { limit } : { after, limit }
+    })
     return response.data
   } catch (error) {
     console.error("获取对话历史失败:", error)
@@ -0,0 +1,220 @@
+"""
+多服务商 LLM 路由模块
+同时持有多个服务商/模型的客户端，按 EWMA 统计每个端点的延迟和错误率，
+每次调用路由到最快的健康端点；请求超过对冲时间仍未返回时向下一个端点再发一份，
+先返回的结果生效；时间提取等简单任务路由到更便宜的模型
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# 可用的服务商配置：(API Key 变量, 接口地址, 主模型变量, 默认主模型, 便宜模型变量, 默认便宜模型)
+PROVIDERS = {
+    'openai': ('OPENAI_API_KEY', 'https://api.openai.com/v1', 'OPENAI_CHAT_MODEL', 'gpt-3.5-turbo', 'OPENAI_CHEAP_MODEL', 'gpt-4o-mini'),
+    'deepseek': ('DEEPSEEK_API_KEY', 'https://api.deepseek.com/v1', 'DEEPSEEK_CHAT_MODEL', 'deepseek-chat', 'DEEPSEEK_CHEAP_MODEL', 'deepseek-chat')
+}
+
+# 默认路由到便宜模型的提示词模板
+CHEAP_TEMPLATES = tuple(
+    template.strip()
+    for template in os.getenv('LLM_CHEAP_TEMPLATES', 'TIME_PREFERENCE,MEMORY_SUMMARY').split(',')
+    if template.strip()
+)
+
+TIER_MAIN = 'main'
+TIER_CHEAP = 'cheap'
+
+
+def tier_for(template):
+    return TIER_CHEAP if template in CHEAP_TEMPLATES else TIER_MAIN
+
+
+class Endpoint:
+    """一个服务商 + 模型的组合，记录延迟和错误率的指数加权移动平均"""
+    def __init__(self, name, client, model, tiers=(TIER_MAIN, TIER_CHEAP), order=0, alpha=0.3):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.tiers = tuple(tiers)
+        self.order = order  # 延迟相同时按配置顺序优先
+        self.alpha = alpha
+        self.latency = None  # 秒
+        self.error_rate = 0.0
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency=None, error=False):
+        with self._lock:
+            self.calls += 1
+            self.error_rate = self.alpha * (1.0 if error else 0.0) + (1 - self.alpha) * self.error_rate
+            if error:
+                self.consecutive_failures += 1
+                # 连续失败时指数退避，最长冷却 60 秒
+                self.cooldown_until = time.time() + min(2 ** self.consecutive_failures, 60)
+            else:
+                self.consecutive_failures = 0
+                self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+
+    def healthy(self, now=None):
+        return (now or time.time()) >= self.cooldown_until and self.error_rate < 0.5
+
+    @property
+    def sampled(self):
+        return self.latency is not None
+
+    def score(self):
+        """预期耗时，还没有样本的端点记为 0（排序时排在有样本的端点之后）"""
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'model': self.model,
+            'tiers': list(self.tiers),
+            'latency_ewma': round(self.latency, 4) if self.latency is not None else None,
+            'error_rate_ewma': round(self.error_rate, 4),
+            'calls': self.calls,
+            'healthy': self.healthy()
+        }
+
+
+class LLMRouter:
+    """按延迟和健康状况在多个端点之间路由、对冲和故障转移"""
+    def __init__(self, endpoints, hedge_after=0, max_hedge_workers=8):
+        if not endpoints:
+            raise ValueError("至少需要一个 LLM 端点")
+        self.endpoints = endpoints
+        self.hedge_after = hedge_after
+        self.hedges = 0
+        self.failovers = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_hedge_workers) if hedge_after else None
+
+    def rank(self, tier=TIER_MAIN):
+        """
+        返回该层级可用端点的优先顺序：健康的按预期耗时排序，不健康的放在最后兜底；
+        还没有样本的端点按配置顺序排在有样本的端点之后，首选服务始终最先尝试，
+        备用端点只在故障转移或对冲时才会被调用
+        """
+        candidates = [endpoint for endpoint in self.endpoints if tier in endpoint.tiers]
+        if not candidates:
+            candidates = [endpoint for endpoint in self.endpoints if TIER_MAIN in endpoint.tiers]
+        now = time.time()
+        return sorted(candidates, key=lambda endpoint: (
+            not endpoint.healthy(now), not endpoint.sampled, endpoint.score(), endpoint.order
+        ))
+
+    def _call(self, endpoint, messages, kwargs):
+        started = time.time()
+        try:
+            response = endpoint.client.chat.completions.create(
+                model=endpoint.model,
+                messages=messages,
+                **kwargs
+            )
+        except Exception:
+            endpoint.record(error=True)
+            raise
+        endpoint.record(latency=time.time() - started)
+        return response
+
+    def complete(self, messages, tier=TIER_MAIN, **kwargs):
+        """非流式调用，返回 (response, endpoint)"""
+        candidates = self.rank(tier)
+        if not self._executor or len(candidates) == 1:
+            return self._complete_sequential(candidates, messages, kwargs)
+
+        pending = {}
+        errors = []
+        hedged = False
+
+        def launch():
+            endpoint = candidates.pop(0)
+            pending[self._executor.submit(self._call, endpoint, messages, kwargs)] = endpoint
+
+        launch()
+        while pending:
+            timeout = self.hedge_after if not hedged and candidates else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 超过对冲时间仍未返回，向下一个端点再发一份
+                hedged = True
+                self.hedges += 1
+                logger.info(f"LLM 请求超过 {self.hedge_after} 秒，对冲到 {candidates[0].name}")
+                launch()
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    return future.result(), endpoint
+                except Exception as e:
+                    logger.warning(f"LLM 端点 {endpoint.name} 调用失败: {str(e)}")
+                    errors.append(e)
+            if not pending and candidates:
+                self.failovers += 1
+                launch()
+        raise errors[-1]
+
+    def _complete_sequential(self, candidates, messages, kwargs):
+        error = None
+        for position, endpoint in enumerate(candidates):
+            if position:
+                self.failovers += 1
+            try:
+                return self._call(endpoint, messages, kwargs), endpoint
+            except Exception as e:
+                logger.warning(f"LLM 端点 {endpoint.name} 调用失败: {str(e)}")
+                error = e
+        raise error
+
+    def open_stream(self, messages, tier=TIER_MAIN, **kwargs):
+        """流式调用，建立连接失败时切换到下一个端点，返回 (stream, endpoint)"""
+        return self._complete_sequential(self.rank(tier), messages, {**kwargs, 'stream': True})
+
+    def stats(self):
+        return {
+            'hedge_after': self.hedge_after,
+            'hedges': self.hedges,
+            'failovers': self.failovers,
+            'endpoints': [endpoint.stats() for endpoint in self.endpoints]
+        }
+
+
+def build_endpoints(service_type, client, chat_model):
+    """
+    以当前服务（LLM_SERVICE）为首选端点，其他配置了 API Key 的服务商作为备用端点，
+    配置了不同的便宜模型时为其单独建立 cheap 端点；LLM_FAILOVER=0 或使用 mock 服务时只使用首选服务
+    """
+    endpoints = []
+    primary_cheap = os.getenv(PROVIDERS[service_type][4], PROVIDERS[service_type][5]) if service_type in PROVIDERS else None
+    if primary_cheap and primary_cheap != chat_model:
+        endpoints.append(Endpoint(service_type, client, chat_model, tiers=(TIER_MAIN,)))
+        endpoints.append(Endpoint(f"{service_type}-cheap", client, primary_cheap, tiers=(TIER_CHEAP,)))
+    else:
+        endpoints.append(Endpoint(service_type, client, chat_model))
+
+    # mock 服务用于离线运行和压测，不能转移到真实的服务商
+    if service_type == 'mock' or os.getenv('LLM_FAILOVER', '1') != '1':
+        return endpoints
+
+    for name, (key_var, base_url, model_var, default_model, cheap_var, default_cheap) in PROVIDERS.items():
+        api_key = os.getenv(key_var)
+        if name == service_type or not api_key:
+            continue
+        provider_client = openai.OpenAI(api_key=api_key, base_url=os.getenv(f"{name.upper()}_BASE_URL", base_url))
+        model = os.getenv(model_var, default_model)
+        cheap_model = os.getenv(cheap_var, default_cheap)
+        order = len(endpoints)
+        if cheap_model != model:
+            endpoints.append(Endpoint(name, provider_client, model, tiers=(TIER_MAIN,), order=order))
+            endpoints.append(Endpoint(f"{name}-cheap", provider_client, cheap_model, tiers=(TIER_CHEAP,), order=order + 1))
+        else:
+            endpoints.append(Endpoint(name, provider_client, model, order=order))
+    return endpoints
@@ -0,0 +1,210 @@
+"""
+LLM 请求调度模块
+所有对外的 LLM 调用都经过调度器：令牌桶限制每分钟请求数（RPM）和 token 数（TPM），
+信号量限制同时进行的请求数，等待中的请求按优先级排队（交互对话优先于后台通知），
+相同的请求在进行中时只发送一次，其余调用方等待同一个结果
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+# 各提示词模板的默认优先级
+TEMPLATE_PRIORITIES = {
+    'DIALOGUE': PRIORITY_INTERACTIVE,
+    'CONTINUE_COORDINATION': PRIORITY_INTERACTIVE,
+    'TIME_PREFERENCE': PRIORITY_INTERACTIVE,
+    'SUMMARY': PRIORITY_NORMAL,
+    'STRATEGY': PRIORITY_NORMAL,
+    'INITIAL_COORDINATION': PRIORITY_NORMAL,
+    'COORDINATION_MESSAGE': PRIORITY_NORMAL,
+    'NOTIFICATION': PRIORITY_BACKGROUND,
+    'BATCH_NOTIFICATION': PRIORITY_BACKGROUND,
+    'MEMORY_SUMMARY': PRIORITY_BACKGROUND
+}
+
+
+def priority_for(template):
+    return TEMPLATE_PRIORITIES.get(template, PRIORITY_NORMAL)
+
+
+class SchedulerTimeout(Exception):
+    """请求在队列中等待超时"""
+
+
+class TokenBucket:
+    """令牌桶，rate_per_minute 为每分钟补充的令牌数，容量默认等于一分钟的额度（本身不加锁，由调度器保护）"""
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """还需等待多少秒才有足够的令牌"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Flight:
+    """进行中的请求，供相同请求的调用方等待结果"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class RequestScheduler:
+    """按优先级排队、限速、限并发并合并相同请求的调度器"""
+    def __init__(self, max_concurrency=8, rpm=0, tpm=0, queue_timeout=60):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self._cond = threading.Condition()
+        self._waiting = []  # (优先级, 序号) 的小顶堆
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0
+        self._inflight = {}  # 请求键 -> _Flight
+        self._stats = {'admitted': 0, 'coalesced': 0, 'timeouts': 0, 'throttled': 0, 'wait_time': 0.0, 'max_queue': 0}
+
+    def _rate_wait(self, now, tokens):
+        """按暂停时间和令牌桶计算还需等待的秒数"""
+        wait = max(self._paused_until - now, 0)
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket and tokens:
+            wait = max(wait, self.token_bucket.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, priority=PRIORITY_NORMAL, tokens=0):
+        """排队等待执行许可，只有队首的请求可以占用并发名额"""
+        ticket = (priority, next(self._sequence))
+        started = time.time()
+        deadline = started + self.queue_timeout
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            self._stats['max_queue'] = max(self._stats['max_queue'], len(self._waiting))
+            try:
+                throttled = False
+                while True:
+                    now = time.time()
+                    wait = None
+                    if self._waiting[0] == ticket and self._active < self.max_concurrency:
+                        wait = self._rate_wait(now, tokens)
+                        if wait <= 0:
+                            heapq.heappop(self._waiting)
+                            self._active += 1
+                            if self.request_bucket:
+                                self.request_bucket.consume(1)
+                            if self.token_bucket and tokens:
+                                self.token_bucket.consume(tokens)
+                            self._stats['admitted'] += 1
+                            self._stats['throttled'] += 1 if throttled else 0
+                            self._stats['wait_time'] += now - started
+                            self._cond.notify_all()
+                            return
+                        throttled = True
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise SchedulerTimeout(f"LLM 请求排队超过 {self.queue_timeout} 秒")
+                    self._cond.wait(min(wait, remaining) if wait else remaining)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def release(self, reserved_tokens=0, used_tokens=None):
+        """释放并发名额，实际用量少于预留时退还多余的 token 额度"""
+        with self._cond:
+            self._active -= 1
+            if self.token_bucket and used_tokens is not None and reserved_tokens > used_tokens:
+                self.token_bucket.refund(reserved_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """服务端限流（429）时暂停放行新请求，避免重试风暴"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self._cond.notify_all()
+        logger.warning(f"LLM 服务限流，暂停 {seconds:.1f} 秒")
+
+    def run(self, fn, priority=PRIORITY_NORMAL, tokens=0, key=None):
+        """
+        在调度下执行 fn，fn 返回 (结果, 实际 token 用量)
+        key 相同的请求进行中时直接等待其结果；返回 (结果, 是否为合并的请求)
+        """
+        if key is not None:
+            with self._cond:
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    self._stats['coalesced'] += 1
+                else:
+                    self._inflight[key] = _Flight()
+            if flight is not None:
+                return flight.wait(), True
+
+        used_tokens = None
+        try:
+            self.acquire(priority, tokens)
+            try:
+                result, used_tokens = fn()
+            finally:
+                self.release(tokens, used_tokens)
+        except BaseException as e:
+            self._finish(key, error=e)
+            raise
+        self._finish(key, result=result)
+        return result, False
+
+    def _finish(self, key, result=None, error=None):
+        if key is None:
+            return
+        with self._cond:
+            flight = self._inflight.pop(key, None)
+        if flight is not None:
+            flight.result = result
+            flight.error = error
+            flight.done.set()
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                'wait_time': round(self._stats['wait_time'], 3),
+                'active': self._active,
+                'queued': len(self._waiting),
+                'inflight_keys': len(self._inflight),
+                'max_concurrency': self.max_concurrency
+            }
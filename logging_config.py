@@ -0,0 +1,214 @@
+"""
+日志配置模块
+日志记录只在调用线程中放入有界队列，由后台线程统一格式化和写文件，队列满时丢弃而不阻塞请求；
+文件输出为 JSON Lines，按大小或时间轮转；按类别（logger 名称的第一段）采样和设置级别
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+from datetime import datetime
+
+# 非用户字段，不写入 JSON 输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 默认级别：Socket.IO/Engine.IO 的逐包日志只在排查问题时打开
+DEFAULT_LEVELS = 'socketio=WARNING,engineio=WARNING,werkzeug=WARNING,geventwebsocket=WARNING'
+
+
+def parse_mapping(spec):
+    """解析 "a=1,b=2" 格式的配置"""
+    mapping = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+def log_category(record):
+    """日志类别：extra 中的 category，否则为 logger 名称的第一段"""
+    return getattr(record, 'category', None) or record.name.split('.', 1)[0]
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 传入的字段原样保留"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'category': log_category(record),
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class CategorySampler(logging.Filter):
+    """
+    按类别采样 INFO 及以下级别的日志，WARNING 及以上始终保留
+    rates 为 {类别: 保留比例}，未配置的类别使用 default_rate
+    """
+    def __init__(self, rates=None, default_rate=1.0):
+        super().__init__()
+        self.rates = {category: float(rate) for category, rate in (rates or {}).items()}
+        self.default_rate = default_rate
+        self.sampled_out = 0
+        self._random = random.Random()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(log_category(record), self.default_rate)
+        if rate >= 1 or self._random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，不阻塞调用线程"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 只在调用线程中合并消息参数和异常文本，JSON 序列化交给后台线程
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _dated_namer(default_name):
+    """按时间轮转的文件命名为 app_20250102.log，与已有的手动轮转文件一致"""
+    directory, filename = os.path.split(default_name)
+    match = re.match(r'(.+?)(\.[^.]+)\.(\d{8})$', filename)
+    if not match:
+        return default_name
+    stem, extension, date = match.groups()
+    return os.path.join(directory, f"{stem}_{date}{extension}")
+
+
+def create_file_handler(path, max_bytes=10 * 1024 * 1024, backup_count=7, rotate_when=None):
+    """rotate_when（如 midnight）为空时按大小轮转，否则按时间轮转"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    if rotate_when:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=rotate_when, backupCount=backup_count, encoding='utf-8'
+        )
+        handler.suffix = '%Y%m%d'
+        handler.extMatch = re.compile(r'^\d{8}$')
+        handler.namer = _dated_namer
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+    return handler
+
+
+class LoggingPipeline:
+    """持有队列、后台写日志线程和采样器，提供统计信息"""
+    def __init__(self, queue_handler, listener, sampler):
+        self.queue_handler = queue_handler
+        self.listener = listener
+        self.sampler = sampler
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """停止后台线程，写完队列中剩余的日志"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self.listener.stop()
+
+    def stats(self):
+        return {
+            'queued': self.queue_handler.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'sampled_out': self.sampler.sampled_out
+        }
+
+
+_pipeline = None
+
+
+def setup_logging(path=None, level=None, console=None):
+    """
+    配置根 logger，重复调用时返回已有的配置
+    环境变量：LOG_FILE、LOG_LEVEL、LOG_LEVELS（按类别的级别）、LOG_SAMPLING（按类别的采样比例）、
+    LOG_QUEUE_SIZE、LOG_MAX_BYTES、LOG_BACKUP_COUNT、LOG_ROTATE_WHEN、LOG_CONSOLE、LOG_CONSOLE_FORMAT
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    path = path or os.getenv('LOG_FILE', os.path.join('logs', 'app.log'))
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    console = console if console is not None else os.getenv('LOG_CONSOLE', '1') == '1'
+
+    file_handler = create_file_handler(
+        path,
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        backup_count=int(os.getenv('LOG_BACKUP_COUNT', 7)),
+        rotate_when=os.getenv('LOG_ROTATE_WHEN') or None
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        if os.getenv('LOG_CONSOLE_FORMAT', 'text') == 'json':
+            console_handler.setFormatter(JsonLinesFormatter())
+        else:
+            console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    sampler = CategorySampler(parse_mapping(os.getenv('LOG_SAMPLING')))
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000))))
+    queue_handler.addFilter(sampler)
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, category_level in parse_mapping(f"{DEFAULT_LEVELS},{os.getenv('LOG_LEVELS', '')}").items():
+        logging.getLogger(name).setLevel(category_level.upper())
+
+    listener.start()
+    _pipeline = LoggingPipeline(queue_handler, listener, sampler)
+    atexit.register(_pipeline.stop)
+    return _pipeline
+
+
+def logging_stats():
+    """日志队列长度、丢弃和被采样掉的条数"""
+    return _pipeline.stats() if _pipeline else {}
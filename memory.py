@@ -0,0 +1,70 @@
+"""
+对话记忆管理模块
+按 token 预算保留最近若干轮原文，更早的轮次折叠进增量更新的摘要，
+摘要只在有新的轮次被折叠时才重新生成
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约 1 字 1 token，ASCII 约 4 字符 1 token"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+class ConversationMemory:
+    """带 token 预算的对话记忆"""
+    def __init__(self, token_budget=2000, keep_last_turns=6):
+        self.token_budget = token_budget
+        self.keep_last_turns = keep_last_turns
+        self.summary = ''  # 已折叠轮次的摘要
+        self.folded_messages = 0  # 已折叠进摘要的消息数
+
+    def reset(self):
+        self.summary = ''
+        self.folded_messages = 0
+
+    def export_state(self):
+        return {'summary': self.summary, 'folded_messages': self.folded_messages}
+
+    def import_state(self, state):
+        self.summary = state.get('summary', '')
+        self.folded_messages = state.get('folded_messages', 0)
+
+    def history_tokens(self, history):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(msg['content']) for msg in history)
+
+    def compact(self, history, summarize):
+        """
+        超出预算时把最近 N 轮之前的消息折叠进摘要，并从 history 中原地删除
+        summarize(previous_summary, messages) 只接收新折叠的消息，返回新的摘要
+        """
+        keep = self.keep_last_turns * 2
+        if len(history) <= keep or self.history_tokens(history) <= self.token_budget:
+            return False
+
+        folded = history[:len(history) - keep]
+        try:
+            self.summary = summarize(self.summary, folded)
+        except Exception as e:
+            # 摘要失败时保留原文，下次再尝试
+            logger.error(f"折叠对话历史失败: {str(e)}")
+            return False
+
+        del history[:len(folded)]
+        self.folded_messages += len(folded)
+        logger.info(f"折叠 {len(folded)} 条对话历史，累计 {self.folded_messages} 条")
+        return True
+
+    def context_messages(self):
+        """返回放在最近对话之前的摘要消息"""
+        if not self.summary:
+            return []
+        return [{
+            "role": "system",
+            "content": f"较早对话的摘要：{self.summary}"
+        }]
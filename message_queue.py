@@ -0,0 +1,118 @@
+"""
+Socket.IO 消息队列适配模块
+多个实例部署在负载均衡之后时，socketio.emit 需要经过发布/订阅通道转发给所有实例，
+由持有目标连接的实例推送；通过 SOCKETIO_MESSAGE_QUEUE 选择通道：
+memory:// 为进程内通道（本地测试多实例），fakeredis:// 使用 fakeredis，
+redis://、rediss:// 使用 Redis，amqp:// 使用 RabbitMQ（kombu），留空时不经过消息队列
+"""
+import copy
+import importlib.util
+import logging
+import os
+import threading
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+# 各消息队列需要另外安装的包（可选依赖，不在 requirements.txt 中）
+QUEUE_PACKAGES = {
+    'fakeredis': 'fakeredis',
+    'redis': 'redis',
+    'rediss': 'redis',
+    'amqp': 'kombu'
+}
+
+
+class InProcessBroker:
+    """进程内的发布/订阅通道，每个订阅者一个队列"""
+    def __init__(self):
+        self._subscribers = {}  # 频道 -> 订阅者队列列表
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, subscriber_queue):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscriber_queue)
+
+    def unsubscribe(self, channel, subscriber_queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, [])
+            if subscriber_queue in subscribers:
+                subscribers.remove(subscriber_queue)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, []))
+        for subscriber_queue in subscribers:
+            # 每个订阅者拿到独立的副本，与经过网络序列化的行为一致
+            subscriber_queue.put(copy.deepcopy(message))
+        return len(subscribers)
+
+
+# 同一进程内的所有 InProcessManager 共享这个通道
+in_process_broker = InProcessBroker()
+
+
+class InProcessManager(socketio.PubSubManager):
+    """基于进程内通道的客户端管理器，用于在一个进程里模拟多个实例"""
+    name = 'memory'
+
+    def __init__(self, channel='socketio', write_only=False, logger=None, broker=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker or in_process_broker
+        self._queue = None
+
+    def initialize(self):
+        if not self.write_only:
+            # 使用与 Socket.IO 异步模式匹配的队列（gevent 下为协程队列）
+            self._queue = self.server.eio.create_queue()
+            self.broker.subscribe(self.channel, self._queue)
+        super().initialize()
+
+    def _publish(self, data):
+        self.broker.publish(self.channel, data)
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+
+class FakeRedisManager(socketio.RedisManager):
+    """使用 fakeredis 的 Redis 客户端管理器，同一进程内的实例共享一个 fakeredis 服务"""
+    name = 'fakeredis'
+    _server = None
+
+    def _redis_connect(self):
+        import fakeredis
+        if FakeRedisManager._server is None:
+            FakeRedisManager._server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=FakeRedisManager._server)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+
+
+def create_client_manager(url=None, channel=None, write_only=False):
+    """
+    根据消息队列地址创建 Socket.IO 客户端管理器，未配置时返回 None（只在本进程内推送）
+    write_only=True 用于只发送消息、不持有连接的进程（例如独立的后台任务进程）
+    """
+    url = url if url is not None else os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    channel = channel or os.getenv('SOCKETIO_CHANNEL', 'timely')
+    if not url:
+        return None
+
+    scheme = url.split('://', 1)[0]
+    package = QUEUE_PACKAGES.get('amqp' if scheme.startswith('amqp') else scheme)
+    if package and importlib.util.find_spec(package) is None:
+        raise RuntimeError(f"消息队列 {scheme}:// 需要安装 {package}：pip install {package}")
+    if scheme == 'memory':
+        manager = InProcessManager(channel=channel, write_only=write_only)
+    elif scheme == 'fakeredis':
+        manager = FakeRedisManager('redis://', channel=channel, write_only=write_only)
+    elif scheme in ('redis', 'rediss'):
+        manager = socketio.RedisManager(url, channel=channel, write_only=write_only)
+    elif scheme.startswith('amqp'):
+        manager = socketio.KombuManager(url, channel=channel, write_only=write_only)
+    else:
+        raise ValueError(f"不支持的消息队列地址: {url}")
+    logger.info(f"Socket.IO 使用消息队列: {scheme}://，频道: {channel}")
+    return manager
@@ -0,0 +1,165 @@
+"""
+LLM 调用指标模块
+按 agent 和提示词模板统计 token 用量、耗时、首 token 延迟、重试、缓存命中和合并的重复请求，
+以 Prometheus 文本格式导出，并提供按会议的成本明细
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+# 耗时直方图的分桶（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """累积分桶直方图"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+
+
+class MetricsRegistry:
+    """LLM 调用指标的汇总"""
+    def __init__(self, max_meetings=1000):
+        self.max_meetings = max_meetings
+        self._lock = threading.Lock()
+        self._calls = defaultdict(int)  # (agent, template, status) -> 次数
+        self._prompt_tokens = defaultdict(int)  # (agent, template) -> token 数
+        self._completion_tokens = defaultdict(int)
+        self._cached_prompt_tokens = defaultdict(int)  # 命中服务商提示词缓存的输入 token
+        self._retries = defaultdict(int)
+        self._cache_hits = defaultdict(int)
+        self._coalesced = defaultdict(int)  # 与进行中的相同请求合并、没有产生新调用的次数
+        self._wall_time = defaultdict(Histogram)
+        self._ttft = defaultdict(Histogram)
+        self._meetings = OrderedDict()  # meeting_id -> {(agent, template): 明细}
+
+    def record_call(self, agent, template, prompt_tokens=0, completion_tokens=0, wall_time=0.0,
+                    ttft=None, cache_hit=False, error=False, meeting_id=None, cached_prompt_tokens=0, coalesced=False):
+        """记录一次 LLM 调用，coalesced=True 表示合并到进行中的相同请求，不计入实际调用次数和缓存命中"""
+        key = (agent, template)
+        with self._lock:
+            self._calls[(agent, template, 'error' if error else 'coalesced' if coalesced else 'success')] += 1
+            self._prompt_tokens[key] += prompt_tokens
+            self._completion_tokens[key] += completion_tokens
+            self._cached_prompt_tokens[key] += cached_prompt_tokens
+            if coalesced:
+                self._coalesced[key] += 1
+            elif cache_hit:
+                self._cache_hits[key] += 1
+            else:
+                self._wall_time[key].observe(wall_time)
+            if ttft is not None:
+                self._ttft[key].observe(ttft)
+
+            if meeting_id is not None:
+                # 统一按字符串保存，与 /metrics/meetings/<meeting_id> 路径参数一致
+                meeting_id = str(meeting_id)
+                meeting = self._meetings.setdefault(meeting_id, {})
+                self._meetings.move_to_end(meeting_id)
+                while len(self._meetings) > self.max_meetings:
+                    self._meetings.popitem(last=False)
+                stage = meeting.setdefault(key, {
+                    'calls': 0, 'cache_hits': 0, 'coalesced': 0, 'errors': 0,
+                    'prompt_tokens': 0, 'completion_tokens': 0, 'wall_time': 0.0
+                })
+                stage['calls'] += 0 if coalesced else 1
+                stage['cache_hits'] += 1 if cache_hit and not coalesced else 0
+                stage['coalesced'] += 1 if coalesced else 0
+                stage['errors'] += 1 if error else 0
+                stage['prompt_tokens'] += prompt_tokens
+                stage['completion_tokens'] += completion_tokens
+                stage['wall_time'] += wall_time
+
+    def record_retry(self, agent, template):
+        with self._lock:
+            self._retries[(agent, template)] += 1
+
+    def merge_meeting(self, old_id, new_id):
+        """把 old_id 下已记录的明细并入 new_id，用于会话开始协调后从会话ID改用会议ID"""
+        old_id, new_id = str(old_id), str(new_id)
+        if old_id == new_id:
+            return
+        with self._lock:
+            old = self._meetings.pop(old_id, None)
+            if old is None:
+                return
+            meeting = self._meetings.setdefault(new_id, {})
+            self._meetings.move_to_end(new_id)
+            for key, stage in old.items():
+                if key in meeting:
+                    for field, value in stage.items():
+                        meeting[key][field] += value
+                else:
+                    meeting[key] = stage
+
+    def meeting_breakdown(self, meeting_id):
+        """返回单个会议按 agent/模板划分的成本明细，未知会议返回 None"""
+        meeting_id = str(meeting_id)
+        with self._lock:
+            meeting = self._meetings.get(meeting_id)
+            if meeting is None:
+                return None
+            stages = [
+                {'agent': agent, 'template': template, **{k: round(v, 4) if isinstance(v, float) else v for k, v in stage.items()}}
+                for (agent, template), stage in meeting.items()
+            ]
+        return {
+            'meeting_id': meeting_id,
+            'stages': stages,
+            'total': {
+                'calls': sum(stage['calls'] for stage in stages),
+                'prompt_tokens': sum(stage['prompt_tokens'] for stage in stages),
+                'completion_tokens': sum(stage['completion_tokens'] for stage in stages),
+                'wall_time': round(sum(stage['wall_time'] for stage in stages), 4)
+            }
+        }
+
+    def render_prometheus(self):
+        """以 Prometheus 文本格式导出全部指标"""
+        lines = []
+        with self._lock:
+            self._render_counter(lines, 'llm_calls_total', 'LLM 调用次数', self._calls, ('agent', 'template', 'status'))
+            self._render_counter(lines, 'llm_prompt_tokens_total', '输入 token 数', self._prompt_tokens, ('agent', 'template'))
+            self._render_counter(lines, 'llm_completion_tokens_total', '输出 token 数', self._completion_tokens, ('agent', 'template'))
+            self._render_counter(lines, 'llm_cached_prompt_tokens_total', '命中服务商提示词缓存的输入 token 数', self._cached_prompt_tokens, ('agent', 'template'))
+            self._render_counter(lines, 'llm_retries_total', '重试次数', self._retries, ('agent', 'template'))
+            self._render_counter(lines, 'llm_cache_hits_total', '缓存命中次数', self._cache_hits, ('agent', 'template'))
+            self._render_counter(lines, 'llm_coalesced_total', '合并到进行中的相同请求的次数', self._coalesced, ('agent', 'template'))
+            self._render_histogram(lines, 'llm_request_duration_seconds', 'LLM 调用耗时', self._wall_time)
+            self._render_histogram(lines, 'llm_time_to_first_token_seconds', '流式调用首 token 延迟', self._ttft)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(names, values):
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in values)
+        return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+    def _render_counter(self, lines, name, help_text, values, label_names):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{{{self._labels(label_names, key)}}} {value}")
+
+    def _render_histogram(self, lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(histograms.items()):
+            labels = self._labels(('agent', 'template'), key)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+            lines.append(f"{name}_sum{{{labels}}} {round(histogram.sum, 6)}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.total}")
+
+
+# 创建全局指标实例
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,254 @@
+"""
+离线模拟 LLM 后端
+按提示词识别调用阶段并返回脚本化（或录制的）回复，延迟按可配置的分布采样，
+接口与 openai.OpenAI 客户端的 chat.completions.create 保持一致，用于压测和本地开发
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from memory import estimate_tokens
+from models import mock_users
+
+logger = logging.getLogger(__name__)
+
+# 按提示词中的特征文本识别调用阶段，按顺序匹配
+TEMPLATE_MARKERS = (
+    ('STRATEGY', '你是一个策略分析助手'),
+    ('SUMMARY', '请分析并总结这段对话的内容'),
+    ('MEMORY_SUMMARY', '请把以下新增的对话内容合并进已有摘要'),
+    ('INITIAL_COORDINATION', '负责开始与用户协调会议时间'),
+    ('CONTINUE_COORDINATION', '负责继续与用户协调会议时间'),
+    ('TIME_PREFERENCE', '请从以下用户回复中提取具体的时间偏好信息'),
+    ('COORDINATION_MESSAGE', '请生成一条邀请确认时间的消息'),
+    ('BATCH_NOTIFICATION', '分别生成一条会议确认通知'),
+    ('NOTIFICATION', '请生成一条会议确认通知'),
+    ('DIALOGUE', '负责通过和我对话收集会议信息'),
+)
+
+
+def detect_template(messages):
+    """根据消息内容判断提示词模板，无法识别时返回 OTHER"""
+    text = '\n'.join(msg.get('content', '') for msg in messages)
+    for template, marker in TEMPLATE_MARKERS:
+        if marker in text:
+            return template
+    return 'OTHER'
+
+
+def find_participants(text):
+    """按出现顺序返回文本中提到的 mock 用户名（用户目录的自动机一次扫描匹配）"""
+    names = []
+    for _, _, _, ids in mock_users.find_mentions(text):
+        if len(ids) == 1:
+            name = mock_users[next(iter(ids))].get('name')
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+class LatencyModel:
+    """
+    模拟调用延迟（秒），配置格式：
+    fixed:0.5、uniform:0.2:1.0、lognormal:中位数:sigma、normal:均值:标准差
+    """
+    def __init__(self, spec='fixed:0'):
+        self.spec = spec
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        if kind not in ('fixed', 'uniform', 'lognormal', 'normal'):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == 'fixed':
+                value = self.params[0] if self.params else 0.0
+            elif self.kind == 'uniform':
+                value = self._random.uniform(*self.params[:2])
+            elif self.kind == 'lognormal':
+                median, sigma = self.params[:2]
+                value = median * self._random.lognormvariate(0, sigma) if median > 0 else 0.0
+            else:
+                value = self._random.gauss(*self.params[:2])
+        return max(value, 0.0)
+
+
+class ScriptedResponder:
+    """
+    脚本化回复：先按录制的规则（包含某段文本即返回对应回复）匹配，
+    再按提示词模板返回能让协调流程走通的默认回复
+    """
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+
+    @classmethod
+    def from_file(cls, path):
+        """从 JSON 文件加载录制的回复，格式：[{"match": "...", "response": "..."}]"""
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def respond(self, messages):
+        text = '\n'.join(msg.get('content', '') for msg in messages)
+        for rule in self.rules:
+            if rule.get('match', '') in text:
+                return rule['response']
+
+        template = detect_template(messages)
+        handler = getattr(self, f"_respond_{template.lower()}", None)
+        return handler(messages, text) if handler else 'OK'
+
+    def _respond_dialogue(self, messages, text):
+        # 跳过提示词本身（其中的示例包含用户名）
+        user_text = '\n'.join(
+            msg['content'] for msg in messages
+            if msg['role'] == 'user' and '负责通过和我对话收集会议信息' not in msg['content']
+        )
+        participants = find_participants(user_text)
+        if not participants:
+            return '请问这次会议需要哪些人参加？'
+        # 与 DIALOGUE_PROMPT 的示例一致：先输出确认内容，再结束对话
+        return (
+            f"好的，让我确认一下：\n- 参与者：{'、'.join(participants)}\n- 会议主题：项目会议\n"
+            "我这就去安排，等我消息哦～ [DIALOGUE_COMPLETE]"
+        )
+
+    def _respond_summary(self, messages, text):
+        participants = find_participants(text.split('对话内容：')[-1])
+        return json.dumps({
+            'type': 'initial_dialogue',
+            'status': 'completed' if participants else 'collecting',
+            'summary': {
+                'purpose': '项目会议',
+                'participants': participants,
+                'description': f"安排{'、'.join(participants)}参加的项目会议"
+            }
+        }, ensure_ascii=False)
+
+    def _respond_strategy(self, messages, text):
+        participants = find_participants(text.split('对话总结：')[-1])
+        if not participants:
+            return json.dumps({'decision': {'action': 'continue_collection'}}, ensure_ascii=False)
+        return json.dumps({
+            'decision': {
+                'action': 'start_coordination',
+                'target_participants': participants,
+                'coordination_priority': {
+                    'main_coordinator': participants[0],
+                    'reason': '会议发起人指定',
+                    'sequence_rule': '先确定主协调人时间，再协调其他参与者'
+                },
+                'coordination_params': {
+                    'known_info': {
+                        'title': '项目会议',
+                        'participants': participants,
+                        'description': '项目进度同步'
+                    },
+                    'requirements': {
+                        'duration': '1小时',
+                        'time_range': '下周',
+                        'description': '需要确保所有人都能参加'
+                    },
+                    'constraints': {
+                        'workday_only': True,
+                        'description': '优先考虑主协调人的时间安排'
+                    }
+                }
+            }
+        }, ensure_ascii=False)
+
+    def _respond_memory_summary(self, messages, text):
+        return '用户希望安排一次项目会议。'
+
+    def _respond_initial_coordination(self, messages, text):
+        return '您好，需要和您确认一下项目会议的时间，请问下周什么时候方便？'
+
+    def _respond_continue_coordination(self, messages, text):
+        return '好的，这个时间可以。[COORDINATION_PROGRESS: CONFIRMED]'
+
+    def _respond_time_preference(self, messages, text):
+        return json.dumps({'time': '下周', 'flexibility': 'flexible', 'duration': '1小时'}, ensure_ascii=False)
+
+    def _respond_coordination_message(self, messages, text):
+        return '您好，主协调人已经确定了项目会议的时间，请确认您是否方便参加。'
+
+    def _respond_notification(self, messages, text):
+        return '会议已确认，感谢各位的配合。'
+
+    def _respond_batch_notification(self, messages, text):
+        try:
+            meetings = json.loads(text.split('会议列表：')[-1])
+        except json.JSONDecodeError:
+            meetings = []
+        return json.dumps({
+            'notifications': [
+                {'id': meeting['id'], 'message': f"会议「{meeting.get('title', '')}」已确认，感谢各位的配合。"}
+                for meeting in meetings
+            ]
+        }, ensure_ascii=False)
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        return self._client.complete(model, messages or [], stream)
+
+
+class MockChatClient:
+    """与 openai.OpenAI 接口兼容的模拟客户端"""
+    def __init__(self, responder=None, latency=None, chunk_size=4, chunk_delay=0.0):
+        self.responder = responder or ScriptedResponder()
+        self.latency = latency or LatencyModel()
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def complete(self, model, messages, stream):
+        content = self.responder.respond(messages)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(estimate_tokens(msg.get('content', '')) for msg in messages),
+            completion_tokens=estimate_tokens(content)
+        )
+        if stream:
+            return self._stream(content, usage)
+
+        time.sleep(self.latency.sample())
+        return SimpleNamespace(
+            model=model,
+            usage=usage,
+            choices=[SimpleNamespace(message=SimpleNamespace(role='assistant', content=content))]
+        )
+
+    def _stream(self, content, usage):
+        # 采样的延迟作为首 token 时间，之后按固定间隔输出分片
+        time.sleep(self.latency.sample())
+        for position in range(0, len(content), self.chunk_size):
+            if position and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield SimpleNamespace(
+                usage=None,
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=content[position:position + self.chunk_size]))]
+            )
+        yield SimpleNamespace(usage=usage, choices=[])
+
+
+def create_mock_client():
+    """根据环境变量创建模拟客户端"""
+    responses_path = os.getenv('MOCK_LLM_RESPONSES')
+    responder = ScriptedResponder.from_file(responses_path) if responses_path else ScriptedResponder()
+    client = MockChatClient(
+        responder=responder,
+        latency=LatencyModel(os.getenv('MOCK_LLM_LATENCY', 'fixed:0')),
+        chunk_size=int(os.getenv('MOCK_LLM_CHUNK_SIZE', 4)),
+        chunk_delay=float(os.getenv('MOCK_LLM_CHUNK_DELAY', 0))
+    )
+    logger.info(f"使用模拟 LLM 后端，延迟分布: {client.latency.spec}")
+    return client
@@ -1,5 +1,9 @@
-# 模拟用户数据
-mock_users = {
+from conversation_history import create_history
+from storage import meeting_store
+from user_directory import UserDirectory
+
+# 模拟用户数据，按姓名、别名和拼音建立索引
+mock_users = UserDirectory({
     "user1": {
         "id": "user1",
         "name": "张三",
@@ -18,7 +22,7 @@ mock_users = {
         "role": "部门主管",
         "schedule": []
     }
-}
+})
 
-# 模拟对话历史
-mock_conversations = {} 
\ No newline at end of file
+# 模拟对话历史，按用户和序号保存在存储层，支持游标分页
+conversation_history = create_history(meeting_store)
@@ -0,0 +1,92 @@
+"""
+在线状态模块
+每个连接按用户ID加入 user:<用户ID> 房间、按会议ID加入 meeting:<会议ID> 房间，
+协调消息只推送给目标用户所在的房间，推送成本与接收者数量成正比而不是与连接总数成正比；
+PresenceIndex 记录本实例上哪些用户在线（一个用户可以有多个连接）
+"""
+import threading
+import time
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def meeting_room(meeting_id):
+    return f"meeting:{meeting_id}"
+
+
+class PresenceIndex:
+    """用户ID <-> 连接 sid 的双向索引"""
+    def __init__(self):
+        self._sids = {}  # 用户ID -> 连接 sid 集合
+        self._users = {}  # 连接 sid -> 用户ID 集合
+        self._since = {}  # 用户ID -> 上线时间
+        self._lock = threading.Lock()
+
+    def join(self, sid, user_id):
+        """登记连接代表的用户，返回该用户是否因此上线"""
+        with self._lock:
+            sids = self._sids.setdefault(user_id, set())
+            came_online = not sids
+            sids.add(sid)
+            self._users.setdefault(sid, set()).add(user_id)
+            if came_online:
+                self._since[user_id] = time.time()
+            return came_online
+
+    def leave(self, sid, user_id):
+        """连接不再代表该用户，返回该用户是否因此离线"""
+        with self._lock:
+            return self._remove(sid, user_id)
+
+    def disconnect(self, sid):
+        """连接断开，返回因此离线的用户ID"""
+        with self._lock:
+            offline = [user_id for user_id in list(self._users.get(sid, ())) if self._remove(sid, user_id)]
+            self._users.pop(sid, None)
+            return offline
+
+    def _remove(self, sid, user_id):
+        users = self._users.get(sid)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._users[sid]
+        sids = self._sids.get(user_id)
+        if not sids or sid not in sids:
+            return False
+        sids.discard(sid)
+        if sids:
+            return False
+        del self._sids[user_id]
+        self._since.pop(user_id, None)
+        return True
+
+    def is_online(self, user_id):
+        with self._lock:
+            return bool(self._sids.get(user_id))
+
+    def sids_for(self, user_id):
+        with self._lock:
+            return list(self._sids.get(user_id, ()))
+
+    def users_for(self, sid):
+        with self._lock:
+            return list(self._users.get(sid, ()))
+
+    def online_users(self):
+        """在线用户及其连接数和上线时间"""
+        with self._lock:
+            return {
+                user_id: {'connections': len(sids), 'since': self._since.get(user_id)}
+                for user_id, sids in self._sids.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return {'online_users': len(self._sids), 'connections': len(self._users)}
+
+
+# 创建全局在线状态索引（只包含本实例上的连接）
+presence = PresenceIndex()
@@ -1,7 +1,12 @@
 """
 提示词模板管理模块
-所有与 LLM 交互的提示词模板都在这里统一管理
+所有与 LLM 交互的提示词模板都在这里统一管理。
+模板在导入时预编译，静态指令放在最前面的 system 消息中，变量只出现在最后的 user 消息里，
+保证同一模板每次请求的前缀完全相同，便于服务商侧的提示词缓存命中
 """
+from string import Formatter
+
+from memory import estimate_tokens
 
 # 对话助手提示词
 DIALOGUE_PROMPT = """你是一个对话助手，负责通过和我对话收集会议信息。
@@ -81,8 +86,16 @@ SUMMARY_PROMPT = """请分析并总结这段对话的内容，直接返回JSON
 
 请分析对话内容，并按照上述格式返回总结。"""
 
+# 对话记忆摘要提示词
+MEMORY_SUMMARY_PROMPT = """请把以下新增的对话内容合并进已有摘要，生成一段新的简洁摘要。
+要求：
+1. 保留参与者、会议主题、时长、时间范围等已确认的信息
+2. 保留尚未解决的问题和用户的明确偏好
+3. 不要编造对话中没有的信息
+4. 直接返回摘要文本，不要添加任何格式标记"""
+
 # 策略分析提示词
-STRATEGY_PROMPT = """以上信息是用户的需求对话，你是一个策略分析助手，负责分析对话总结并决定下一步协调行动。请直接返回JSON格式的分析结果，不要添加任何markdown标记。
+STRATEGY_PROMPT = """你是一个策略分析助手，负责分析用户需求对话的总结并决定下一步协调行动。请直接返回JSON格式的分析结果，不要添加任何markdown标记。
 
 分析任务：
 1. 分析对话总结的当前状态
@@ -148,28 +161,11 @@ STRATEGY_PROMPT = """以上信息是用户的需求对话，你是一个策略
 
 # 初始协调提示词
 INITIAL_COORDINATION_PROMPT = """你是一个专业的会议协调助手，负责开始与用户协调会议时间。
-
-当前任务：与{target_name}开始协调会议时间
-
-已知会议信息：
-会议主题：{known_info[title]}
-会议描述：{known_info[description]}
-参与者：{known_info[participants]}
-
-用户当前日程：
-{user_schedule}
-
-协调要求：
-时长：{requirements[duration]}
-时间范围：{requirements[time_range]}
-其他要求：{requirements[description]}
-
-限制条件：
-{constraints[description]}
+会议信息、用户日程、共同空闲时间和协调要求会在后面给出。
 
 你的任务是：
 1. 友好地向用户说明需要安排的会议
-2. 询问用户的时间偏好
+2. 询问用户的时间偏好，可以优先推荐所有参与者的共同空闲时间
 3. 记录用户提供的时间信息
 
 回复要求：
@@ -179,25 +175,33 @@ INITIAL_COORDINATION_PROMPT = """你是一个专业的会议协调助手，负
 4. 不要做出决定，只收集信息
 
 示例回复：
-"您好，{target_name}。我们正在安排一个{known_info[title]}，需要协调一下您的参会时间。请问您什么时候方便参加呢？"
+"您好，张经理。我们正在安排一个项目进度会，需要协调一下您的参会时间。请问您什么时候方便参加呢？"
 """
 
-# 持续协调提示词
-CONTINUE_COORDINATION_PROMPT = """你是一个专业的会议协调助手，负责继续与用户协调会议时间。
+INITIAL_COORDINATION_INPUT = """当前任务：与{target_name}开始协调会议时间
 
-当前任务：继续与{target_name}协调会议时间
+已知会议信息：
+会议主题：{known_info[title]}
+会议描述：{known_info[description]}
+参与者：{known_info[participants]}
 
-会议背景：
-{context}
+用户当前日程：
+{user_schedule}
 
-历史对话：
-{history}
+所有参与者的共同空闲时间：
+{candidate_slots}
 
-用户日程：
-{user_schedule}
+协调要求：
+时长：{requirements[duration]}
+时间范围：{requirements[time_range]}
+其他要求：{requirements[description]}
 
 限制条件：
-{constraints}
+{constraints[description]}"""
+
+# 持续协调提示词
+CONTINUE_COORDINATION_PROMPT = """你是一个专业的会议协调助手，负责继续与用户协调会议时间。
+会议背景、历史对话、用户日程和限制条件会在后面给出。
 
 你的任务是：
 1. 理解用户提供的时间偏好
@@ -221,15 +225,173 @@ CONTINUE_COORDINATION_PROMPT = """你是一个专业的会议协调助手，负
 助手：抱歉，我看到您周五下午三点已经有一个产品评审会议了。要不我们约在四点？那个时间您是空闲的。[COORDINATION_PROGRESS: CONFLICT]
 """
 
+CONTINUE_COORDINATION_INPUT = """当前任务：继续与{target_name}协调会议时间
+
+会议背景：
+{context}
+
+历史对话：
+{history}
+
+用户日程：
+{user_schedule}
+
+限制条件：
+{constraints}"""
+
 # 通知提示词
-NOTIFICATION_PROMPT = """你是一个通知助手，负责通知参与者最终的会议安排。
+NOTIFICATION_PROMPT = """你是一个通知助手，请生成一条会议确认通知。
+
+要求：
+1. 通知需要包含：
+   - 会议主题
+   - 确定的时间
+   - 参与人员
+   - 会议说明
+2. 语气要正式专业
+3. 感谢大家的配合
+4. 如果时间是灵活的，要说明这一点
+
+请直接返回通知内容，不要添加任何格式标记。"""
+
+# 批量通知提示词（一次调用为多个已排定的会议生成通知）
+BATCH_NOTIFICATION_PROMPT = """你是一个通知助手，请为下面每个已排定的会议分别生成一条会议确认通知。
+
+要求：
+1. 每条通知需要包含会议主题、确定的时间、参与人员和会议说明
+2. 说明时间是以主协调人的时间为主安排的
+3. 语气要正式专业，感谢大家的配合
+4. 每个会议对应一条通知，id 与会议列表中的 id 一致
+
+只返回 JSON，格式如下：
+{
+    "notifications": [
+        {"id": "会议ID", "message": "通知内容"}
+    ]
+}"""
+
+# 时间偏好提取提示词
+TIME_PREFERENCE_PROMPT = """请从以下用户回复中提取具体的时间偏好信息，返回结构化的 JSON 格式。
+如果无法提取到完整信息，请尽可能提取部分信息。
+
+请返回以下格式的 JSON（注意处理不同的时间表达方式）：
+{
+    "time": "本周五下午",  // 大致时间范围
+    "flexibility": "flexible",  // strict（固定时间）或 flexible（灵活时间）
+    "duration": "3小时"  // 预计时长
+}
+
+即使信息不完整也要返回合理的默认值，确保返回的是有效的 JSON 格式。"""
 
-请根据以下信息生成通知消息：
-会议信息：{meeting_info}
-参与者：{participants}
+# 协调消息提示词
+COORDINATION_MESSAGE_PROMPT = """请生成一条邀请确认时间的消息。
 
-生成一个简洁清晰的通知消息，包含：
-1. 会议主题
-2. 时间地点
-3. 参与者
-4. 其他注意事项""" 
\ No newline at end of file
+要求：
+1. 包含会议主题和参与者信息
+2. 说明这是主协调人建议的时间
+3. 语气友好专业
+4. 请求确认时间是否方便
+
+请直接返回消息内容，不要添加任何其他格式。"""
+
+
+class PromptTemplate:
+    """
+    预编译的提示词模板
+    system 为不含变量的静态指令，user 为变量部分（导入时解析一次），
+    渲染结果依次为 system 消息、额外消息（如对话历史）和 user 消息
+    """
+    _formatter = Formatter()
+
+    def __init__(self, name, system, user=''):
+        self.name = name
+        self.system = system
+        self.user = user
+        self._segments = list(self._formatter.parse(user))
+        self.fields = tuple(sorted({field.split('[')[0].split('.')[0] for _, field, _, _ in self._segments if field}))
+        self.prefix_tokens = estimate_tokens(system)
+
+    def render_user(self, **values):
+        parts = []
+        for literal, field, format_spec, conversion in self._segments:
+            parts.append(literal)
+            if field is not None:
+                value, _ = self._formatter.get_field(field, (), values)
+                value = self._formatter.convert_field(value, conversion)
+                parts.append(self._formatter.format_field(value, format_spec or ''))
+        return ''.join(parts)
+
+    def render(self, extra_messages=(), **values):
+        messages = [{"role": "system", "content": self.system}, *extra_messages]
+        if self.user:
+            messages.append({"role": "user", "content": self.render_user(**values)})
+        return messages
+
+
+# 模板注册表：名称与调用指标中的 template 标签一致
+PROMPT_TEMPLATES = {}
+
+
+def register_template(name, system, user=''):
+    PROMPT_TEMPLATES[name] = PromptTemplate(name, system, user)
+    return PROMPT_TEMPLATES[name]
+
+
+def get_template(name):
+    return PROMPT_TEMPLATES[name]
+
+
+def prompt_cache_report():
+    """各模板可被服务商缓存的静态前缀长度（估算 token 数）"""
+    return [
+        {
+            'template': template.name,
+            'prefix_tokens': template.prefix_tokens,
+            'variables': list(template.fields)
+        }
+        for template in PROMPT_TEMPLATES.values()
+    ]
+
+
+register_template(
+    'DIALOGUE',
+    "你是一个专业的会议助手。请使用友好、专业的语气与用户沟通，帮助用户安排会议。\n\n" + DIALOGUE_PROMPT
+)
+register_template(
+    'SUMMARY',
+    "你是一个专业的对话总结助手。请根据对话内容提取关键信息并生成结构化的总结。\n\n" + SUMMARY_PROMPT,
+    "{memory_summary}对话内容：\n{conversation}"
+)
+register_template(
+    'MEMORY_SUMMARY',
+    MEMORY_SUMMARY_PROMPT,
+    "已有摘要：\n{previous_summary}\n\n新增对话：\n{new_messages}"
+)
+register_template('STRATEGY', STRATEGY_PROMPT, "对话总结：{dialogue_summary}")
+register_template('INITIAL_COORDINATION', INITIAL_COORDINATION_PROMPT, INITIAL_COORDINATION_INPUT)
+register_template('CONTINUE_COORDINATION', CONTINUE_COORDINATION_PROMPT, CONTINUE_COORDINATION_INPUT)
+register_template('TIME_PREFERENCE', TIME_PREFERENCE_PROMPT, "用户回复：{response}")
+register_template(
+    'COORDINATION_MESSAGE',
+    COORDINATION_MESSAGE_PROMPT,
+    """已知信息：
+- 目标用户：{target_user}
+- 主协调人：{main_coordinator}
+- 会议信息：{meeting_info}
+- 建议时间：{time_preference}"""
+)
+register_template(
+    'BATCH_NOTIFICATION',
+    BATCH_NOTIFICATION_PROMPT,
+    """会议列表：
+{meetings}"""
+)
+register_template(
+    'NOTIFICATION',
+    NOTIFICATION_PROMPT,
+    """会议信息：
+- 主题：{title}
+- 参与者：{participants}
+- 时间：{time}
+- 描述：{description}"""
+) 
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+会话注册表模块
+每个会议会话（按 Socket.IO sid 或会议ID区分）拥有独立的 agent 实例，
+避免多个组织者共享对话历史和协调状态；
+开启 SHARED_SESSION_STATE 后会话状态序列化到共享存储，多个实例按版本号（乐观锁）读写同一会话
+"""
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from agents import DialogueAgent, CoordinationAgent, StrategyAgent, NotificationAgent
+from storage import meeting_store, StoredDict, StateConflict
+
+logger = logging.getLogger(__name__)
+
+
+# 协调状态在存储层中的命名空间前缀，后接会话ID
+STATE_NAMESPACES = ('coordination_contexts', 'coordination_status')
+
+
+class AgentSession:
+    """单个会议会话，持有该会话专属的 agent 实例"""
+    def __init__(self, session_id, max_history_messages=50):
+        self.session_id = session_id
+        self.max_history_messages = max_history_messages
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.meeting_id = None  # 开始协调后在存储层创建的会议ID
+        self.state_version = 0  # 最近一次读取或写入的共享状态版本号
+        self.state_lock = threading.RLock()  # 本实例内串行化共享状态的读写
+
+        # 创建 agents
+        self.dialogue_agent = DialogueAgent("对话助手")
+        self.strategy_agent = StrategyAgent("策略分析助手")
+        self.coordination_agent = CoordinationAgent("时间协调助手")
+        self.notification_agent = NotificationAgent("通知助手")
+
+        # 设置代理之间的引用关系
+        self.coordination_agent.strategy_agent = self.strategy_agent
+        self.strategy_agent.notification_agent = self.notification_agent
+
+        # 开始协调前还没有会议ID，LLM 调用指标先按会话ID汇总，见 set_meeting_id
+        self._tag_agents(session_id)
+
+        # 协调状态保存到存储层，同一会话ID重新创建会话时可恢复；
+        # 会话ID即发起人的连接 sid，重启后不再使用的命名空间由 SessionRegistry 定期清理
+        self.coordination_agent.coordination_contexts = StoredDict(
+            meeting_store, f"{STATE_NAMESPACES[0]}:{session_id}"
+        )
+        self.strategy_agent.coordination_status = StoredDict(
+            meeting_store, f"{STATE_NAMESPACES[1]}:{session_id}"
+        )
+
+    def _tag_agents(self, metrics_id):
+        """设置各 agent 记录 LLM 调用指标时使用的会议标识"""
+        for agent in (self.dialogue_agent, self.strategy_agent, self.coordination_agent, self.notification_agent):
+            agent.meeting_id = metrics_id
+
+    def set_meeting_id(self, meeting_id):
+        """
+        记录存储层中的会议ID，之后的 LLM 调用指标按会议ID汇总；
+        此前按会话ID记录的明细由调用方通过 metrics_registry.merge_meeting 并入
+        """
+        self.meeting_id = meeting_id
+        self._tag_agents(meeting_id if meeting_id is not None else self.session_id)
+
+    def touch(self):
+        """记录活跃时间并限制会话内存"""
+        self.last_active = time.time()
+        self.enforce_limits()
+
+    def enforce_limits(self):
+        """只保留最近的若干条消息，限制单个会话的内存占用"""
+        limit = self.max_history_messages
+        history = self.dialogue_agent.conversation_history
+        if len(history) > limit:
+            self.dialogue_agent.conversation_history = history[-limit:]
+        contexts = self.coordination_agent.coordination_contexts
+        for user_id, context in list(contexts.items()):
+            if len(context['history']) > limit:
+                # 重新赋值才会写回存储层
+                contexts[user_id] = {**context, 'history': context['history'][-limit:]}
+
+    def discard_state(self):
+        """会话被淘汰时清理存储层中的协调状态"""
+        self.coordination_agent.coordination_contexts.clear()
+        self.strategy_agent.coordination_status.clear()
+
+    def participant_ids(self):
+        """当前会话中参与协调的用户ID"""
+        return list(self.strategy_agent.state_machine.participants)
+
+    def export_state(self):
+        """导出会话内全部 agent 的状态"""
+        return {
+            'meeting_id': self.meeting_id,
+            'dialogue': self.dialogue_agent.export_state(),
+            'strategy': self.strategy_agent.export_state(),
+            'coordination': self.coordination_agent.export_state(),
+            'notification': self.notification_agent.export_state()
+        }
+
+    def import_state(self, state):
+        """载入其他实例写入的会话状态"""
+        self.set_meeting_id(state.get('meeting_id'))
+        self.dialogue_agent.import_state(state.get('dialogue', {}))
+        self.coordination_agent.import_state(state.get('coordination', {}))
+        self.notification_agent.import_state(state.get('notification', {}))
+        self.strategy_agent.import_state(state.get('strategy', {}))
+
+
+class SessionRegistry:
+    """
+    按会话ID懒加载 agent 会话，空闲超时（TTL）和数量上限（LRU）时淘汰
+    shared=True 时本地会话只是共享状态的缓存：淘汰只丢弃本地副本，参与者索引也写入共享存储
+    """
+    def __init__(self, ttl=1800, max_sessions=1000, max_history_messages=50, shared=False, store=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_history_messages = max_history_messages
+        self.shared = shared
+        self.store = store or meeting_store
+        self._sessions = OrderedDict()  # 按最近访问时间排序
+        self._participant_index = {}  # 参与者用户ID -> 会话ID
+        self._lock = threading.RLock()
+        self._last_purge = time.time()
+
+    def get(self, session_id, create=True):
+        """获取会话，不存在时按需创建"""
+        with self._lock:
+            self.evict_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not create:
+                    return None
+                session = AgentSession(session_id, self.max_history_messages)
+                self._sessions[session_id] = session
+                logger.info(f"创建会话: {session_id}，当前会话数: {len(self._sessions)}")
+                self._evict_overflow()
+                # 会话可能由其他实例创建，先载入共享状态
+                self.refresh(session)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touch()
+            return session
+
+    def bind_participants(self, session_id, user_ids):
+        """登记参与者所属的会话，用于路由参与者的回复"""
+        with self._lock:
+            for user_id in user_ids:
+                self._participant_index[user_id] = session_id
+        if self.shared:
+            for user_id in user_ids:
+                self.store.save_state('session_participants', user_id, session_id)
+            # 参与者的回复可能落到其他实例，立即提交而不是等待批量写入
+            self.store.flush()
+
+    def find_by_participant(self, user_id):
+        """根据参与者用户ID找到其正在协调的会话"""
+        with self._lock:
+            session_id = self._participant_index.get(user_id)
+            if self.shared:
+                # 参与者可能已被其他实例登记到新的会话
+                session_id = self.store.load_state('session_participants', user_id, session_id)
+            if session_id is None:
+                return None
+            return self.get(session_id, create=self.shared)
+
+    # ---------- 共享状态 ----------
+
+    def refresh(self, session):
+        """共享存储中有更新的版本时载入，返回是否载入了新状态"""
+        if not self.shared:
+            return False
+        with session.state_lock:
+            state, version = self.store.load_versioned('sessions', session.session_id)
+            if version <= session.state_version:
+                return False
+            session.import_state(state)
+            session.state_version = version
+            return True
+
+    def save(self, session):
+        """
+        按读取时的版本号写入共享状态
+        其他实例已写入新版本时载入最新状态并抛出 StateConflict，本次的修改被丢弃
+        """
+        if not self.shared:
+            return
+        with session.state_lock:
+            try:
+                session.state_version = self.store.compare_and_set(
+                    'sessions', session.session_id, session.export_state(), session.state_version
+                )
+            except StateConflict:
+                logger.warning(f"会话 {session.session_id} 的共享状态已被其他实例更新，载入最新状态")
+                self.refresh(session)
+                raise
+
+    @contextmanager
+    def checkout(self, session):
+        """在最新的共享状态上处理一次事件，正常结束后写回"""
+        self.refresh(session)
+        yield session
+        self.save(session)
+
+    def remove(self, session_id):
+        """移除会话及其参与者索引"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return None
+            for user_id in session.participant_ids():
+                if self._participant_index.get(user_id) == session_id:
+                    del self._participant_index[user_id]
+            # 共享模式下其他实例可能仍在使用该会话，只丢弃本地副本
+            if not self.shared:
+                session.discard_state()
+            logger.info(f"移除会话: {session_id}")
+            return session
+
+    def evict_expired(self):
+        """淘汰空闲超过 TTL 的会话"""
+        with self._lock:
+            now = time.time()
+            expired = 0
+            # 会话按访问时间排序，遇到第一个未过期的即可停止
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if now - session.last_active <= self.ttl:
+                    break
+                self.remove(session_id)
+                expired += 1
+            if now - self._last_purge >= 60:
+                self._last_purge = now
+                self._purge_orphaned_state()
+                if self.shared:
+                    self._purge_shared_state()
+            return expired
+
+    def _purge_orphaned_state(self):
+        """清理不属于任何现存会话且空闲超过 TTL 的协调状态（如重启前的连接留下的）"""
+        live = {f"{prefix}:{session_id}" for session_id in self._sessions for prefix in STATE_NAMESPACES}
+        try:
+            purged = sum(
+                self.store.purge_namespaces(f"{prefix}:", self.ttl, keep=live)
+                for prefix in STATE_NAMESPACES
+            )
+            if purged:
+                logger.info(f"清理 {purged} 条已不存在的会话留下的协调状态")
+        except Exception as e:
+            logger.error(f"清理协调状态失败: {str(e)}")
+
+    def _purge_shared_state(self):
+        """清理所有实例都已空闲超过 TTL 的共享会话状态"""
+        try:
+            purged = self.store.purge_versioned('sessions', self.ttl)
+            if purged:
+                logger.info(f"清理 {purged} 个过期的共享会话状态")
+        except Exception as e:
+            logger.error(f"清理共享会话状态失败: {str(e)}")
+
+    def _evict_overflow(self):
+        """超出数量上限时淘汰最久未使用的会话"""
+        while len(self._sessions) > self.max_sessions:
+            session_id = next(iter(self._sessions))
+            self.remove(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# 创建全局会话注册表
+session_registry = SessionRegistry(
+    ttl=int(os.getenv('SESSION_TTL', 1800)),
+    max_sessions=int(os.getenv('MAX_SESSIONS', 1000)),
+    max_history_messages=int(os.getenv('SESSION_MAX_HISTORY', 50)),
+    shared=os.getenv('SHARED_SESSION_STATE', '0') == '1'
+)
@@ -0,0 +1,183 @@
+"""
+对话槽位模块
+按 DIALOGUE_PROMPT 的收集顺序（参与者 -> 会议主题 -> 确认）逐轮填充参与者、主题、时长和时间范围，
+参与者由用户目录的 Aho-Corasick 自动机从原文中匹配，主题、时长和时间范围由本地规则提取；
+能完全由本地规则理解的回合不调用 LLM，称呼有歧义、出现目录中没有的人或要求修改信息时交给 LLM
+"""
+import re
+
+from time_parser import parse_duration, format_duration
+
+# 包含这些词的回复是在修改已有信息，交给 LLM 理解
+CORRECTION_WORDS = ('不对', '不是', '换成', '改成', '改为', '去掉', '删掉', '删除', '不要', '除了', '取消', '不用', '算了', '错了')
+
+# 常见会议类型，原文中出现时直接作为主题
+MEETING_KEYWORDS = ('绩效面谈', '头脑风暴', '面试', '培训', '周会', '例会', '月会', '晨会', '评审会', '复盘会', '述职')
+
+_TIME_RANGE_RE = re.compile(
+    r'下下周|下周[一二三四五六日天末]?|下星期[一二三四五六日天]?|本周[一二三四五六日天末]?|这周[一二三四五六日天末]?|'
+    r'这星期|本月|这个月|大后天|后天|明天|今天|(?:周|星期)[一二三四五六日天]'
+)
+_DURATION_TEXT_RE = re.compile(r'[0-9零〇一二两三四五六七八九十]+个?半?小时|半个?小时|[0-9零〇一二两三四五六七八九十]+分钟')
+
+_STOP = r'[，。,.!！?？;；\n]'
+_TOPIC_PATTERNS = (
+    re.compile(rf'(?:主题|议题)(?:是|为)?[：:]?\s*(?P<topic>[^，。,.!！?？;；\n]{{2,30}})'),
+    re.compile(rf'开(?:个|一个|一次|场|一场)?(?P<topic>[^，。,.!！?？;；\n]{{1,20}}?(?:会议|会|评审|面谈|复盘|培训|面试))(?:吧|呢|啊|哦)?(?={_STOP}|$)'),
+    re.compile(rf'(?:讨论|聊聊|聊一下|商量|沟通)(?:一下)?(?P<topic>[^，。,.!！?？;；\n]{{2,20}})(?:吧|呢|啊|哦)?(?={_STOP}|$)'),
+    re.compile('(?P<topic>' + '|'.join(MEETING_KEYWORDS) + ')')
+)
+
+# 判断是否还有未识别内容时剔除的连接词、语气词和常见动词
+_FILLERS = re.compile('|'.join(sorted((
+    '帮我', '帮忙', '麻烦', '请', '约', '一下', '叫上', '叫', '邀请', '找', '拉上', '拉', '喊上', '和', '跟', '与', '及', '以及',
+    '还有', '开', '个', '一个', '会', '会议', '吧', '呢', '啊', '哦', '呀', '嗯', '我', '我们', '大家', '一起', '安排', '参加',
+    '参与', '的', '下', '时间', '人', '需要', '要', '想', '给', '在', '左右', '大概', '主题', '是', '就', '好', '时长', '范围'
+), key=len, reverse=True)) + r'|[\s、,，。.!！?？:：;；~～\-—]')
+_CJK = re.compile(r'[一-鿿]')
+
+
+def extract_topic(text):
+    """
+    返回 (主题, (起始, 结束))，没有识别出主题时返回 (None, None)；
+    区间是整个匹配（包括"开个""讨论一下""主题是"等引导词），这些字都算作已识别的内容
+    """
+    for pattern in _TOPIC_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            # 主题中附带的时长和时间范围单独作为槽位，如"1小时的复盘会"
+            topic = _DURATION_TEXT_RE.sub('', _TIME_RANGE_RE.sub('', match.group('topic'))).strip().lstrip('的')
+            core = re.sub(r'(?:会议|会)$', '', topic)
+            if len(core) >= 2 or topic in MEETING_KEYWORDS:
+                return topic, match.span()
+    return None, None
+
+
+class DialogueSlots:
+    """初始对话中逐轮收集的会议信息"""
+    def __init__(self):
+        self.participants = []  # 目录中的标准姓名，按提到的顺序
+        self.participant_ids = []
+        self.topic = None
+        self.duration = None  # 分钟
+        self.time_range = None  # 原文，如"下周"
+        self.local_only = True  # 所有回合都由本地规则完成，总结可以直接使用槽位
+        self.synced = True  # 槽位与对话内容一致；LLM 回合没有输出确认内容时无法得知它理解了什么
+
+    def fill(self, message, directory):
+        """
+        用一条用户消息填充槽位，本地规则能完整理解时返回 True；
+        返回 False 时槽位不变，调用方应交给 LLM 处理这一轮
+        """
+        text = message or ''
+        if not self.synced or any(word in text for word in CORRECTION_WORDS):
+            return False
+        mentions = directory.find_mentions(text)
+        if any(len(ids) != 1 for _, _, _, ids in mentions):
+            return False
+
+        spans = [(start, end) for start, end, _, _ in mentions]
+        topic, topic_span = extract_topic(text)
+        if topic is None and not mentions and self.participants and not self.topic:
+            # 正在询问主题时，整句回复就是主题（如"项目进度讨论"）
+            candidate = _FILLERS.sub('', _TIME_RANGE_RE.sub('', _DURATION_TEXT_RE.sub('', text)))
+            if 2 <= len(candidate) <= 30:
+                topic, topic_span = text.strip(' 。.!！'), (0, len(text))
+        if topic_span:
+            spans.append(topic_span)
+        time_ranges = list(_TIME_RANGE_RE.finditer(text))
+        durations = list(_DURATION_TEXT_RE.finditer(text))
+        spans += [match.span() for match in time_ranges + durations]
+
+        # 剔除已识别的部分后仍有成段的中文，可能是目录中没有的人或其他信息
+        remaining = ''.join(char if not any(start <= position < end for start, end in spans) else ' '
+                            for position, char in enumerate(text))
+        if len(_CJK.findall(_FILLERS.sub('', remaining))) >= 2:
+            return False
+        if not (mentions or topic or time_ranges or durations):
+            return False
+
+        for _, _, _, ids in mentions:
+            user_id = next(iter(ids))
+            if user_id not in self.participant_ids:
+                self.participant_ids.append(user_id)
+                self.participants.append(directory[user_id].get('name', user_id))
+        if topic:
+            self.topic = topic
+        if time_ranges:
+            self.time_range = time_ranges[0].group()
+        if durations:
+            self.duration = parse_duration(durations[0].group())
+        return True
+
+    def sync_from_confirmation(self, slots, directory):
+        """LLM 回合输出确认内容时，以其中的参与者和主题为准；没有确认内容时之后的回合都交给 LLM"""
+        self.local_only = False
+        self.synced = bool(slots)
+        if not slots:
+            return
+        names, ids = [], []
+        for name in slots['participants']:
+            user_id = directory.resolve(name)
+            names.append(directory[user_id].get('name', name) if user_id else name)
+            if user_id:
+                ids.append(user_id)
+        self.participants, self.participant_ids = names, ids
+        self.topic = slots['topic']
+
+    def is_complete(self):
+        return bool(self.participants and self.topic)
+
+    def reply(self):
+        """按 DIALOGUE_PROMPT 的收集顺序生成下一轮回复"""
+        names = '、'.join(self.participants)
+        if not self.participants:
+            if self.topic:
+                return f"好的，{self.topic}是吧。请问需要邀请哪些人参加呢？😊"
+            return "需要邀请哪些人参加？😊"
+        if not self.topic:
+            return f"好的，我知道参与者是{names}。请问这次会议的主题是什么呢？😊"
+        lines = ["好的，让我确认一下：", f"- 参与者：{names}", f"- 会议主题：{self.topic}"]
+        if self.duration:
+            lines.append(f"- 时长：{format_duration(self.duration)}")
+        if self.time_range:
+            lines.append(f"- 时间范围：{self.time_range}")
+        lines.append("我这就去安排，等我消息哦～ [DIALOGUE_COMPLETE]")
+        return '\n'.join(lines)
+
+    def to_summary(self):
+        """与 SUMMARY 模板输出格式相同的对话总结"""
+        description = f"用户要求安排{'和'.join(self.participants)}参加{self.topic}。"
+        if self.time_range:
+            description += f"时间范围：{self.time_range}。"
+        if self.duration:
+            description += f"时长：{format_duration(self.duration)}。"
+        return {
+            'type': 'initial_dialogue',
+            'status': 'completed' if self.is_complete() else 'collecting',
+            'summary': {
+                'purpose': self.topic or '',
+                'participants': list(self.participants),
+                'description': description + ("所有必要信息已收集完成。" if self.is_complete() else "")
+            }
+        }
+
+    def export_state(self):
+        return {
+            'participants': list(self.participants),
+            'participant_ids': list(self.participant_ids),
+            'topic': self.topic,
+            'duration': self.duration,
+            'time_range': self.time_range,
+            'local_only': self.local_only,
+            'synced': self.synced
+        }
+
+    def import_state(self, state):
+        self.participants = list(state.get('participants', []))
+        self.participant_ids = list(state.get('participant_ids', []))
+        self.topic = state.get('topic')
+        self.duration = state.get('duration')
+        self.time_range = state.get('time_range')
+        self.local_only = state.get('local_only', True)
+        self.synced = state.get('synced', True)
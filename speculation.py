@@ -0,0 +1,204 @@
+"""
+推测执行模块
+对话助手输出确认内容（"让我确认一下：- 参与者：… - 会议主题：…"）时，按确认的参与者和主题
+在后台提前执行对话总结、策略分析和首条协调消息的生成；
+组织者确认后协调流程直接使用这些结果，组织者修改了任何内容时取消并丢弃，
+推测执行的结果在提交之前不会写入会话状态
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 确认内容中的参与者和会议主题行
+_SLOT_LINE = re.compile(r'^\s*[-•*]?\s*(参与者|会议主题)\s*[：:]\s*(.+?)\s*$', re.M)
+_NAME_SEPARATORS = re.compile(r'[、,，;；/和及与\s]+')
+
+# 组织者对确认内容的肯定答复，其他回复都视为可能修改了会议信息
+_AFFIRMATIVE = re.compile(
+    r'^(对|对的|是|是的|没错|没问题|没有问题|可以|好|好的|行|确认|嗯|嗯嗯|就这样|ok|okay|yes)'
+    r'[\s,，.。!！~～了啊呀吧哈的👍]*$',
+    re.I
+)
+
+
+def extract_confirmation_slots(text, final=True):
+    """
+    从确认内容中解析参与者和会议主题，两者都有时返回 {'participants': [...], 'topic': ...}，否则返回 None
+    final=False 用于流式输出：只解析已经完整输出的行
+    """
+    if not text:
+        return None
+    if not final:
+        text = text[:text.rfind('\n') + 1]
+    slots = {}
+    for field, value in _SLOT_LINE.findall(text):
+        slots[field] = value
+    if '参与者' not in slots or '会议主题' not in slots:
+        return None
+    participants = sorted(name for name in _NAME_SEPARATORS.split(slots['参与者']) if name)
+    return {'participants': participants, 'topic': slots['会议主题']} if participants else None
+
+
+def slot_key(slots):
+    return f"{'、'.join(slots['participants'])}|{slots['topic']}"
+
+
+def is_affirmative(message):
+    return bool(_AFFIRMATIVE.match((message or '').strip()))
+
+
+class SpeculativeSetup:
+    """一次推测执行：对话总结 -> 策略分析 -> 首条协调消息草稿"""
+    def __init__(self, session_id, slots):
+        self.session_id = session_id
+        self.slots = slots
+        self.key = slot_key(slots)
+        self.created_at = time.time()
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """已开始的 LLM 调用无法中断，后续阶段不再执行，结果被丢弃"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class SpeculationManager:
+    """按会话管理推测执行，每个会话同时最多一个"""
+    def __init__(self, max_workers=4, enabled=True, ttl=600):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speculation')
+        self._active = {}  # 会话ID -> SpeculativeSetup
+        self._lock = threading.Lock()
+        self.stats = {'started': 0, 'committed': 0, 'cancelled': 0, 'failed': 0, 'expired': 0}
+
+    # ---------- 对话过程中的观察 ----------
+
+    def on_user_message(self, session, message):
+        """组织者回复了确认内容：肯定答复时保留推测结果，其他回复可能修改了信息，立即取消"""
+        if not is_affirmative(message):
+            self.cancel(session.session_id, '组织者修改了会议信息')
+
+    def on_assistant_reply(self, session, response):
+        """对话助手的完整回复：包含确认内容时按确认的信息开始（或保留）推测执行"""
+        slots = extract_confirmation_slots(response)
+        if slots:
+            self.speculate(session, slots)
+
+    def stream_observer(self, session, on_delta):
+        """包装流式回调，确认内容一输出完整就开始推测执行，不必等回复结束"""
+        if not self.enabled:
+            return on_delta
+        chunks = []
+        started = []
+
+        def observe(delta):
+            on_delta(delta)
+            chunks.append(delta)
+            if not started and '\n' in delta:
+                slots = extract_confirmation_slots(''.join(chunks), final=False)
+                if slots:
+                    started.append(True)
+                    self.speculate(session, slots)
+        return observe
+
+    # ---------- 推测执行 ----------
+
+    def speculate(self, session, slots):
+        """按确认的信息开始推测执行，同一会话已有相同信息的推测执行时直接复用"""
+        if not self.enabled:
+            return None
+        key = slot_key(slots)
+        with self._lock:
+            self._expire()
+            current = self._active.get(session.session_id)
+            if current is not None and current.key == key and not current.cancelled:
+                return current
+            if current is not None:
+                current.cancel()
+                self.stats['cancelled'] += 1
+            speculation = SpeculativeSetup(session.session_id, slots)
+            self._active[session.session_id] = speculation
+            self.stats['started'] += 1
+        # 在调用线程中取对话快照，后台只读快照，不与后续对话并发访问历史记录；
+        # 对话全部由本地槽位完成时直接使用槽位生成的总结
+        local_summary = session.dialogue_agent.local_summary()
+        summary_messages = None if local_summary else session.dialogue_agent._summary_messages()
+        speculation.future = self._executor.submit(self._run, speculation, session, summary_messages, local_summary)
+        logger.info(f"会话 {session.session_id} 开始推测执行: {key}")
+        return speculation
+
+    def _run(self, speculation, session, summary_messages, local_summary=None):
+        result = {'summary': None, 'decision': None, 'draft': None}
+        result['summary'] = local_summary or session.dialogue_agent.summarize_with_llm(summary_messages)
+        if speculation.cancelled:
+            return None
+        result['decision'] = session.strategy_agent.analyze_dialogue_summary(result['summary'])
+        if speculation.cancelled or result['decision'].get('action') != 'start_coordination':
+            return result
+        result['draft'] = session.coordination_agent.prepare_coordination(result['decision'])
+        return result
+
+    def cancel(self, session_id, reason=''):
+        with self._lock:
+            speculation = self._active.pop(session_id, None)
+            if speculation is None:
+                return False
+            speculation.cancel()
+            self.stats['cancelled'] += 1
+        logger.info(f"会话 {session_id} 取消推测执行: {reason}")
+        return True
+
+    def claim(self, session, timeout=None):
+        """
+        组织者已确认，取出推测执行的结果（必要时等待其完成）
+        没有可用的推测结果、执行失败或超时返回 None，调用方按原流程串行执行
+        """
+        with self._lock:
+            speculation = self._active.pop(session.session_id, None)
+        if speculation is None or speculation.cancelled:
+            return None
+        try:
+            result = speculation.future.result(timeout=timeout)
+        except Exception as e:
+            speculation.cancel()
+            self.stats['failed'] += 1
+            logger.warning(f"会话 {session.session_id} 的推测执行不可用: {str(e) or type(e).__name__}")
+            return None
+        if not result:
+            return None
+        self.stats['committed'] += 1
+        logger.info(f"会话 {session.session_id} 使用推测执行的结果: {speculation.key}")
+        return result
+
+    def _expire(self):
+        """丢弃组织者长时间没有确认的推测结果"""
+        now = time.time()
+        for session_id, speculation in list(self._active.items()):
+            if now - speculation.created_at > self.ttl:
+                speculation.cancel()
+                del self._active[session_id]
+                self.stats['expired'] += 1
+
+    def speculation_stats(self):
+        with self._lock:
+            return {**self.stats, 'active': len(self._active), 'enabled': self.enabled}
+
+
+# 创建全局推测执行管理器
+speculation_manager = SpeculationManager(
+    max_workers=int(os.getenv('SPECULATION_WORKERS', 4)),
+    enabled=os.getenv('SPECULATIVE_SETUP', '1') == '1',
+    ttl=int(os.getenv('SPECULATION_TTL', 600))
+)
@@ -0,0 +1,685 @@
+"""
+持久化存储模块
+会议数据和 agent 协调状态的存储层，默认使用 SQLite，可通过 STORAGE_BACKEND=mysql 切换到带连接池的 MySQL；
+agent 状态写入会合并成批提交；多实例共享的会话状态带版本号，按比较并交换（乐观锁）写入；
+对话历史按用户和序号存储，较早的消息分段压缩归档
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+import logging
+import atexit
+import zlib
+from contextlib import contextmanager
+from collections.abc import MutableMapping
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 删除标记，用于批量写入队列
+_DELETED = object()
+
+
+class StateConflict(Exception):
+    """共享状态已被其他实例更新，写入时的版本号不是最新版本"""
+    def __init__(self, namespace, key, expected_version):
+        super().__init__(f"状态 {namespace}/{key} 已被其他实例更新（期望版本 {expected_version}）")
+        self.namespace = namespace
+        self.key = key
+        self.expected_version = expected_version
+
+
+class SQLiteBackend:
+    """SQLite 后端，维护一个固定大小的连接池"""
+    placeholder = '?'
+    insert_ignore = 'INSERT OR IGNORE'
+    schema = [
+        """CREATE TABLE IF NOT EXISTS meetings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organizer_id TEXT NOT NULL,
+            title TEXT,
+            description TEXT,
+            status TEXT NOT NULL,
+            start_time TEXT,
+            end_time TEXT,
+            data TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_meetings_organizer ON meetings (organizer_id)",
+        """CREATE TABLE IF NOT EXISTS meeting_participants (
+            meeting_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (meeting_id, user_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_participants_user ON meeting_participants (user_id)",
+        """CREATE TABLE IF NOT EXISTS agent_state (
+            namespace TEXT NOT NULL,
+            state_key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (namespace, state_key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS versioned_state (
+            namespace TEXT NOT NULL,
+            state_key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (namespace, state_key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS conversation_messages (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        )""",
+        """CREATE TABLE IF NOT EXISTS conversation_archives (
+            user_id TEXT NOT NULL,
+            first_seq INTEGER NOT NULL,
+            last_seq INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, first_seq)
+        )"""
+    ]
+
+    def __init__(self, path, pool_size=5):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._pool = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def last_insert_id(self, cursor):
+        return cursor.lastrowid
+
+
+class MySQLBackend:
+    """MySQL 后端，使用 mysql-connector 的连接池"""
+    placeholder = '%s'
+    insert_ignore = 'INSERT IGNORE'
+    schema = [
+        """CREATE TABLE IF NOT EXISTS meetings (
+            id INT PRIMARY KEY AUTO_INCREMENT,
+            organizer_id VARCHAR(191) NOT NULL,
+            title VARCHAR(255),
+            description TEXT,
+            status VARCHAR(32) NOT NULL,
+            start_time VARCHAR(32),
+            end_time VARCHAR(32),
+            data LONGTEXT,
+            created_at VARCHAR(32) NOT NULL,
+            updated_at VARCHAR(32) NOT NULL,
+            INDEX idx_meetings_organizer (organizer_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS meeting_participants (
+            meeting_id INT NOT NULL,
+            user_id VARCHAR(191) NOT NULL,
+            PRIMARY KEY (meeting_id, user_id),
+            INDEX idx_participants_user (user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS agent_state (
+            namespace VARCHAR(191) NOT NULL,
+            state_key VARCHAR(191) NOT NULL,
+            value LONGTEXT NOT NULL,
+            updated_at VARCHAR(32) NOT NULL,
+            PRIMARY KEY (namespace, state_key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS versioned_state (
+            namespace VARCHAR(191) NOT NULL,
+            state_key VARCHAR(191) NOT NULL,
+            value LONGTEXT NOT NULL,
+            version INT NOT NULL,
+            updated_at VARCHAR(32) NOT NULL,
+            PRIMARY KEY (namespace, state_key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS conversation_messages (
+            user_id VARCHAR(191) NOT NULL,
+            seq BIGINT NOT NULL,
+            data LONGTEXT NOT NULL,
+            created_at VARCHAR(32) NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        )""",
+        """CREATE TABLE IF NOT EXISTS conversation_archives (
+            user_id VARCHAR(191) NOT NULL,
+            first_seq BIGINT NOT NULL,
+            last_seq BIGINT NOT NULL,
+            message_count INT NOT NULL,
+            data LONGBLOB NOT NULL,
+            created_at VARCHAR(32) NOT NULL,
+            PRIMARY KEY (user_id, first_seq)
+        )"""
+    ]
+
+    def __init__(self):
+        from db import get_db_connection
+        self._get_connection = get_db_connection
+
+    @contextmanager
+    def connection(self):
+        conn = self._get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # 连接池中的连接 close 后归还到池中
+            conn.close()
+
+    def last_insert_id(self, cursor):
+        return cursor.lastrowid
+
+
+class MeetingStore:
+    """会议和 agent 状态的存储接口"""
+    def __init__(self, backend, batch_size=50, flush_interval=1.0):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}  # (namespace, key) -> 待写入的值
+        self._last_flush = time.time()
+        self._lock = threading.RLock()
+        self._init_schema()
+
+    def _init_schema(self):
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            for statement in self.backend.schema:
+                cursor.execute(statement)
+
+    def _sql(self, statement):
+        """把 ? 占位符转换为后端使用的占位符"""
+        return statement.replace('?', self.backend.placeholder)
+
+    # ---------- 会议 ----------
+
+    def create_meeting(self, organizer_id, title='', description='', participants=None,
+                       status='pending', start_time=None, end_time=None, data=None):
+        """创建会议，返回会议详情"""
+        now = datetime.now().isoformat()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    "INSERT INTO meetings (organizer_id, title, description, status, start_time, end_time, data, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                ),
+                (organizer_id, title, description, status, start_time, end_time,
+                 json.dumps(data or {}, ensure_ascii=False), now, now)
+            )
+            meeting_id = self.backend.last_insert_id(cursor)
+            if participants:
+                cursor.executemany(
+                    self._sql("INSERT INTO meeting_participants (meeting_id, user_id) VALUES (?, ?)"),
+                    [(meeting_id, user_id) for user_id in participants]
+                )
+        return self.get_meeting(meeting_id)
+
+    def get_meeting(self, meeting_id):
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    "SELECT id, organizer_id, title, description, status, start_time, end_time, data, created_at, updated_at "
+                    "FROM meetings WHERE id = ?"
+                ),
+                (meeting_id,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(
+                self._sql("SELECT user_id FROM meeting_participants WHERE meeting_id = ? ORDER BY user_id"),
+                (meeting_id,)
+            )
+            participants = [user_row[0] for user_row in cursor.fetchall()]
+        return self._meeting_from_row(row, participants)
+
+    def list_meetings(self, user_id):
+        """列出用户组织或参与的会议"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    "SELECT id FROM meetings WHERE organizer_id = ? "
+                    "UNION SELECT meeting_id FROM meeting_participants WHERE user_id = ?"
+                ),
+                (user_id, user_id)
+            )
+            meeting_ids = sorted(row[0] for row in cursor.fetchall())
+        return [meeting for meeting in map(self.get_meeting, meeting_ids) if meeting]
+
+    def update_meeting(self, meeting_id, **fields):
+        """更新会议字段，participants 会整体替换"""
+        participants = fields.pop('participants', None)
+        allowed = ('title', 'description', 'status', 'start_time', 'end_time', 'data')
+        updates = {key: value for key, value in fields.items() if key in allowed}
+        if 'data' in updates:
+            updates['data'] = json.dumps(updates['data'] or {}, ensure_ascii=False)
+        updates['updated_at'] = datetime.now().isoformat()
+
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(f"UPDATE meetings SET {', '.join(f'{key} = ?' for key in updates)} WHERE id = ?"),
+                (*updates.values(), meeting_id)
+            )
+            if cursor.rowcount == 0:
+                return None
+            if participants is not None:
+                cursor.execute(self._sql("DELETE FROM meeting_participants WHERE meeting_id = ?"), (meeting_id,))
+                cursor.executemany(
+                    self._sql("INSERT INTO meeting_participants (meeting_id, user_id) VALUES (?, ?)"),
+                    [(meeting_id, user_id) for user_id in participants]
+                )
+        return self.get_meeting(meeting_id)
+
+    def delete_meeting(self, meeting_id):
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql("DELETE FROM meeting_participants WHERE meeting_id = ?"), (meeting_id,))
+            cursor.execute(self._sql("DELETE FROM meetings WHERE id = ?"), (meeting_id,))
+            return cursor.rowcount > 0
+
+    def _meeting_from_row(self, row, participants):
+        meeting_id, organizer_id, title, description, status, start_time, end_time, data, created_at, updated_at = row
+        return {
+            'id': meeting_id,
+            'organizer_id': organizer_id,
+            'title': title,
+            'description': description,
+            'status': status,
+            'start_time': start_time,
+            'end_time': end_time,
+            'participants': participants,
+            'data': json.loads(data) if data else {},
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    # ---------- agent 状态 ----------
+
+    def save_state(self, namespace, key, value):
+        """写入 agent 状态，写入会先进入批量队列"""
+        with self._lock:
+            self._pending[(namespace, key)] = value
+            self._maybe_flush()
+
+    def delete_state(self, namespace, key):
+        with self._lock:
+            self._pending[(namespace, key)] = _DELETED
+            self._maybe_flush()
+
+    def load_state(self, namespace, key, default=None):
+        with self._lock:
+            if (namespace, key) in self._pending:
+                value = self._pending[(namespace, key)]
+                return default if value is _DELETED else value
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT value FROM agent_state WHERE namespace = ? AND state_key = ?"),
+                (namespace, key)
+            )
+            row = cursor.fetchone()
+        return json.loads(row[0]) if row else default
+
+    def load_namespace(self, namespace):
+        """读取命名空间下的全部状态"""
+        self.flush()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT state_key, value FROM agent_state WHERE namespace = ?"),
+                (namespace,)
+            )
+            rows = cursor.fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            for pending_key in [k for k in self._pending if k[0] == namespace]:
+                del self._pending[pending_key]
+        with self.backend.connection() as conn:
+            conn.cursor().execute(self._sql("DELETE FROM agent_state WHERE namespace = ?"), (namespace,))
+
+    def purge_namespaces(self, prefix, older_than, keep=()):
+        """
+        删除以 prefix 开头、超过 older_than 秒未更新的状态命名空间（keep 中的命名空间除外），
+        用于清理已不存在的会话留下的状态，返回删除的条数
+        """
+        self.flush()
+        cutoff = datetime.fromtimestamp(time.time() - older_than).isoformat()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    "SELECT namespace FROM agent_state WHERE namespace LIKE ? "
+                    "GROUP BY namespace HAVING MAX(updated_at) < ?"
+                ),
+                (f"{prefix}%", cutoff)
+            )
+            namespaces = [row[0] for row in cursor.fetchall() if row[0] not in keep]
+            purged = 0
+            for namespace in namespaces:
+                cursor.execute(self._sql("DELETE FROM agent_state WHERE namespace = ?"), (namespace,))
+                purged += cursor.rowcount
+            return purged
+
+    def flush(self):
+        """把批量队列中的写入一次性提交"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+
+        now = datetime.now().isoformat()
+        upserts = [
+            (namespace, key, json.dumps(value, ensure_ascii=False), now)
+            for (namespace, key), value in pending.items() if value is not _DELETED
+        ]
+        deletes = [(namespace, key) for (namespace, key), value in pending.items() if value is _DELETED]
+        try:
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                if upserts:
+                    cursor.executemany(
+                        self._sql("REPLACE INTO agent_state (namespace, state_key, value, updated_at) VALUES (?, ?, ?, ?)"),
+                        upserts
+                    )
+                if deletes:
+                    cursor.executemany(
+                        self._sql("DELETE FROM agent_state WHERE namespace = ? AND state_key = ?"),
+                        deletes
+                    )
+        except Exception as e:
+            logger.error(f"批量写入 agent 状态失败: {str(e)}")
+            with self._lock:
+                # 写入失败时放回队列，新写入优先
+                self._pending = {**pending, **self._pending}
+            raise
+        return len(pending)
+
+    # ---------- 带版本号的共享状态 ----------
+
+    def load_versioned(self, namespace, key):
+        """读取共享状态，返回 (值, 版本号)，不存在时返回 (None, 0)"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT value, version FROM versioned_state WHERE namespace = ? AND state_key = ?"),
+                (namespace, key)
+            )
+            row = cursor.fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def compare_and_set(self, namespace, key, value, expected_version):
+        """
+        仅当存储中的版本号等于 expected_version 时写入（0 表示尚不存在），返回新的版本号
+        版本号不一致说明其他实例已写入新状态，抛出 StateConflict，调用方应重新读取后再决定是否重试
+        """
+        now = datetime.now().isoformat()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            if expected_version == 0:
+                cursor.execute(
+                    self._sql(
+                        f"{self.backend.insert_ignore} INTO versioned_state (namespace, state_key, value, version, updated_at) "
+                        "VALUES (?, ?, ?, 1, ?)"
+                    ),
+                    (namespace, key, data, now)
+                )
+            else:
+                cursor.execute(
+                    self._sql(
+                        "UPDATE versioned_state SET value = ?, version = version + 1, updated_at = ? "
+                        "WHERE namespace = ? AND state_key = ? AND version = ?"
+                    ),
+                    (data, now, namespace, key, expected_version)
+                )
+            if cursor.rowcount != 1:
+                raise StateConflict(namespace, key, expected_version)
+        return expected_version + 1
+
+    def delete_versioned(self, namespace, key):
+        with self.backend.connection() as conn:
+            conn.cursor().execute(
+                self._sql("DELETE FROM versioned_state WHERE namespace = ? AND state_key = ?"),
+                (namespace, key)
+            )
+
+    def purge_versioned(self, namespace, older_than):
+        """删除命名空间下超过 older_than 秒未更新的共享状态，返回删除的条数"""
+        cutoff = datetime.fromtimestamp(time.time() - older_than).isoformat()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("DELETE FROM versioned_state WHERE namespace = ? AND updated_at < ?"),
+                (namespace, cutoff)
+            )
+            return cursor.rowcount
+
+    # ---------- 对话历史 ----------
+
+    def append_message(self, user_id, seq, message):
+        """按序号写入一条消息，序号已被占用（其他实例先写入）时返回 False"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    f"{self.backend.insert_ignore} INTO conversation_messages (user_id, seq, data, created_at) "
+                    "VALUES (?, ?, ?, ?)"
+                ),
+                (user_id, seq, json.dumps(message, ensure_ascii=False), datetime.now().isoformat())
+            )
+            return cursor.rowcount == 1
+
+    def message_stats(self, user_id):
+        """返回 (最大序号, 未归档消息数, 归档段数)"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT MAX(seq), COUNT(*) FROM conversation_messages WHERE user_id = ?"),
+                (user_id,)
+            )
+            live_max, live_count = cursor.fetchone()
+            cursor.execute(
+                self._sql("SELECT MAX(last_seq), COUNT(*) FROM conversation_archives WHERE user_id = ?"),
+                (user_id,)
+            )
+            archived_max, segments = cursor.fetchone()
+        return max(live_max or 0, archived_max or 0), live_count, segments
+
+    def list_messages(self, user_id, after=0, limit=50):
+        """序号大于 after 的消息（按序号升序），先读归档段，再读未归档的消息"""
+        messages = []
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql(
+                    "SELECT data FROM conversation_archives WHERE user_id = ? AND last_seq > ? ORDER BY first_seq"
+                ),
+                (user_id, after)
+            )
+            for (data,) in cursor.fetchall():
+                messages.extend(message for message in _decode_segment(data) if message['seq'] > after)
+                if len(messages) >= limit:
+                    return messages[:limit]
+            cursor.execute(
+                self._sql(
+                    "SELECT seq, data FROM conversation_messages WHERE user_id = ? AND seq > ? ORDER BY seq LIMIT ?"
+                ),
+                (user_id, messages[-1]['seq'] if messages else after, limit - len(messages))
+            )
+            messages.extend({**json.loads(data), 'seq': seq} for seq, data in cursor.fetchall())
+        return messages
+
+    def recent_messages(self, user_id, limit):
+        """最近 limit 条未归档的消息（按序号升序）"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT seq, data FROM conversation_messages WHERE user_id = ? ORDER BY seq DESC LIMIT ?"),
+                (user_id, limit)
+            )
+            rows = cursor.fetchall()
+        return [{**json.loads(data), 'seq': seq} for seq, data in reversed(rows)]
+
+    def archive_messages(self, user_id, count, max_segments=0):
+        """
+        把最早的 count 条未归档消息压缩为一个归档段（zlib 压缩的 JSON），返回归档的条数
+        max_segments 大于 0 时只保留最近的若干个归档段
+        """
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._sql("SELECT seq, data FROM conversation_messages WHERE user_id = ? ORDER BY seq LIMIT ?"),
+                (user_id, count)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+            messages = [{**json.loads(data), 'seq': seq} for seq, data in rows]
+            first_seq, last_seq = rows[0][0], rows[-1][0]
+            cursor.execute(
+                self._sql(
+                    f"{self.backend.insert_ignore} INTO conversation_archives "
+                    "(user_id, first_seq, last_seq, message_count, data, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+                ),
+                (user_id, first_seq, last_seq, len(messages), _encode_segment(messages), datetime.now().isoformat())
+            )
+            if cursor.rowcount != 1:
+                # 其他实例已归档了同一段
+                return 0
+            cursor.execute(
+                self._sql("DELETE FROM conversation_messages WHERE user_id = ? AND seq <= ?"),
+                (user_id, last_seq)
+            )
+            if max_segments > 0:
+                cursor.execute(
+                    self._sql(
+                        "SELECT first_seq FROM conversation_archives WHERE user_id = ? ORDER BY first_seq DESC LIMIT 1 OFFSET ?"
+                    ),
+                    (user_id, max_segments - 1)
+                )
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute(
+                        self._sql("DELETE FROM conversation_archives WHERE user_id = ? AND first_seq < ?"),
+                        (user_id, row[0])
+                    )
+        return len(messages)
+
+    def start_background_flush(self):
+        """启动后台线程，定期提交批量队列中的写入"""
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+        thread = threading.Thread(target=run, name='storage-flush', daemon=True)
+        thread.start()
+        return thread
+
+    def _maybe_flush(self):
+        if len(self._pending) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+def _encode_segment(messages):
+    return zlib.compress(json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode_segment(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+class StoredDict(MutableMapping):
+    """
+    以存储层为后端的字典，替代进程内的状态字典
+    读取时优先使用本地缓存，写入通过 MeetingStore 批量提交；原地修改值后需重新赋值才会持久化
+    """
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+        self._cache = store.load_namespace(namespace)
+
+    def __getitem__(self, key):
+        return self._cache[key]
+
+    def __setitem__(self, key, value):
+        self._cache[key] = value
+        self.store.save_state(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        del self._cache[key]
+        self.store.delete_state(self.namespace, key)
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+        self.store.delete_namespace(self.namespace)
+
+    def replace_local(self, mapping):
+        """用共享状态快照替换本地缓存，不写回存储层"""
+        self._cache = dict(mapping)
+
+
+def create_store():
+    """根据环境变量创建存储层"""
+    backend_type = os.getenv('STORAGE_BACKEND', 'sqlite')
+    if backend_type == 'mysql':
+        backend = MySQLBackend()
+    else:
+        backend = SQLiteBackend(
+            os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'timely.db')),
+            pool_size=int(os.getenv('SQLITE_POOL_SIZE', 5))
+        )
+    store = MeetingStore(
+        backend,
+        batch_size=int(os.getenv('STORAGE_BATCH_SIZE', 50)),
+        flush_interval=float(os.getenv('STORAGE_FLUSH_INTERVAL', 1.0))
+    )
+    store.start_background_flush()
+    atexit.register(store.flush)
+    return store
+
+
+# 创建全局存储实例
+meeting_store = create_store()
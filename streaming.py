@@ -0,0 +1,75 @@
+"""
+流式输出处理模块
+在 token 流中识别并剔除控制标记（标记可能被拆分在多个分片中）
+"""
+
+# 需要在流式输出中识别的控制标记
+STREAM_MARKERS = (
+    '[DIALOGUE_COMPLETE]',
+    '[COORDINATION_PROGRESS: CONFIRMED]',
+    '[COORDINATION_PROGRESS: CONFLICT]'
+)
+
+
+def strip_markers(text, markers=STREAM_MARKERS):
+    """剔除完整文本中的控制标记"""
+    marker_filter = MarkerStreamFilter(markers)
+    return marker_filter.feed(text) + marker_filter.flush()
+
+
+class MarkerStreamFilter:
+    """
+    逐段过滤流式文本
+    feed() 返回可以安全推送给客户端的文本，疑似标记前缀的部分会暂存到下一个分片
+    """
+    def __init__(self, markers=STREAM_MARKERS):
+        self.markers = tuple(markers)
+        self.found_markers = []
+        self._pending = ''
+
+    def feed(self, delta):
+        """输入一个增量分片，返回剔除标记后可输出的文本"""
+        buffer = self._pending + delta
+        output = []
+
+        # 剔除缓冲区中所有完整的标记
+        while True:
+            position, marker = self._find_marker(buffer)
+            if marker is None:
+                break
+            output.append(buffer[:position])
+            self.found_markers.append(marker)
+            buffer = buffer[position + len(marker):]
+
+        # 末尾可能是某个标记的开头，暂存等待后续分片
+        hold = self._partial_marker_length(buffer)
+        self._pending = buffer[len(buffer) - hold:] if hold else ''
+        output.append(buffer[:len(buffer) - hold])
+        return ''.join(output)
+
+    def flush(self):
+        """流结束时输出剩余的暂存文本"""
+        remaining, self._pending = self._pending, ''
+        return remaining
+
+    def has_marker(self, marker):
+        return marker in self.found_markers
+
+    def _find_marker(self, buffer):
+        """返回缓冲区中最早出现的标记及其位置"""
+        best_position, best_marker = -1, None
+        for marker in self.markers:
+            position = buffer.find(marker)
+            if position != -1 and (best_marker is None or position < best_position):
+                best_position, best_marker = position, marker
+        return best_position, best_marker
+
+    def _partial_marker_length(self, buffer):
+        """缓冲区末尾与任一标记前缀重合的最大长度"""
+        longest = 0
+        for marker in self.markers:
+            for length in range(min(len(marker) - 1, len(buffer)), longest, -1):
+                if buffer.endswith(marker[:length]):
+                    longest = length
+                    break
+        return longest
@@ -0,0 +1,239 @@
+"""
+结构化输出解析模块
+统一解析 LLM 返回的 JSON：去掉 markdown 代码块和前后说明文字，
+解析失败时先在本地修复常见问题（尾逗号、注释、单引号、Python 字面量），
+再按各提示词的 schema 校验，只有本地无法修复时才需要调用方重新询问 LLM
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 对话总结
+SUMMARY_SCHEMA = {
+    'type': 'object',
+    'required': ['type', 'status', 'summary'],
+    'properties': {
+        'type': {'type': 'string', 'enum': ['initial_dialogue', 'coordination_dialogue']},
+        'status': {'type': 'string', 'enum': ['collecting', 'completed', 'coordinating', 'failed']},
+        'summary': {
+            'type': 'object',
+            'required': ['participants'],
+            'properties': {
+                'purpose': {'type': 'string'},
+                'participants': {'type': 'array', 'items': {'type': 'string'}},
+                'description': {'type': 'string'}
+            }
+        }
+    }
+}
+
+# 策略决策（LLM 可能包在 decision 字段里）
+STRATEGY_DECISION_SCHEMA = {
+    'type': 'object',
+    'unwrap': 'decision',
+    'required': ['action'],
+    'required_when': {
+        'start_coordination': ['target_participants', 'coordination_params']
+    },
+    'properties': {
+        'action': {'type': 'string', 'enum': ['start_coordination', 'continue_collection', 'error']},
+        'target_participants': {'type': 'array', 'items': {'type': 'string'}},
+        'coordination_priority': {
+            'type': 'object',
+            'properties': {
+                'main_coordinator': {'type': 'string'}
+            }
+        },
+        'coordination_params': {
+            'type': 'object',
+            'required': ['known_info', 'requirements', 'constraints'],
+            'properties': {
+                'known_info': {'type': 'object', 'required': ['title', 'participants', 'description']},
+                'requirements': {'type': 'object', 'required': ['duration', 'time_range', 'description']},
+                'constraints': {'type': 'object', 'required': ['description']}
+            }
+        }
+    }
+}
+
+# 时间偏好
+TIME_PREFERENCE_SCHEMA = {
+    'type': 'object',
+    'required': ['time'],
+    'properties': {
+        'time': {'type': 'string'},
+        'specific_time': {'type': 'string'},
+        'flexibility': {'type': 'string', 'enum': ['strict', 'flexible']},
+        'duration': {'type': 'string'}
+    }
+}
+
+# 批量会议通知
+BATCH_NOTIFICATION_SCHEMA = {
+    'type': 'object',
+    'required': ['notifications'],
+    'properties': {
+        'notifications': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'required': ['id', 'message'],
+                'properties': {
+                    'id': {'type': 'string'},
+                    'message': {'type': 'string'}
+                }
+            }
+        }
+    }
+}
+
+SCHEMAS = {
+    'summary': SUMMARY_SCHEMA,
+    'strategy_decision': STRATEGY_DECISION_SCHEMA,
+    'time_preference': TIME_PREFERENCE_SCHEMA,
+    'batch_notification': BATCH_NOTIFICATION_SCHEMA
+}
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'number': (int, float)
+}
+
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+class StructuredOutputError(ValueError):
+    """LLM 输出无法解析或不符合 schema"""
+
+
+def extract_json_text(text):
+    """去掉代码块标记和前后的说明文字，返回最外层 JSON 的文本"""
+    text = (text or '').strip()
+    starts = [position for position in (text.find('{'), text.find('[')) if position >= 0]
+    if not starts:
+        return text
+    start = min(starts)
+    end = max(text.rfind('}'), text.rfind(']'))
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def repair_json(text):
+    """
+    修复常见的 JSON 格式问题：
+    // 和 # 行注释、/* */ 块注释、尾逗号、单引号字符串、True/False/None、字符串中的换行
+    """
+    output = []
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position]
+
+        # 字符串：统一输出为双引号字符串
+        if char in ('"', "'"):
+            quote = char
+            position += 1
+            value = []
+            while position < length and text[position] != quote:
+                if text[position] == '\\' and position + 1 < length:
+                    escaped = text[position + 1]
+                    value.append(escaped if escaped == "'" else '\\' + escaped)
+                    position += 2
+                    continue
+                if text[position] == '"':
+                    value.append('\\"')
+                elif text[position] == '\n':
+                    value.append('\\n')
+                else:
+                    value.append(text[position])
+                position += 1
+            output.append('"' + ''.join(value) + '"')
+            position += 1
+            continue
+
+        # 注释
+        if text.startswith('//', position) or char == '#':
+            newline = text.find('\n', position)
+            position = length if newline < 0 else newline
+            continue
+        if text.startswith('/*', position):
+            close = text.find('*/', position + 2)
+            position = length if close < 0 else close + 2
+            continue
+
+        # 尾逗号
+        if char in '}]':
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ',':
+                output.pop()
+            output.append(char)
+            position += 1
+            continue
+
+        # Python 字面量
+        if char.isalpha():
+            end = position
+            while end < length and (text[end].isalnum() or text[end] == '_'):
+                end += 1
+            word = text[position:end]
+            output.append(_LITERALS.get(word, word))
+            position = end
+            continue
+
+        output.append(char)
+        position += 1
+    return ''.join(output)
+
+
+def validate(data, schema, path='$'):
+    """按简化的 JSON Schema（type/required/enum/properties/items）校验，返回错误列表"""
+    errors = []
+    expected = _TYPES.get(schema.get('type'))
+    if expected and (not isinstance(data, expected) or (schema.get('type') == 'number' and isinstance(data, bool))):
+        return [f"{path} 应为 {schema['type']}"]
+    if 'enum' in schema and data not in schema['enum']:
+        errors.append(f"{path} 必须是 {', '.join(map(str, schema['enum']))} 之一")
+
+    if isinstance(data, dict):
+        required = list(schema.get('required', []))
+        required += schema.get('required_when', {}).get(data.get('action'), [])
+        errors += [f"{path}.{key} 缺失" for key in required if key not in data]
+        for key, child in schema.get('properties', {}).items():
+            if key in data and data[key] is not None:
+                errors += validate(data[key], child, f"{path}.{key}")
+    elif isinstance(data, list) and 'items' in schema:
+        for position, item in enumerate(data):
+            errors += validate(item, schema['items'], f"{path}[{position}]")
+    return errors
+
+
+def parse_structured(text, schema):
+    """
+    解析并校验 LLM 的 JSON 输出，schema 可以是 SCHEMAS 中的名称
+    无法解析或校验失败时抛出 StructuredOutputError，错误信息可直接用于重新询问
+    """
+    if isinstance(schema, str):
+        schema = SCHEMAS[schema]
+
+    candidate = extract_json_text(text)
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(candidate))
+            logger.info("本地修复 JSON 输出成功")
+        except json.JSONDecodeError as e:
+            raise StructuredOutputError(f"输出不是有效的 JSON: {str(e)}")
+
+    unwrap = schema.get('unwrap')
+    if unwrap and isinstance(data, dict) and isinstance(data.get(unwrap), dict):
+        data = data[unwrap]
+
+    errors = validate(data, schema)
+    if errors:
+        raise StructuredOutputError('；'.join(errors))
+    return data
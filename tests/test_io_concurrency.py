@@ -0,0 +1,35 @@
+"""
+gevent 下 LLM 调用的并发检查：N 个并发的慢 LLM 调用应在约一次调用的延迟内全部完成
+与 `python benchmark.py --io-check` 使用同一个本地 OpenAI 兼容服务；
+monkey patch 必须在导入其他模块之前完成，因此在子进程中运行
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('gevent')
+pytest.importorskip('openai')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CALLS = 10
+LATENCY = 0.5
+
+
+def test_concurrent_llm_calls_finish_in_about_one_latency(tmp_path):
+    script = f"import json, benchmark; print(json.dumps(benchmark.measure_io_concurrency({CALLS}, {LATENCY})))"
+    env = {**os.environ, 'GEVENT_MONKEY_PATCH': '1', 'SQLITE_PATH': str(tmp_path / 'io.db')}
+    completed = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert completed.returncode == 0, completed.stderr
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    assert result['failed'] == 0
+    # 串行执行需要 CALLS * LATENCY 秒，并发时应接近一次调用的延迟
+    assert result['elapsed'] < LATENCY * 2
+    assert result['max_stall'] < LATENCY / 2
@@ -0,0 +1,316 @@
+"""
+中文时间表达解析模块
+基于规则解析常见的相对/绝对日期和时间表达（今天/明天/后天、本周/下周X、上午/下午/晚上、时长等），
+作为 _extract_time_preference 调用 LLM 之前的快速路径
+"""
+import re
+from datetime import datetime, timedelta
+
+# 中文数字
+CHINESE_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9
+}
+
+# 相对日期
+RELATIVE_DAYS = {'今天': 0, '今日': 0, '明天': 1, '明日': 1, '后天': 2, '大后天': 3}
+
+# 星期
+WEEKDAYS = {'一': 0, '二': 1, '三': 2, '四': 3, '五': 4, '六': 5, '日': 6, '天': 6, '末': 5}
+
+# 时段及其默认起始小时
+PERIODS = {
+    '凌晨': 5, '早上': 9, '早晨': 9, '上午': 9, '中午': 12,
+    '下午': 14, '傍晚': 17, '晚上': 19, '今晚': 19, '明晚': 19, '夜里': 21
+}
+
+# 晚上的时段，其中的“12点”指次日 0 点
+EVENING_PERIODS = ('傍晚', '晚上', '今晚', '明晚', '夜里')
+
+# 包含这些词的回复往往带有条件或拒绝，交给 LLM 理解
+UNCERTAIN_WORDS = (
+    '不行', '没空', '不方便', '不可以', '不能', '冲突', '但是', '不过', '除非', '如果', '或者', '还是',
+    '没时间', '来不了', '去不了', '不太', '恐怕', '有会', '有事', '出差', '请假', '没法', '无法', '赶不上', '排满'
+)
+
+# 否定词：回复中出现时可能是在拒绝这个时间，交给 LLM 判断
+_NEGATION_RE = re.compile('[没不无未别]')
+
+_NUM = r'[0-9零〇一二两三四五六七八九十]+'
+
+_RELATIVE_DAY_RE = re.compile('|'.join(sorted(RELATIVE_DAYS, key=len, reverse=True)))
+_WEEKDAY_RE = re.compile(r'(下下|下|本|这|这个|下个)?(?:周|星期|礼拜)([一二三四五六日天末])')
+_DATE_RE = re.compile(rf'(?:({_NUM})月)?({_NUM})[日号]')
+_PERIOD_RE = re.compile('|'.join(PERIODS))
+# 时刻不能从“周/星期/礼拜”后的星期字符开始，否则“周五10点”会把“五10”当成小时
+_CLOCK_RE = re.compile(rf'(?<![周期拜])({_NUM})(?:[:：]([0-9]{{2}})|[点时](?:(半|一刻|三刻)|({_NUM})分?)?)')
+# 两个时刻之间的区间分隔符，后面可以带结束时刻的时段（“上午10点到下午2点”）
+_RANGE_SEP_RE = re.compile(r'\s*(?:到|至|-|~|—|－)\s*(?P<period>' + '|'.join(PERIODS) + r')?\s*$')
+_DURATION_RE = re.compile(rf'(?:({_NUM})个?(半)?小时|(半)个?小时|({_NUM})分钟)')
+_FLEXIBLE_RE = re.compile(r'都行|都可以|随便|左右|大概|之后|以后|之前|以前|前后|灵活')
+
+
+def chinese_to_int(text):
+    """把阿拉伯数字或中文数字（最多到九十九）转换为整数"""
+    if text.isdigit():
+        return int(text)
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (CHINESE_DIGITS.get(tens, 1) if tens else 1) * 10 + (CHINESE_DIGITS.get(ones, 0) if ones else 0)
+    value = 0
+    for char in text:
+        if char not in CHINESE_DIGITS:
+            return None
+        value = value * 10 + CHINESE_DIGITS[char]
+    return value
+
+
+def format_duration(minutes):
+    """把分钟数格式化为“1小时”“半小时”“1.5小时”的形式"""
+    if minutes == 30:
+        return '半小时'
+    if minutes % 60 == 0:
+        return f"{minutes // 60}小时"
+    if minutes % 30 == 0:
+        return f"{minutes / 60:g}小时"
+    return f"{minutes}分钟"
+
+
+def _parse_day(text, now):
+    """解析日期，返回 (日期, 描述, 匹配区间)"""
+    match = _RELATIVE_DAY_RE.search(text)
+    if match:
+        return now.date() + timedelta(days=RELATIVE_DAYS[match.group()]), match.group(), match.span()
+
+    match = _WEEKDAY_RE.search(text)
+    if match:
+        prefix, day_char = match.groups()
+        weekday = WEEKDAYS[day_char]
+        monday = now.date() - timedelta(days=now.weekday())
+        if prefix in ('下', '下个'):
+            target = monday + timedelta(days=7 + weekday)
+        elif prefix == '下下':
+            target = monday + timedelta(days=14 + weekday)
+        elif prefix:
+            target = monday + timedelta(days=weekday)
+        else:
+            # 只说“周五”时取最近的一个周五
+            target = monday + timedelta(days=weekday)
+            if target < now.date():
+                target += timedelta(days=7)
+        return target, match.group(), match.span()
+
+    match = _DATE_RE.search(text)
+    if match:
+        month = chinese_to_int(match.group(1)) if match.group(1) else now.month
+        day = chinese_to_int(match.group(2))
+        try:
+            target = datetime(now.year, month, day).date()
+        except (TypeError, ValueError):
+            return None, None, None
+        if target < now.date() and not match.group(1):
+            # 只说“5号”且已过去时指下个月
+            month = month % 12 + 1
+            year = now.year + (1 if month == 1 else 0)
+            try:
+                target = datetime(year, month, day).date()
+            except ValueError:
+                return None, None, None
+        return target, match.group(), match.span()
+
+    return None, None, None
+
+
+def _parse_clocks(text):
+    """解析文本中的时刻，返回 [(小时, 分钟, 匹配区间)]"""
+    clocks = []
+    for match in _CLOCK_RE.finditer(text):
+        hour = chinese_to_int(match.group(1))
+        if hour is None or hour > 24:
+            continue
+        if match.group(2):
+            minute = int(match.group(2))
+        elif match.group(3):
+            minute = {'半': 30, '一刻': 15, '三刻': 45}[match.group(3)]
+        elif match.group(4):
+            minute = chinese_to_int(match.group(4)) or 0
+        else:
+            minute = 0
+        if minute >= 60:
+            continue
+        clocks.append((hour, minute, match.span()))
+    return clocks
+
+
+def _apply_period(hour, period):
+    """根据上午/下午等时段把 12 小时制转换为 24 小时制，晚上 12 点返回 24（次日 0 点）"""
+    if period in EVENING_PERIODS and hour == 12:
+        return 24
+    if (period == '下午' or period in EVENING_PERIODS) and hour < 12:
+        return hour + 12
+    if period == '中午' and hour < 6:
+        return hour + 12
+    if period is None and 1 <= hour <= 6:
+        # 工作场景下没有说明时段的“三点”通常指下午
+        return hour + 12
+    return hour
+
+
+def parse_time_expression(text, now=None):
+    """
+    解析中文时间表达
+    返回与 LLM 提取结果相同结构的字典（附带 start_time/end_time 和 confidence），无法解析时返回 None
+    """
+    now = now or datetime.now()
+    text = text.strip()
+    if not text:
+        return None
+
+    day, day_label, _ = _parse_day(text, now)
+    period_matches = list(_PERIOD_RE.finditer(text))
+    period = period_matches[0].group() if period_matches else None
+    clocks = _parse_clocks(text)
+
+    if day is None and period is None and not clocks:
+        return None
+
+    # 时长
+    duration_minutes = parse_duration(text, default=None)
+
+    # 起止时间
+    start = end = None
+    base_day = day or now.date()
+    midnight = datetime.combine(base_day, datetime.min.time())
+    if clocks:
+        hour, minute, _ = clocks[0]
+        # 开始时刻使用它前面最近的时段，区间后半段的时段只作用于结束时刻
+        start_periods = [match.group() for match in period_matches if match.end() <= clocks[0][2][0]]
+        start = midnight + timedelta(hours=_apply_period(hour, start_periods[-1] if start_periods else None), minutes=minute)
+        separator = _RANGE_SEP_RE.search(text[clocks[0][2][1]:clocks[1][2][0]]) if len(clocks) > 1 else None
+        if separator:
+            end_hour, end_minute, _ = clocks[1]
+            if separator.group('period'):
+                end = midnight + timedelta(hours=_apply_period(end_hour, separator.group('period')), minutes=end_minute)
+            else:
+                end = midnight + timedelta(hours=end_hour % 24, minutes=end_minute)
+                if end <= start and end_hour < 12:
+                    end += timedelta(hours=12)
+            if end > start and duration_minutes is None:
+                duration_minutes = int((end - start).total_seconds() // 60)
+    elif period:
+        start = midnight + timedelta(hours=PERIODS[period])
+
+    if start is not None and end is None:
+        end = start + timedelta(minutes=duration_minutes or 60)
+
+    # 置信度：日期和具体时刻都明确时最高，含条件或否定词时交给 LLM
+    confidence = 0.0
+    if day is not None:
+        confidence += 0.45
+    if clocks:
+        confidence += 0.45
+    elif period:
+        confidence += 0.3
+    if duration_minutes:
+        confidence += 0.05
+    if any(word in text for word in UNCERTAIN_WORDS) or _NEGATION_RE.search(text):
+        confidence = min(confidence, 0.3)
+
+    time_label = f"{day_label or ''}{period or ''}" or '今天'
+    specific_time = None
+    if clocks:
+        specific_time = start.strftime('%H:%M')
+        if len(clocks) > 1 and end is not None:
+            specific_time += f"-{end.strftime('%H:%M')}"
+
+    result = {
+        'time': time_label,
+        'flexibility': 'flexible' if (_FLEXIBLE_RE.search(text) or not clocks) else 'strict',
+        'duration': format_duration(duration_minutes) if duration_minutes else '1小时',
+        'confidence': round(min(confidence, 1.0), 2)
+    }
+    if specific_time:
+        result['specific_time'] = specific_time
+    if start is not None:
+        result['start_time'] = start.isoformat()
+        result['end_time'] = end.isoformat()
+    return result
+
+
+def parse_duration(text, default=60):
+    """解析“1小时”“半小时”“90分钟”等时长，返回分钟数"""
+    match = _DURATION_RE.search(text or '')
+    if not match:
+        return default
+    hours, half, only_half, minutes = match.groups()
+    if minutes:
+        return chinese_to_int(minutes) or default
+    if only_half:
+        return 30
+    return (chinese_to_int(hours) or 0) * 60 + (30 if half else 0) or default
+
+
+def resolve_time_range(text, now=None):
+    """把“本周”“下周”“明天”等时间范围解析为 (开始, 结束)，无法识别时返回未来 7 天"""
+    now = now or datetime.now()
+    text = text or ''
+    today = datetime.combine(now.date(), datetime.min.time())
+    monday = today - timedelta(days=now.weekday())
+
+    if '下下周' in text:
+        return monday + timedelta(days=14), monday + timedelta(days=21)
+    if '下周' in text or '下星期' in text:
+        return monday + timedelta(days=7), monday + timedelta(days=14)
+    if '本周' in text or '这周' in text or '这星期' in text:
+        return now, monday + timedelta(days=7)
+    if '本月' in text or '这个月' in text:
+        next_month = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return now, next_month
+
+    day, _, _ = _parse_day(text, now)
+    if day is not None:
+        start = datetime.combine(day, datetime.min.time())
+        return max(start, now), start + timedelta(days=1)
+    return now, today + timedelta(days=8)
+
+
+# 解析检查：python time_parser.py，每项为 (输入, 期望的 time, 期望的 specific_time)
+PARSER_CHECKS = (
+    ('明天下午三点', '明天下午', '15:00'),
+    ('下周二上午10点到11点', '下周二上午', '10:00-11:00'),
+    ('周五10点', '周五', '10:00'),
+    ('周三3点', '周三', '15:00'),
+    ('周五14点', '周五', '14:00'),
+    ('星期四下午两点半', '星期四下午', '14:30'),
+    ('明天上午10点到下午2点', '明天上午', '10:00-14:00'),
+    ('明天下午3点到晚上8点', '明天下午', '15:00-20:00'),
+    ('明天晚上12点', '明天晚上', '00:00'),
+)
+
+# 拒绝或带条件的回复，置信度必须低于快速路径的阈值
+DECLINE_CHECKS = (
+    '周五下午三点我没时间',
+    '周五下午三点不太行',
+    '明天下午三点恐怕来不了',
+    '周五下午三点有会',
+    '明天下午三点我在出差',
+)
+
+
+if __name__ == '__main__':
+    failures = 0
+    for text, expected_time, expected_clock in PARSER_CHECKS:
+        result = parse_time_expression(text) or {}
+        ok = (
+            result.get('time') == expected_time
+            and result.get('specific_time') == expected_clock
+            and result.get('confidence', 0) >= 0.75
+        )
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {text} -> {result}")
+    for text in DECLINE_CHECKS:
+        result = parse_time_expression(text) or {}
+        ok = result.get('confidence', 0) < 0.75
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {text} -> confidence {result.get('confidence')}")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,369 @@
+"""
+用户目录模块
+按用户ID、姓名、别名建立哈希索引，姓名查找为常数时间；
+LLM 输出的称呼（如"张总"、"小李"、"张三经理"）通过称谓表匹配，
+错别字和同音字通过拼音索引和编辑距离为 1 的删除变体索引匹配；
+在整段文本中查找提到的用户时使用 Aho-Corasick 自动机，一次扫描匹配所有姓名、别名和称谓；
+用户增删改时增量更新索引，对外保持与原来的用户字典相同的用法
+"""
+import logging
+import re
+import threading
+import unicodedata
+from collections import deque
+from collections.abc import MutableMapping
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时跳过拼音匹配
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+# 复姓，用于从姓名中拆出姓氏
+COMPOUND_SURNAMES = (
+    '欧阳', '司马', '诸葛', '上官', '东方', '皇甫', '尉迟', '公孙', '慕容', '长孙',
+    '宇文', '司徒', '令狐', '夏侯', '轩辕', '端木', '独孤', '南宫', '西门', '澹台'
+)
+
+# 姓氏 + 称谓，如"张总"、"李经理"
+TITLE_SUFFIXES = (
+    '总经理', '总监', '经理', '主管', '主任', '部长', '组长', '老师', '教授', '博士',
+    '总', '工', '哥', '姐', '老板', '同学', '先生', '女士', '小姐'
+)
+
+# 称谓 + 姓氏，如"小李"、"老王"
+TITLE_PREFIXES = ('小', '老', '阿')
+
+# 中文姓名至少这么长才做编辑距离匹配，两个字的名字改一个字就是另一个人
+MIN_FUZZY_NAME_LENGTH = 3
+
+_PUNCTUATION = re.compile(r'[\s@＠·•.,，。:：;；!！?？"\'“”‘’()（）\[\]【】<>《》]+')
+_PARENTHESES = re.compile(r'[（(][^）)]*[）)]')
+
+
+def normalize_name(name):
+    """统一全角/半角、去掉括号中的备注、空白和标点"""
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKC', str(name))
+    text = _PARENTHESES.sub('', text)
+    return _PUNCTUATION.sub('', text).lower()
+
+
+def split_surname(name):
+    """返回 (姓, 名)，非中文姓名返回 (None, None)"""
+    if not name or not all('一' <= char <= '鿿' for char in name) or len(name) < 2:
+        return None, None
+    for surname in COMPOUND_SURNAMES:
+        if name.startswith(surname) and len(name) > len(surname):
+            return surname, name[len(surname):]
+    return name[0], name[1:]
+
+
+def to_pinyin(text):
+    """不带声调的拼音，未安装 pypinyin 时返回 None"""
+    if lazy_pinyin is None or not text:
+        return None
+    return ''.join(lazy_pinyin(text)).lower()
+
+
+def deletion_variants(text):
+    """删除一个字符得到的所有变体，两个字符串编辑距离不超过 1 时它们的变体集合必然相交"""
+    return {text[:position] + text[position + 1:] for position in range(len(text))}
+
+
+def within_one_edit(first, second):
+    """两个字符串的编辑距离是否不超过 1"""
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    for position, (a, b) in enumerate(zip(first, second)):
+        if a != b:
+            if len(first) == len(second):
+                return first[position + 1:] == second[position + 1:]
+            return first[position:] == second[position + 1:]
+    return True
+
+
+def title_aliases(name):
+    """根据姓名生成称谓别名"""
+    surname, given = split_surname(name)
+    if not surname:
+        return set()
+    aliases = {surname + suffix for suffix in TITLE_SUFFIXES}
+    aliases |= {prefix + surname for prefix in TITLE_PREFIXES}
+    if len(given) >= 2:
+        # 两个字的名字常单独用作称呼
+        aliases.add(given)
+    return aliases
+
+
+def _is_ascii_word(text):
+    return text.isascii() and text.isalnum()
+
+
+class AhoCorasick:
+    """多模式匹配自动机：构建后一次扫描即可找出文本中出现的所有模式，耗时与文本长度和匹配数成正比"""
+    def __init__(self, patterns):
+        """patterns 为 {模式: 附带的值}"""
+        self._goto = [{}]  # 状态 -> {字符: 下一状态}
+        self._fail = [0]
+        self._output = [[]]  # 状态 -> [(模式, 值)]，包含失败链上的后缀模式
+        for pattern, payload in patterns.items():
+            if pattern:
+                self._insert(pattern, payload)
+        self._build()
+
+    def _insert(self, pattern, payload):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((pattern, payload))
+
+    def _build(self):
+        """按广度优先计算失败指针，并把失败链上的输出合并到当前状态"""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text):
+        """返回所有匹配 [(起始位置, 结束位置, 模式, 值)]"""
+        matches = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern, payload in self._output[state]:
+                matches.append((position + 1 - len(pattern), position + 1, pattern, payload))
+        return matches
+
+
+class _Index:
+    """键 -> 用户ID集合的哈希索引"""
+    def __init__(self):
+        self._entries = {}
+
+    def add(self, key, user_id):
+        if key:
+            self._entries.setdefault(key, set()).add(user_id)
+
+    def remove(self, key, user_id):
+        ids = self._entries.get(key)
+        if ids is not None:
+            ids.discard(user_id)
+            if not ids:
+                del self._entries[key]
+
+    def get(self, key):
+        return self._entries.get(key, ())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class UserDirectory(MutableMapping):
+    """
+    用户ID -> 用户信息的字典，写入和删除时增量维护姓名、别名、拼音和编辑距离索引
+    修改已有用户的姓名或别名需要重新赋值整个用户信息，原地修改不会更新索引
+    """
+    def __init__(self, users=None):
+        self._users = {}
+        self._keys = {}  # 用户ID -> [(索引, 键)]，删除时用于撤销索引
+        self._names = _Index()  # 规范化姓名（含用户ID）
+        self._aliases = _Index()  # 显式别名
+        self._titles = _Index()  # 称谓别名，同姓的人可能重复
+        self._pinyin = _Index()  # 姓名拼音
+        self._fuzzy = _Index()  # 姓名及拼音的删除变体
+        self._fuzzy_texts = {}  # 用户ID -> 参与编辑距离匹配的文本，用于校验候选
+        self._automaton = None  # 文本提及匹配的自动机，用户变化后在下次查找时重建
+        self._lock = threading.RLock()
+        self.stats = {'lookups': 0, 'exact': 0, 'alias': 0, 'title': 0, 'pinyin': 0, 'fuzzy': 0, 'ambiguous': 0, 'missed': 0}
+        for user_id, user in (users or {}).items():
+            self[user_id] = user
+
+    # ---------- 字典接口 ----------
+
+    def __getitem__(self, user_id):
+        return self._users[user_id]
+
+    def __setitem__(self, user_id, user):
+        with self._lock:
+            if user_id in self._users:
+                self._unindex(user_id)
+            self._users[user_id] = user
+            self._index(user_id, user)
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            del self._users[user_id]
+            self._unindex(user_id)
+
+    def __iter__(self):
+        return iter(list(self._users))
+
+    def __len__(self):
+        return len(self._users)
+
+    # ---------- 索引维护 ----------
+
+    def _index(self, user_id, user):
+        name = normalize_name(user.get('name'))
+        keys = [(self._names, name), (self._names, normalize_name(user_id))]
+        keys += [(self._aliases, normalize_name(alias)) for alias in user.get('aliases', [])]
+        keys += [(self._titles, alias) for alias in title_aliases(name)]
+
+        pinyin = to_pinyin(name)
+        if pinyin:
+            keys.append((self._pinyin, pinyin))
+        fuzzy_texts = [text for text in (name, pinyin) if text and len(text) >= MIN_FUZZY_NAME_LENGTH]
+        for text in fuzzy_texts:
+            keys.append((self._fuzzy, text))
+            keys += [(self._fuzzy, variant) for variant in deletion_variants(text)]
+
+        for index, key in keys:
+            index.add(key, user_id)
+        self._keys[user_id] = keys
+        self._fuzzy_texts[user_id] = fuzzy_texts
+        self._automaton = None
+
+    def _unindex(self, user_id):
+        for index, key in self._keys.pop(user_id, []):
+            index.remove(key, user_id)
+        self._fuzzy_texts.pop(user_id, None)
+        self._automaton = None
+
+    def _mention_automaton(self):
+        """
+        以姓名、用户ID、显式别名和称谓别名为模式构建自动机；
+        单独的名字（如"明日"）容易和普通词语混淆，不参与文本匹配
+        """
+        if self._automaton is None:
+            patterns = {}
+            for user_id, keys in self._keys.items():
+                _, given = split_surname(normalize_name(self._users[user_id].get('name')))
+                for index, key in keys:
+                    if index in (self._names, self._aliases) or (index is self._titles and key != given):
+                        patterns.setdefault(key, set()).add(user_id)
+            self._automaton = AhoCorasick({key: frozenset(ids) for key, ids in patterns.items()})
+        return self._automaton
+
+    def add_alias(self, alias, user_id):
+        """为已有用户增加别名（如英文名、花名）"""
+        with self._lock:
+            if user_id not in self._users:
+                raise KeyError(user_id)
+            user = dict(self._users[user_id])
+            user['aliases'] = list(user.get('aliases', [])) + [alias]
+            self[user_id] = user
+
+    # ---------- 查找 ----------
+
+    def _unique(self, ids, stage):
+        """只有唯一匹配时才返回，同名或同称谓的多个用户视为无法确定"""
+        if len(ids) == 1:
+            self.stats[stage] += 1
+            return next(iter(ids))
+        if len(ids) > 1:
+            self.stats['ambiguous'] += 1
+        return None
+
+    def resolve(self, name):
+        """
+        把姓名、ID 或称呼解析为用户ID，无法唯一确定时返回 None
+        依次尝试：精确姓名/ID、别名、去掉称谓后的姓名、称谓别名、拼音、编辑距离 1 的姓名或拼音
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        with self._lock:
+            self.stats['lookups'] += 1
+            stages = [('exact', self._names.get(key)), ('alias', self._aliases.get(key))]
+            for suffix in TITLE_SUFFIXES:
+                # "张三经理" -> "张三"
+                if key.endswith(suffix) and len(key) > len(suffix):
+                    stages.append(('title', self._names.get(key[:-len(suffix)])))
+                    break
+            stages.append(('title', self._titles.get(key)))
+
+            pinyin = to_pinyin(key)
+            if pinyin:
+                stages.append(('pinyin', self._pinyin.get(pinyin)))
+            for stage, ids in stages:
+                if ids:
+                    return self._unique(ids, stage)
+
+            for text in (key, pinyin):
+                if not text or len(text) < MIN_FUZZY_NAME_LENGTH:
+                    continue
+                candidates = set(self._fuzzy.get(text))
+                for variant in deletion_variants(text):
+                    candidates.update(self._fuzzy.get(variant))
+                # 变体相交的候选编辑距离可能为 2，逐个校验
+                matches = {
+                    user_id for user_id in candidates
+                    if any(within_one_edit(text, indexed) for indexed in self._fuzzy_texts.get(user_id, ()))
+                }
+                if matches:
+                    return self._unique(matches, 'fuzzy')
+
+            self.stats['missed'] += 1
+            return None
+
+    def find_mentions(self, text):
+        """
+        找出文本中提到的用户，重叠的匹配只保留最靠前、最长的一个
+        返回 [(起始位置, 结束位置, 匹配文本, 用户ID集合)]，集合中有多个用户表示称呼无法确定是谁
+        """
+        text = unicodedata.normalize('NFKC', text or '').lower()
+        with self._lock:
+            matches = self._mention_automaton().search(text)
+        mentions = []
+        end_of_last = 0
+        for start, end, pattern, ids in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+            if start < end_of_last:
+                continue
+            if _is_ascii_word(pattern) and (
+                (start > 0 and _is_ascii_word(text[start - 1])) or (end < len(text) and _is_ascii_word(text[end]))
+            ):
+                # 英文别名和用户ID只匹配完整的单词
+                continue
+            mentions.append((start, end, pattern, set(ids)))
+            end_of_last = end
+        return mentions
+
+    def find_user(self, name):
+        """返回匹配的用户信息"""
+        user_id = self.resolve(name)
+        return self._users.get(user_id) if user_id else None
+
+    def index_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                'users': len(self._users),
+                'pinyin_enabled': lazy_pinyin is not None,
+                'index_sizes': {
+                    'names': len(self._names),
+                    'aliases': len(self._aliases),
+                    'titles': len(self._titles),
+                    'pinyin': len(self._pinyin),
+                    'fuzzy': len(self._fuzzy)
+                }
+            }